@@ -0,0 +1,124 @@
+"""
+SQL-side aggregation for the summary endpoints.
+
+Counts are read from the hourly rollups (raw GROUP BY only for the partial
+hours at the window edges) so the routers never materialize the events
+table; time-to-analysis comes from the per-entity progress table.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Event
+from app import archive, rollups, progress
+from app.analytics import (
+    FUNNEL,
+    QUALITY_EVENTS,
+    Summary,
+    bucket_series,
+)
+from app.sketches import SKETCH_EXACT_MAX, HyperLogLog, distinct_result
+
+
+def _window(q, since: Optional[datetime], until: Optional[datetime]):
+    if since:
+        q = q.filter(Event.timestamp >= since)
+    if until:
+        q = q.filter(Event.timestamp <= until)
+    return q
+
+
+def event_type_counts(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, int]:
+    return rollups.event_type_counts(db, since, until)
+
+
+def quality_issue_counts(
+    db: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    counts: Optional[Dict[str, int]] = None,
+) -> Dict[str, int]:
+    # same ordering as Counter.most_common() over time-ordered events:
+    # highest count first, ties broken by first occurrence
+    if counts is None:
+        counts = event_type_counts(db, since, until)
+    quality = {t: n for t, n in counts.items() if t in QUALITY_EVENTS and n}
+
+    if len(set(quality.values())) < len(quality):
+        q = _window(db.query(Event.event_type, func.min(Event.timestamp)), since, until)
+        first = dict(q.filter(Event.event_type.in_(list(quality))).group_by(Event.event_type).all())
+        for t, ts in archive.first_seen(db, quality, since, until).items():
+            first[t] = min(first.get(t, ts), ts)
+    else:
+        first = {}
+    ordered = sorted(quality.items(), key=lambda x: (-x[1], first.get(x[0]) or datetime.min))
+    return dict(ordered)
+
+
+def time_to_analysis(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+    return progress.time_to_analysis(db, since, until)
+
+
+def distinct_entities(
+    db: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    counts: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """
+    Distinct entity_ids per funnel step. Exact COUNT(DISTINCT) while the window
+    holds at most SKETCH_EXACT_MAX funnel events (the same rule as
+    DistinctCounter), otherwise HyperLogLog registers filled by a GROUP BY.
+    """
+    if counts is None:
+        counts = event_type_counts(db, since, until)
+    q = _window(db.query(Event.event_type), since, until).filter(Event.event_type.in_(FUNNEL))
+    cold = archive.segments(db, since, until)
+    if sum(counts.get(t, 0) for t in FUNNEL) <= SKETCH_EXACT_MAX:
+        if not cold:
+            rows = q.add_columns(func.count(Event.entity_id.distinct())).group_by(Event.event_type).all()
+            return distinct_result(dict(rows), False, FUNNEL)
+        # archived rows too: the ids themselves, few enough to union in Python
+        seen: Dict[str, set] = {}
+        for t, entity_id in q.add_columns(Event.entity_id).distinct():
+            seen.setdefault(t, set()).add(entity_id)
+        for t, entity_id in archive.entity_ids(db, FUNNEL, since, until):
+            seen.setdefault(t, set()).add(entity_id)
+        return distinct_result({t: len(ids) for t, ids in seen.items()}, False, FUNNEL)
+
+    slot = func.hll_slot(Event.entity_id)
+    register = slot.op(">>")(6)
+    q = q.add_columns(register, func.max(slot.op("&")(63))).group_by(Event.event_type, register)
+    hlls: Dict[str, HyperLogLog] = {}
+    for t, j, rank in q:
+        hlls.setdefault(t, HyperLogLog()).registers[j] = rank
+    if cold:
+        for t, entity_id in archive.entity_ids(db, FUNNEL, since, until):
+            hlls.setdefault(t, HyperLogLog()).add(entity_id)
+    return distinct_result({t: h.count() for t, h in hlls.items()}, True, FUNNEL)
+
+
+def summary(
+    db: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    distinct: bool = False,
+) -> Summary:
+    counts = event_type_counts(db, since, until)
+    return Summary.from_counts(
+        counts,
+        quality_issue_counts(db, since, until, counts=counts),
+        time_to_analysis(db, since, until),
+        distinct_entities=distinct_entities(db, since, until, counts) if distinct else None,
+    )
+
+
+def timeseries(db: Session, bucket: str, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Per hour/day bucket metrics: grouped rollup counts plus one grouped time-to-analysis query."""
+    return bucket_series(
+        rollups.bucketed_counts(db, bucket, since, until),
+        progress.time_to_analysis_by_bucket(db, bucket, since, until),
+        bucket, since, until,
+    )
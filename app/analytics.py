@@ -1,7 +1,13 @@
 ﻿from __future__ import annotations
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterable, Optional, Tuple, Union
 from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import numpy as np
+from app.batches import EventBatch
+from app.perf import timed
 from app.schemas import AnalyticsEvent
+from app.sketches import QUANTILES, SKETCH_EXACT_MAX, DeltaStats, DistinctCounter, distinct_result
 
 FUNNEL = [
     "data_upload_started",
@@ -12,6 +18,9 @@ FUNNEL = [
 
 QUALITY_EVENTS = {"missing_required_field", "out_of_range_value_detected"}
 
+# the event-list functions below also take a batches.EventBatch
+Events = Union[List[AnalyticsEvent], EventBatch]
+
 def explainable_insights(events):
     ins = []
 
@@ -22,19 +31,38 @@ def explainable_insights(events):
             "evidence": {"total_events": 0},
         }]
 
-def _count(events: List[AnalyticsEvent], t: str) -> int:
+def _count(events: Events, t: str) -> int:
+    if isinstance(events, EventBatch):
+        return int(np.count_nonzero(events.event_type == events.code(t)))
     return sum(1 for e in events if e.event_type == t)
 
-def success_rate(events: List[AnalyticsEvent]) -> float:
-    started = _count(events, "data_upload_started")
-    completed = _count(events, "data_upload_completed")
-    return (completed / started) if started else 0.0
+@timed
+def success_rate(events: Events) -> float:
+    return success_rate_from_counts({
+        "data_upload_started": _count(events, "data_upload_started"),
+        "data_upload_completed": _count(events, "data_upload_completed"),
+    })
 
-def funnel_counts(events: List[AnalyticsEvent]) -> Dict[str, int]:
+@timed
+def funnel_counts(events: Events) -> Dict[str, int]:
     return {step: _count(events, step) for step in FUNNEL}
 
-def dropoff(events: List[AnalyticsEvent]) -> Dict[str, Any]:
-    counts = funnel_counts(events)
+@timed
+def dropoff(events: Events) -> Dict[str, Any]:
+    return dropoff_from_counts(funnel_counts(events))
+
+# --- metrics from pre-aggregated counts (event_type -> count) ---
+
+def success_rate_from_counts(counts: Dict[str, int]) -> float:
+    started = counts.get("data_upload_started", 0)
+    completed = counts.get("data_upload_completed", 0)
+    return (completed / started) if started else 0.0
+
+def funnel_from_counts(counts: Dict[str, int]) -> Dict[str, int]:
+    return {step: counts.get(step, 0) for step in FUNNEL}
+
+def dropoff_from_counts(counts: Dict[str, int]) -> Dict[str, Any]:
+    counts = funnel_from_counts(counts)
     drops = []
     prev = None
     for step in FUNNEL:
@@ -49,37 +77,84 @@ def dropoff(events: List[AnalyticsEvent]) -> Dict[str, Any]:
         prev = step
     return {"counts": counts, "drops": drops}
 
-def top_quality_issues(events: List[AnalyticsEvent]) -> Dict[str, int]:
+@timed
+def top_quality_issues(events: Events) -> Dict[str, int]:
+    if isinstance(events, EventBatch):
+        quality = [(t, n) for t, n in events.counts().items() if t in QUALITY_EVENTS]
+        return dict(sorted(quality, key=lambda x: x[1], reverse=True))
     c = Counter(e.event_type for e in events if e.event_type in QUALITY_EVENTS)
     return dict(c.most_common())
 
-def time_to_analysis_minutes(events: List[AnalyticsEvent]) -> Dict[str, Any]:
+@timed
+def time_to_analysis_minutes(events: Events) -> Dict[str, Any]:
+    if isinstance(events, EventBatch):
+        return time_to_analysis_from_stats(PartialSummary().add_batch(events).tta)
+    return _tta_stats(_tta_deltas(sorted(events, key=lambda x: x.timestamp)))
+
+_US_PER_MINUTE = 60_000_000
+
+def _tta_deltas(ordered: Iterable[AnalyticsEvent]) -> List[int]:
+    # expects events in time order; other event types are ignored.
+    # deltas are whole microseconds so partial totals combine exactly.
+    return [dt for _, dt in _tta_pairs(ordered)]
+
+def _tta_pairs(ordered: Iterable[AnalyticsEvent]) -> List[Tuple[datetime, int]]:
+    # (analysis_completed timestamp, delta) for each upload -> analysis pair
     completed_at = {}
-    deltas = []
-    for e in sorted(events, key=lambda x: x.timestamp):
+    pairs = []
+    for e in ordered:
         if e.event_type == "data_upload_completed":
             completed_at[e.entity_id] = e.timestamp
         elif e.event_type == "analysis_completed" and e.entity_id in completed_at:
-            dt = (e.timestamp - completed_at[e.entity_id]).total_seconds() / 60.0
+            dt = (e.timestamp - completed_at[e.entity_id]) // timedelta(microseconds=1)
             if dt >= 0:
-                deltas.append(dt)
+                pairs.append((e.timestamp, dt))
+    return pairs
+
+def _tta_stats(deltas: List[int], exact: Optional[bool] = None) -> Dict[str, Any]:
+    # exact unless the window has more than SKETCH_EXACT_MAX pairs
+    if exact is None:
+        exact = len(deltas) <= SKETCH_EXACT_MAX
+    return time_to_analysis_from_stats(DeltaStats(exact).extend(deltas))
+
+def time_to_analysis_from_stats(stats: DeltaStats) -> Dict[str, Any]:
+    return time_to_analysis_from_totals(
+        stats.count, stats.total, stats.min, stats.max, stats.quantiles(), not stats.exact
+    )
 
-    if not deltas:
-        return {"count": 0, "avg": None, "min": None, "max": None}
+def time_to_analysis_from_totals(
+    count: int,
+    total: Optional[int],
+    mn: Optional[int],
+    mx: Optional[int],
+    quantiles: Dict[str, Optional[float]],
+    approximate: bool = False,
+) -> Dict[str, Any]:
+    # microsecond totals and percentiles (None if not computed) -> the minutes dict
+    if not count:
+        return {"count": 0, "avg": None, "min": None, "max": None, **{q: None for q in QUANTILES}, "approximate": False}
 
     return {
-        "count": len(deltas),
-        "avg": sum(deltas) / len(deltas),
-        "min": min(deltas),
-        "max": max(deltas),
+        "count": count,
+        "avg": total / (count * _US_PER_MINUTE),
+        "min": mn / _US_PER_MINUTE,
+        "max": mx / _US_PER_MINUTE,
+        **{q: None if quantiles.get(q) is None else quantiles[q] / _US_PER_MINUTE for q in QUANTILES},
+        "approximate": approximate,
     }
 
-def explainable_insights(events: List[AnalyticsEvent]) -> List[Dict[str, Any]]:
+@timed
+def explainable_insights(events: Events) -> List[Dict[str, Any]]:
+    return summarize(events).insights
+
+@timed
+def insights_from_metrics(
+    sr: float,
+    q: Dict[str, int],
+    dr: Dict[str, Any],
+    tta: Dict[str, Any],
+) -> List[Dict[str, Any]]:
     ins: List[Dict[str, Any]] = []
-    sr = success_rate(events)
-    q = top_quality_issues(events)
-    dr = dropoff(events)
-    tta = time_to_analysis_minutes(events)
 
     if sr < 0.8:
         ins.append({
@@ -127,3 +202,354 @@ def explainable_insights(events: List[AnalyticsEvent]) -> List[Dict[str, Any]]:
         })
 
     return ins
+
+
+# --- fused engine: every summary metric from a single pass ---
+
+@dataclass
+class Summary:
+    """All summary metrics for one window; built once, read by routers and insights."""
+    counts: Dict[str, int]
+    quality_issues: Dict[str, int]
+    time_to_analysis_minutes: Dict[str, Any]
+    total_events: int = 0
+    success_rate: float = 0.0
+    funnel: Dict[str, int] = field(default_factory=dict)
+    dropoff: Dict[str, Any] = field(default_factory=dict)
+    insights: List[Dict[str, Any]] = field(default_factory=list)
+    # distinct entities per funnel step, only when asked for (it reads every funnel event)
+    distinct_entities: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_counts(
+        cls,
+        counts: Dict[str, int],
+        quality_issues: Dict[str, int],
+        time_to_analysis: Dict[str, Any],
+        distinct_entities: Optional[Dict[str, Any]] = None,
+    ) -> "Summary":
+        sr = success_rate_from_counts(counts)
+        dr = dropoff_from_counts(counts)
+        return cls(
+            counts=counts,
+            quality_issues=quality_issues,
+            time_to_analysis_minutes=time_to_analysis,
+            total_events=sum(counts.values()),
+            success_rate=sr,
+            funnel=funnel_from_counts(counts),
+            dropoff=dr,
+            insights=insights_from_metrics(sr, quality_issues, dr, time_to_analysis),
+            distinct_entities=distinct_entities,
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = {
+            "counts": {"total_events": self.total_events},
+            "success_rate": self.success_rate,
+            "funnel": self.funnel,
+            "dropoff": self.dropoff,
+            "quality_issues": self.quality_issues,
+            "time_to_analysis_minutes": self.time_to_analysis_minutes,
+            "insights": self.insights,
+        }
+        if self.distinct_entities is not None:
+            out["distinct_entities"] = self.distinct_entities
+        return out
+
+@timed
+def summarize(events: Union[Iterable[AnalyticsEvent], EventBatch], ordered: bool = False, distinct: bool = False) -> Summary:
+    if isinstance(events, EventBatch):
+        return PartialSummary(distinct).add_batch(events).summary()
+    counts: Dict[str, int] = {}
+    pairing = []
+    entities = DistinctCounter(FUNNEL) if distinct else None
+    for e in events:
+        t = e.event_type
+        counts[t] = counts.get(t, 0) + 1
+        if t == "data_upload_completed" or t == "analysis_completed":
+            pairing.append(e)
+        if entities is not None and t in _FUNNEL_STEPS:
+            entities.add(t, e.entity_id)
+
+    # counts keeps first-seen order, so the stable sort matches Counter.most_common()
+    quality = sorted(((t, n) for t, n in counts.items() if t in QUALITY_EVENTS), key=lambda x: x[1], reverse=True)
+
+    # sorting just the paired subset gives the same relative order as sorting everything
+    if not ordered:
+        pairing.sort(key=lambda x: x.timestamp)
+
+    return Summary.from_counts(
+        counts, dict(quality), _tta_stats(_tta_deltas(pairing)),
+        distinct_result(entities.counts(), entities.approximate, FUNNEL) if entities is not None else None,
+    )
+
+_FUNNEL_STEPS = frozenset(FUNNEL)
+
+_EPOCH = datetime(1970, 1, 1)
+
+def epoch_us(ts: datetime) -> int:
+    """Microseconds since the epoch of the wall-clock time: any offset is dropped, as when stored."""
+    return (ts.replace(tzinfo=None) - _EPOCH) // timedelta(microseconds=1)
+
+
+class PartialSummary:
+    """
+    Mergeable state behind summarize() for one time-ordered slice of events.
+
+    Partials of consecutive slices merged in time order (earlier.merge(later))
+    give exactly summarize() over the concatenation. An analysis whose upload
+    lies in an earlier slice is kept open until that slice is merged in; the
+    last upload per entity is carried forward for the same reason.
+    """
+
+    def __init__(self, distinct: bool = False):
+        self.counts: Dict[str, int] = {}
+        self.tta = DeltaStats()
+        self.last_upload: Dict[str, int] = {}
+        self.open: List[Tuple[str, int]] = []
+        self.entities = DistinctCounter(FUNNEL) if distinct else None
+
+    def add(self, event_type: str, entity_id: str, us: int) -> None:
+        """One event, in time order; `us` as from epoch_us()."""
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+        if event_type == "data_upload_completed":
+            self.last_upload[entity_id] = us
+        elif event_type == "analysis_completed":
+            up = self.last_upload.get(entity_id)
+            if up is None:
+                self.open.append((entity_id, us))
+            elif us >= up:
+                self._add_delta(us - up)
+        if self.entities is not None and event_type in _FUNNEL_STEPS:
+            self.entities.add(event_type, entity_id)
+
+    def extend(self, ordered: Iterable[AnalyticsEvent]) -> "PartialSummary":
+        for e in ordered:
+            self.add(e.event_type, e.entity_id, epoch_us(e.timestamp))
+        return self
+
+    def add_batch(self, batch: EventBatch) -> "PartialSummary":
+        """A whole batch; the same state as add() for each of its events in order."""
+        for t, n in batch.counts().items():
+            self.counts[t] = self.counts.get(t, 0) + n
+        codes = batch.event_type
+        upload, analysis = batch.code("data_upload_completed"), batch.code("analysis_completed")
+
+        # pair within the batch: group by entity (stable, so still in time order)
+        # and find the latest upload at or before each analysis in its group
+        sub = np.flatnonzero((codes == upload) | (codes == analysis))
+        order = sub[np.argsort(batch.entity[sub], kind="stable")]
+        ent, us, is_up = batch.entity[order], batch.timestamp[order], codes[order] == upload
+        last = np.maximum.accumulate(np.where(is_up, np.arange(len(order)), -1))
+        found = (last >= 0) & (ent[np.maximum(last, 0)] == ent)
+        delta = us - us[np.maximum(last, 0)]
+        paired = ~is_up & found & (delta >= 0)
+        at, deltas = [order[paired]], [delta[paired]]
+
+        # analyses with no upload earlier in the batch: look back at the state so far
+        unpaired = ~is_up & ~found
+        back_at, back = [], []
+        for i, e, u in sorted(zip(order[unpaired].tolist(), ent[unpaired].tolist(), us[unpaired].tolist())):
+            entity_id = batch.entities[e]
+            up = self.last_upload.get(entity_id)
+            if up is None:
+                self.open.append((entity_id, u))
+            elif u >= up:
+                back_at.append(i)
+                back.append(u - up)
+        at.append(np.array(back_at, dtype=np.int64))
+        deltas.append(np.array(back, dtype=np.int64))
+        at, deltas = np.concatenate(at), np.concatenate(deltas)
+        self.tta.extend(deltas[np.argsort(at, kind="stable")].tolist())
+        if self.tta.exact and self.tta.count > SKETCH_EXACT_MAX:
+            self.tta.spill()
+
+        # the last upload per entity carries forward
+        up_ent, up_us = ent[is_up], us[is_up]
+        tail = np.append(up_ent[1:] != up_ent[:-1], True) if len(up_ent) else np.zeros(0, dtype=bool)
+        for e, u in zip(up_ent[tail].tolist(), up_us[tail].tolist()):
+            self.last_upload[batch.entities[e]] = u
+
+        if self.entities is not None:
+            for step in FUNNEL:
+                ents = batch.entity[codes == batch.code(step)]
+                if len(ents):
+                    self.entities.add_many(step, [batch.entities[e] for e in np.unique(ents).tolist()], len(ents))
+        return self
+
+    def _add_delta(self, d: int) -> None:
+        self.tta.add(d)
+        if self.tta.exact and self.tta.count > SKETCH_EXACT_MAX:
+            self.tta.spill()
+
+    def merge(self, later: "PartialSummary") -> "PartialSummary":
+        for t, n in later.counts.items():
+            self.counts[t] = self.counts.get(t, 0) + n
+        self.tta.merge(later.tta)
+        for entity_id, us in later.open:
+            up = self.last_upload.get(entity_id)
+            if up is None:
+                self.open.append((entity_id, us))
+            elif us >= up:
+                self._add_delta(us - up)
+        self.last_upload.update(later.last_upload)
+        if self.entities is not None:
+            self.entities.merge(later.entities)
+        return self
+
+    def summary(self) -> Summary:
+        quality = sorted(((t, n) for t, n in self.counts.items() if t in QUALITY_EVENTS), key=lambda x: x[1], reverse=True)
+        entities = self.entities
+        return Summary.from_counts(
+            dict(self.counts), dict(quality), time_to_analysis_from_stats(self.tta),
+            distinct_result(entities.counts(), entities.approximate, FUNNEL) if entities is not None else None,
+        )
+
+
+# --- time series: per-bucket metrics ---
+
+BUCKETS = ("hour", "day")
+MAX_BUCKETS = 10_000
+
+def bucket_start(ts: datetime, bucket: str) -> datetime:
+    """Start of the hour/day containing `ts`, as a naive timestamp like the stored ones."""
+    ts = ts.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    return ts.replace(hour=0) if bucket == "day" else ts
+
+def bucket_metrics(start: datetime, counts: Dict[str, int], tta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "start": start,
+        "total_events": sum(counts.values()),
+        "funnel": funnel_from_counts(counts),
+        "success_rate": success_rate_from_counts(counts),
+        # every quality type, zeros included, so series line up across buckets
+        "quality_issues": {t: counts.get(t, 0) for t in sorted(QUALITY_EVENTS)},
+        "time_to_analysis_minutes": tta,
+    }
+
+@timed
+def bucket_series(
+    counts: Dict[datetime, Dict[str, int]],
+    tta: Dict[datetime, Dict[str, Any]],
+    bucket: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """Contiguous buckets from `since` (or the first data) to `until` (or the last), empty ones included."""
+    empty = _tta_stats([])
+    return [
+        bucket_metrics(b, counts.get(b, {}), tta.get(b, empty))
+        for b in bucket_range(set(counts) | set(tta), bucket, since, until)
+    ]
+
+def bucket_range(seen: Iterable[datetime], bucket: str, since: Optional[datetime], until: Optional[datetime]) -> List[datetime]:
+    """Every bucket start from `since` (or the first seen) to `until` (or the last seen)."""
+    seen = set(seen)
+    first = bucket_start(since, bucket) if since else min(seen, default=None)
+    last = bucket_start(until, bucket) if until else max(seen, default=None)
+    if first is None or last is None or first > last:
+        return []
+    step = timedelta(days=1) if bucket == "day" else timedelta(hours=1)
+    if (last - first) // step >= MAX_BUCKETS:
+        raise ValueError(f"more than {MAX_BUCKETS} {bucket} buckets; narrow the window or use a larger bucket")
+    return [first + step * i for i in range((last - first) // step + 1)]
+
+@timed
+def timeseries(events: Iterable[AnalyticsEvent], bucket: str, ordered: bool = False) -> Tuple[Dict[datetime, Dict[str, int]], Dict[datetime, Dict[str, Any]]]:
+    """
+    Per-bucket event counts and time-to-analysis in one pass. A pair is
+    counted in the bucket of its analysis_completed event.
+    """
+    counts: Dict[datetime, Dict[str, int]] = {}
+    pairing = []
+    for e in events:
+        c = counts.setdefault(bucket_start(e.timestamp, bucket), {})
+        t = e.event_type
+        c[t] = c.get(t, 0) + 1
+        if t == "data_upload_completed" or t == "analysis_completed":
+            pairing.append(e)
+    if not ordered:
+        pairing.sort(key=lambda x: x.timestamp)
+
+    pairs = _tta_pairs(pairing)
+    deltas: Dict[datetime, List[int]] = {}
+    for ts, dt in pairs:
+        deltas.setdefault(bucket_start(ts, bucket), []).append(dt)
+    # exact or sketched for the whole window, like the SQL path
+    exact = len(pairs) <= SKETCH_EXACT_MAX
+    return counts, {b: _tta_stats(d, exact) for b, d in deltas.items()}
+
+
+# --- segments: funnel and success rate per actor_role / metadata value ---
+
+SEGMENT_UNKNOWN = "unknown"
+
+# (bucket start or None, segment) -> event_type counts
+SegmentCounts = Dict[Tuple[Optional[datetime], str], Dict[str, int]]
+
+@timed
+def earliest_values(events: Iterable[AnalyticsEvent], key: str) -> Dict[str, Tuple[datetime, str]]:
+    """
+    Per entity, (timestamp, value) of its earliest event with a string under
+    metadata[key] (smallest value on a tie), so late events don't move it.
+    """
+    best: Dict[str, Tuple[datetime, str]] = {}
+    for e in events:
+        v = e.metadata.get(key) if e.metadata else None
+        if isinstance(v, str):
+            # offset dropped as when stored, so naive and aware timestamps compare
+            ts = e.timestamp.replace(tzinfo=None)
+            cur = best.get(e.entity_id)
+            if cur is None or (ts, v) < cur:
+                best[e.entity_id] = (ts, v)
+    return best
+
+def entity_segments(events: Iterable[AnalyticsEvent], key: str) -> Dict[str, str]:
+    """Each entity's segment for a metadata key (see earliest_values())."""
+    return {entity_id: v for entity_id, (_, v) in earliest_values(events, key).items()}
+
+@timed
+def segment_counts(
+    events: Iterable[AnalyticsEvent],
+    by: str,
+    bucket: Optional[str] = None,
+    segments: Optional[Dict[str, str]] = None,
+) -> SegmentCounts:
+    """
+    Funnel event counts per segment (and hour/day bucket). `by` is
+    "actor_role" (each event's own role) or a metadata key, looked up per
+    entity in `segments` (see entity_segments()).
+    """
+    out: SegmentCounts = {}
+    for e in events:
+        t = e.event_type
+        if t not in _FUNNEL_STEPS:
+            continue
+        seg = (e.actor_role if by == "actor_role" else segments.get(e.entity_id)) or SEGMENT_UNKNOWN
+        c = out.setdefault((bucket_start(e.timestamp, bucket) if bucket else None, seg), {})
+        c[t] = c.get(t, 0) + 1
+    return out
+
+def _segment_metrics(counts: Dict[str, int]) -> Dict[str, Any]:
+    return {"funnel": funnel_from_counts(counts), "success_rate": success_rate_from_counts(counts)}
+
+@timed
+def segment_report(
+    counts: SegmentCounts,
+    bucket: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Per-segment totals, plus contiguous buckets (every segment in each) when bucketed."""
+    names = sorted({seg for _, seg in counts})
+    totals: Dict[str, Dict[str, int]] = {seg: {} for seg in names}
+    for (_, seg), c in counts.items():
+        for t, n in c.items():
+            totals[seg][t] = totals[seg].get(t, 0) + n
+    out: Dict[str, Any] = {"segments": names, "totals": {seg: _segment_metrics(c) for seg, c in totals.items()}}
+    if bucket:
+        out["buckets"] = [
+            {"start": b, "segments": {seg: _segment_metrics(counts.get((b, seg), {})) for seg in names}}
+            for b in bucket_range({b for b, _ in counts}, bucket, since, until)
+        ]
+    return out
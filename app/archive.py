@@ -0,0 +1,370 @@
+"""
+Cold storage: events older than the retention window, as columnar segments.
+
+archive_before() moves events older than a cutoff (whole UTC days) out of the
+events table into one segment per day under ARCHIVE_DIR, and records it in
+the archive_segments manifest in the same transaction that deletes the rows.
+A segment is a directory of columns sorted by (timestamp, id):
+
+    event_type.npy   uint8   code into the segment's event_type dictionary
+    timestamp.npy    int64   microseconds since the epoch
+    entity.npy       uint32  interned entity_id
+    actor_role.npy   uint8   code into the actor_role dictionary
+    id.npy           int64   the row's events.id (page/export tie-break)
+
+plus the dictionaries and the metadata column as zlib-compressed JSON. The
+fixed-width columns are memory-mapped, so a window costs two binary searches
+on timestamp and only the pages it touches.
+
+event_rollups, entity_progress and entity_dimensions keep covering archived
+events, so whole-hour counts, the entity funnel and single-pair
+time-to-analysis never look here. The queries that do read raw events (edge
+hours, quality tie-breaks, distinct counts, time-to-analysis replays,
+segments, paging/export, the partitioned summary) add the archived rows of
+their window through windows(). Late events for an archived day stay hot
+until the next run archives them into another segment of that day.
+
+    python archive_events.py --days 90
+"""
+from __future__ import annotations
+import heapq
+import json
+import os
+import shutil
+import uuid
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, select
+
+from app.models import ArchiveSegment, Event
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR")
+# rows deleted per statement, under SQLite's bound-parameter limit
+DELETE_CHUNK = 500
+
+EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+COLUMNS = ("event_type", "timestamp", "entity", "actor_role", "id")
+
+# attribute-compatible with the SQL rows repository.page()/export() read
+ColdRow = namedtuple("ColdRow", "event_type entity_id timestamp actor_role event_data id")
+# what rollups/progress/segments.apply_events() need from an event
+ColdEvent = namedtuple("ColdEvent", "event_type entity_id timestamp actor_role metadata")
+
+
+def to_us(ts: datetime) -> int:
+    # stored timestamps are wall-clock strings; compare the way SQLite does
+    return (ts.replace(tzinfo=None) - EPOCH) // _US
+
+
+def from_us(us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(us))
+
+
+def archive_dir(db) -> str:
+    """ARCHIVE_DIR, or `<database file>-archive` next to a SQLite database."""
+    if ARCHIVE_DIR:
+        return ARCHIVE_DIR
+    bind = db.get_bind() if hasattr(db, "get_bind") else db.engine
+    path = bind.url.database
+    if not path or path == ":memory:":
+        raise RuntimeError("set ARCHIVE_DIR: the database is not a SQLite file")
+    return os.path.splitext(os.path.abspath(path))[0] + "-archive"
+
+
+def _dumps(obj: Any) -> bytes:
+    return zlib.compress(json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def _loads(path: str) -> Any:
+    with open(path, "rb") as f:
+        return json.loads(zlib.decompress(f.read()))
+
+
+def _codes(values: Iterable, dictionary: Dict[Any, int]) -> np.ndarray:
+    codes = [dictionary.setdefault(v, len(dictionary)) for v in values]
+    return np.array(codes, dtype=np.uint32)
+
+
+class Segment:
+    """One archived segment, memory-mapped; immutable once written."""
+
+    def __init__(self, path: str):
+        self.path = path
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        d = _loads(os.path.join(path, "dictionaries.json.zz"))
+        self.types: List[str] = d["event_type"]
+        self.roles: List[Optional[str]] = d["actor_role"]
+        self.entities: List[str] = d["entity"]
+        self._entity_index: Optional[Dict[str, int]] = None
+        self._metadata: Optional[List[Dict[str, Any]]] = None
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def bounds(self, since: Optional[datetime], until: Optional[datetime], upper_inclusive: bool = True) -> Tuple[int, int]:
+        """[lo, hi) row range of since <= timestamp <= until (< until if not upper_inclusive)."""
+        lo = int(np.searchsorted(self.timestamp, to_us(since), "left")) if since else 0
+        if until is None:
+            return lo, len(self)
+        return lo, int(np.searchsorted(self.timestamp, to_us(until), "right" if upper_inclusive else "left"))
+
+    def type_codes(self, types: Iterable[str]) -> List[int]:
+        wanted = set(types)
+        return [i for i, t in enumerate(self.types) if t in wanted]
+
+    def entity_codes(self, entity_ids: Iterable[str]) -> List[int]:
+        if self._entity_index is None:
+            self._entity_index = {e: i for i, e in enumerate(self.entities)}
+        return [c for c in map(self._entity_index.get, entity_ids) if c is not None]
+
+    def metadata(self) -> List[Dict[str, Any]]:
+        if self._metadata is None:
+            self._metadata = _loads(os.path.join(self.path, "metadata.json.zz"))
+        return self._metadata
+
+    def row(self, i: int) -> ColdRow:
+        return ColdRow(
+            self.types[self.event_type[i]], self.entities[self.entity[i]], from_us(self.timestamp[i]),
+            self.roles[self.actor_role[i]], self.metadata()[i], int(self.id[i]),
+        )
+
+
+@lru_cache(maxsize=64)
+def _open(path: str) -> Segment:
+    return Segment(path)
+
+
+def _manifest(since: Optional[datetime], until: Optional[datetime]):
+    q = select(ArchiveSegment.path)
+    if since:
+        q = q.where(ArchiveSegment.max_ts >= since)
+    if until:
+        q = q.where(ArchiveSegment.min_ts <= until)
+    return q.order_by(ArchiveSegment.min_ts, ArchiveSegment.id)
+
+
+async def covers_async(db, since: Optional[datetime] = None, until: Optional[datetime] = None) -> bool:
+    """Whether any archived segment overlaps the window, on an AsyncSession."""
+    return (await db.execute(_manifest(since, until).limit(1))).first() is not None
+
+
+def segments(db, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Segment]:
+    """Segments from the manifest holding any row in [since, until], oldest first."""
+    paths = db.execute(_manifest(since, until)).scalars().all()
+    if not paths:
+        return []
+    root = archive_dir(db)
+    return [_open(os.path.join(root, p)) for p in paths]
+
+
+def windows(
+    db,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    upper_inclusive: bool = True,
+) -> Iterator[Tuple[Segment, int, int]]:
+    """(segment, lo, hi) for every non-empty archived slice of the window."""
+    for seg in segments(db, since, until):
+        lo, hi = seg.bounds(since, until, upper_inclusive)
+        if lo < hi:
+            yield seg, lo, hi
+
+
+# --- aggregates over archived rows ---
+
+def type_counts(db, since: Optional[datetime], until: Optional[datetime], upper_inclusive: bool = True) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for seg, lo, hi in windows(db, since, until, upper_inclusive):
+        for code, n in enumerate(np.bincount(seg.event_type[lo:hi], minlength=len(seg.types)).tolist()):
+            if n:
+                out[seg.types[code]] = out.get(seg.types[code], 0) + n
+    return out
+
+
+def bucket_us(bucket: str) -> int:
+    return (86400 if bucket == "day" else 3600) * 1_000_000
+
+
+def bucketed_counts(
+    db, bucket: str, since: Optional[datetime], until: Optional[datetime], upper_inclusive: bool = True,
+) -> List[Tuple[str, str, int]]:
+    """(bucket start as stored text, event_type, count) rows, like rollups._raw_bucketed()."""
+    width = bucket_us(bucket)
+    rows = []
+    for seg, lo, hi in windows(db, since, until, upper_inclusive):
+        keys = (seg.timestamp[lo:hi] // width) * len(seg.types) + seg.event_type[lo:hi]
+        for key, n in zip(*(a.tolist() for a in np.unique(keys, return_counts=True))):
+            b, code = divmod(key, len(seg.types))
+            rows.append((from_us(b * width).isoformat(" "), seg.types[code], n))
+    return rows
+
+
+def first_seen(db, types: Iterable[str], since: Optional[datetime], until: Optional[datetime]) -> Dict[str, datetime]:
+    """Earliest archived timestamp per event_type in the window."""
+    out: Dict[str, datetime] = {}
+    for seg, lo, hi in windows(db, since, until):
+        codes = seg.event_type[lo:hi]
+        for c in seg.type_codes(types):
+            hit = np.flatnonzero(codes == c)
+            if len(hit):
+                ts = from_us(seg.timestamp[lo + hit[0]])
+                t = seg.types[c]
+                out[t] = min(out.get(t, ts), ts)
+    return out
+
+
+def entity_ids(db, types: Iterable[str], since: Optional[datetime], until: Optional[datetime]) -> Iterator[Tuple[str, str]]:
+    """(event_type, entity_id) pairs in the window, unique per segment."""
+    for seg, lo, hi in windows(db, since, until):
+        codes, entities = seg.event_type[lo:hi], seg.entity[lo:hi]
+        for c in seg.type_codes(types):
+            for e in np.unique(entities[codes == c]).tolist():
+                yield seg.types[c], seg.entities[e]
+
+
+def entity_rows(
+    db, entity_ids: Iterable[str], types: Iterable[str], since: Optional[datetime], until: Optional[datetime],
+) -> Iterator[Tuple[int, int, str, str]]:
+    """(timestamp µs, id, entity_id, event_type) of the given entities' events, per segment in order."""
+    entity_ids = list(entity_ids)
+    for seg, lo, hi in windows(db, since, until):
+        mask = np.isin(seg.entity[lo:hi], seg.entity_codes(entity_ids)) & np.isin(seg.event_type[lo:hi], seg.type_codes(types))
+        for i in (np.flatnonzero(mask) + lo).tolist():
+            yield int(seg.timestamp[i]), int(seg.id[i]), seg.entities[seg.entity[i]], seg.types[seg.event_type[i]]
+
+
+# --- rows ---
+
+def _matches(seg: Segment, lo: int, hi: int, entity_id: Optional[str], event_type: Optional[str]) -> np.ndarray:
+    mask = np.ones(hi - lo, dtype=bool)
+    if entity_id is not None:
+        mask &= np.isin(seg.entity[lo:hi], seg.entity_codes([entity_id]))
+    if event_type is not None:
+        mask &= np.isin(seg.event_type[lo:hi], seg.type_codes([event_type]))
+    return np.flatnonzero(mask) + lo
+
+
+def rows(
+    db,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    entity_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    descending: bool = False,
+) -> Iterator[ColdRow]:
+    """Archived rows of the window in (timestamp, id) order, lazily, across overlapping segments."""
+    def one(seg: Segment, lo: int, hi: int) -> Iterator[ColdRow]:
+        idx = _matches(seg, lo, hi, entity_id, event_type)
+        for i in (idx[::-1] if descending else idx).tolist():
+            yield seg.row(i)
+
+    its = [one(seg, lo, hi) for seg, lo, hi in windows(db, since, until)]
+    if len(its) == 1:
+        yield from its[0]
+    elif its:
+        yield from heapq.merge(*its, key=lambda r: (r.timestamp, r.id), reverse=descending)
+
+
+def batches(db, size: int = 10_000) -> Iterator[List[ColdEvent]]:
+    """Every archived event, for rebuilding the derived tables."""
+    for seg in segments(db):
+        meta = seg.metadata()
+        for start in range(0, len(seg), size):
+            yield [
+                ColdEvent(seg.types[seg.event_type[i]], seg.entities[seg.entity[i]], from_us(seg.timestamp[i]),
+                          seg.roles[seg.actor_role[i]], meta[i])
+                for i in range(start, min(start + size, len(seg)))
+            ]
+
+
+# --- writing ---
+
+def _write(root: str, day: datetime, rows: List[Any]) -> Tuple[str, int]:
+    """Write one segment from (id, event_type, entity_id, µs, actor_role, metadata) rows; returns (name, bytes)."""
+    name = f"{day:%Y-%m-%d}-{uuid.uuid4().hex[:8]}"
+    tmp = os.path.join(root, name + ".tmp")
+    os.makedirs(tmp)
+    types: Dict[str, int] = {}
+    roles: Dict[Optional[str], int] = {}
+    entities: Dict[str, int] = {}
+    # event_type and actor_role are closed sets of a handful of values (app.schemas)
+    columns = {
+        "event_type": _codes((r[1] for r in rows), types).astype(np.uint8),
+        "timestamp": np.array([r[3] for r in rows], dtype=np.int64),
+        "entity": _codes((r[2] for r in rows), entities),
+        "actor_role": _codes((r[4] for r in rows), roles).astype(np.uint8),
+        "id": np.array([r[0] for r in rows], dtype=np.int64),
+    }
+    for col, values in columns.items():
+        np.save(os.path.join(tmp, f"{col}.npy"), values)
+    with open(os.path.join(tmp, "dictionaries.json.zz"), "wb") as f:
+        f.write(_dumps({"event_type": list(types), "actor_role": list(roles), "entity": list(entities)}))
+    with open(os.path.join(tmp, "metadata.json.zz"), "wb") as f:
+        f.write(_dumps([r[5] for r in rows]))
+    size = sum(os.path.getsize(os.path.join(tmp, n)) for n in os.listdir(tmp))
+    os.replace(tmp, os.path.join(root, name))
+    return name, size
+
+
+def _first_day(db, start: Optional[datetime], cutoff: datetime) -> Optional[datetime]:
+    q = select(func.min(Event.timestamp)).where(Event.timestamp < cutoff)
+    if start:
+        q = q.where(Event.timestamp >= start)
+    ts = db.execute(q).scalar()
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None) if ts else None
+
+
+def archive_before(db, cutoff: datetime) -> List[Dict[str, Any]]:
+    """Move every event before the start of cutoff's day into segments, one per day."""
+    from app.progress import _us
+
+    cutoff = cutoff.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    root = archive_dir(db)
+    os.makedirs(root, exist_ok=True)
+    done = []
+    day = _first_day(db, None, cutoff)
+    while day is not None:
+        end = min(day + timedelta(days=1), cutoff)
+        rows = db.execute(
+            select(Event.id, Event.event_type, Event.entity_id, _us(Event.timestamp), Event.actor_role, Event.event_data)
+            .where(Event.timestamp >= day, Event.timestamp < end)
+            .order_by(Event.timestamp, Event.id)
+        ).all()
+        name, size = _write(root, day, rows)
+        try:
+            db.add(ArchiveSegment(
+                path=name, start_at=day, end_at=end, min_ts=from_us(rows[0][3]), max_ts=from_us(rows[-1][3]),
+                rows=len(rows), bytes=size, created_at=datetime.now(timezone.utc).replace(tzinfo=None),
+            ))
+            # by id: anything ingested for this day since the read stays hot for the next run
+            ids = [r[0] for r in rows]
+            for i in range(0, len(ids), DELETE_CHUNK):
+                db.execute(delete(Event).where(Event.id.in_(ids[i:i + DELETE_CHUNK])))
+            db.commit()
+        except Exception:
+            db.rollback()
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            raise
+        done.append({"segment": name, "day": day.date().isoformat(), "rows": len(rows), "bytes": size})
+        day = _first_day(db, end, cutoff)
+    return done
+
+
+def archive_older_than(db, days: int = RETENTION_DAYS, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    return archive_before(db, (now or datetime.now(timezone.utc)) - timedelta(days=days))
+
+
+def stats(db) -> Dict[str, Any]:
+    n, rows, size, lo, hi = db.execute(select(
+        func.count(), func.coalesce(func.sum(ArchiveSegment.rows), 0), func.coalesce(func.sum(ArchiveSegment.bytes), 0),
+        func.min(ArchiveSegment.start_at), func.max(ArchiveSegment.end_at),
+    )).one()
+    return {"segments": n, "events": rows, "bytes": size, "since": lo, "until": hi}
@@ -0,0 +1,149 @@
+"""
+Response cache for the public routes.
+
+Rendered bodies are kept per key for PUBLIC_CACHE_TTL seconds or until the
+data version changes; ingest bumps the version after every commit. Responses
+carry ETag / Last-Modified and conditional GETs are answered with 304.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.ingestion import on_commit
+
+CACHE_TTL = float(os.getenv("PUBLIC_CACHE_TTL", "30"))
+
+
+class DataVersion:
+    """Monotonic counter of committed ingests, with the time of the last change."""
+
+    def __init__(self):
+        self.value = 0
+        self.changed_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self._lock = threading.Lock()
+
+    def bump(self) -> None:
+        with self._lock:
+            self.value += 1
+            self.changed_at = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+data_version = DataVersion()
+
+
+@on_commit
+def _bump_on_ingest(events) -> None:
+    data_version.bump()
+
+
+class _Entry:
+    __slots__ = ("version", "expires", "body", "media_type", "etag", "last_modified")
+
+    def __init__(self, version, expires, body, media_type, etag, last_modified):
+        self.version = version
+        self.expires = expires
+        self.body = body
+        self.media_type = media_type
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, _Entry] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def respond(self, request: Request, key: str, render: Callable[[], Tuple[bytes, str]]) -> Response:
+        """Serve `key` from cache (or 304), calling `render()` -> (body, media_type) on a miss."""
+        entry = self._fresh(key)
+        if entry is not None:
+            self.hits += 1
+            cache_status = "HIT"
+        else:
+            # one renderer per key; concurrent misses wait and reuse its result
+            with self._lock_for(key):
+                entry = self._fresh(key)
+                if entry is not None:
+                    self.hits += 1
+                    cache_status = "HIT"
+                else:
+                    self.misses += 1
+                    cache_status = "MISS"
+                    entry = self._render(key, render)
+
+        headers = {
+            "ETag": entry.etag,
+            "Last-Modified": format_datetime(entry.last_modified, usegmt=True),
+            "Cache-Control": f"public, max-age={int(self.ttl)}",
+            "X-Cache": cache_status,
+        }
+        if not_modified(request, entry.etag, entry.last_modified):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+    def clear(self) -> None:
+        with self._guard:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "ttl_seconds": self.ttl,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_ratio": (self.hits / total) if total else None,
+            "data_version": data_version.value,
+        }
+
+    def _fresh(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != data_version.value or entry.expires < time.monotonic():
+            return None
+        return entry
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _render(self, key: str, render: Callable[[], Tuple[bytes, str]]) -> _Entry:
+        # read the version first: an ingest landing mid-render leaves the entry stale, not wrong
+        version, last_modified = data_version.value, data_version.changed_at
+        body, media_type = render()
+        etag = f'"{version}-{zlib.crc32(body):08x}"'
+        entry = _Entry(version, time.monotonic() + self.ttl, body, media_type, etag, last_modified)
+        if self.ttl > 0:
+            self._entries[key] = entry
+        return entry
+
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Whether the request's If-None-Match / If-Modified-Since allow a 304."""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags: List[str] = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return last_modified <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+public_cache = ResponseCache()
@@ -1,19 +1,81 @@
 import os
 from pathlib import Path
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from app.sketches import register_sqlite_functions
+
 BASE_DIR = Path(__file__).resolve().parent.parent  # project root
 DB_PATH = BASE_DIR / "medical_analytics.db"
-DATABASE_URL = f"sqlite:///{DB_PATH}"
-print("USING DATABASE_URL =", DATABASE_URL)
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
+# SQLite profile, applied to every pooled connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB, so 64 MiB
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def _is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url and url.rstrip("/") not in ("sqlite:", "sqlite+pysqlite:")
+
+
+def _sqlite_profile(read_only: bool):
+    def on_connect(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        if not read_only:
+            # persistent in the file; readers inherit it
+            cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        if read_only:
+            cur.execute("PRAGMA query_only=ON")
+        cur.close()
+    return on_connect
+
+
+def make_engine(url: str = DATABASE_URL, read_only: bool = False):
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_pre_ping=True)
+    # the pysqlite driver's own busy wait, on top of busy_timeout
+    eng = create_engine(url, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0})
+    # sketch helpers (dd_key, hll_slot) for SQL-side percentiles and distinct counts
+    event.listen(eng, "connect", lambda dbapi_conn, record: register_sqlite_functions(dbapi_conn))
+    if _is_sqlite_file(url):
+        event.listen(eng, "connect", _sqlite_profile(read_only))
+    return eng
+
+
+def make_async_engine(url: str, read_only: bool = False):
+    if not url.startswith("sqlite"):
+        return create_async_engine(url, pool_pre_ping=True)
+    eng = create_async_engine(url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0})
+    # same connection profile as the sync pools; the adapted connection runs these synchronously
+    event.listen(eng.sync_engine, "connect", lambda dbapi_conn, record: register_sqlite_functions(dbapi_conn))
+    event.listen(eng.sync_engine, "connect", _sqlite_profile(read_only))
+    return eng
+
+
+engine = make_engine(DATABASE_URL)
+# public reads get their own pool: in WAL mode they never wait on the ingest writer
+read_engine = make_engine(DATABASE_URL, read_only=True) if _is_sqlite_file(DATABASE_URL) else engine
+
+# Optional async driver for /events pages, e.g. postgresql+asyncpg://... or
+# sqlite+aiosqlite:///... for the same file. Off by default: a local SQLite
+# read is a short call that releases the GIL, and the aiosqlite hops cost more
+# than they save (benchmarks/mixed.py).
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+async_read_engine = make_async_engine(ASYNC_DATABASE_URL, read_only=True) if ASYNC_DATABASE_URL else None
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = (
+    async_sessionmaker(async_read_engine, expire_on_commit=False) if async_read_engine is not None else None
+)
 Base = declarative_base()
 
 def get_db():
@@ -22,3 +84,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -0,0 +1,179 @@
+"""
+Write-behind ingest (INGEST_MODE=queued).
+
+POST /events hands validated events to a bounded in-process queue and
+returns 202; one writer thread drains it and commits in groups, bounded by
+INGEST_BATCH_SIZE events or INGEST_MAX_WAIT_MS, so SQLite does one fsync
+per batch instead of one per event. A busy database is retried with
+backoff; a batch rejected for its data is retried in halves, so one bad
+event doesn't take acknowledged neighbours with it.
+"""
+from __future__ import annotations
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from app.repository import open_repository
+from app.schemas import AnalyticsEvent
+
+log = logging.getLogger(__name__)
+
+INGEST_MODE = os.getenv("INGEST_MODE", "direct")
+QUEUE_MAXSIZE = int(os.getenv("INGEST_QUEUE_MAXSIZE", "10000"))
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+MAX_WAIT = int(os.getenv("INGEST_MAX_WAIT_MS", "50")) / 1000.0
+ENQUEUE_TIMEOUT = int(os.getenv("INGEST_ENQUEUE_TIMEOUT_MS", "100")) / 1000.0
+# database busy/locked: attempts per batch, first delay doubling up to the max
+RETRY_ATTEMPTS = int(os.getenv("INGEST_RETRY_ATTEMPTS", "8"))
+RETRY_BACKOFF = 0.05
+RETRY_BACKOFF_MAX = 2.0
+
+_STOP = object()
+
+
+class IngestQueue:
+    def __init__(self, maxsize: int = QUEUE_MAXSIZE, batch_size: int = BATCH_SIZE, max_wait: float = MAX_WAIT):
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # counters are bumped by request threads and the writer
+        self._counts = threading.Lock()
+
+        self.enqueued = 0
+        self.rejected = 0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.commit_seconds_total = 0.0
+        self.commit_seconds_max = 0.0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+
+    def put(self, event: AnalyticsEvent, timeout: float = ENQUEUE_TIMEOUT) -> bool:
+        """Enqueue one event; False when the queue stayed full for `timeout` (backpressure)."""
+        self.start()
+        try:
+            self._q.put(event, timeout=timeout)
+        except queue.Full:
+            with self._counts:
+                self.rejected += 1
+            return False
+        with self._counts:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._q.qsize())
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Flush everything still queued and stop the writer."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._q.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": INGEST_MODE,
+            "depth": self._q.qsize(),
+            "max_depth": self.max_depth,
+            "capacity": self._q.maxsize,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "committed": self.committed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "commit_latency_ms_avg": (self.commit_seconds_total / self.batches * 1000.0) if self.batches else None,
+            "commit_latency_ms_max": self.commit_seconds_max * 1000.0 if self.batches else None,
+        }
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._q.get()
+            if item is _STOP:
+                break
+            batch: List[AnalyticsEvent] = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    # drain whatever is left, then exit after this batch
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+        leftover: List[AnalyticsEvent] = []
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        for i in range(0, len(leftover), self.batch_size):
+            self._write(leftover[i:i + self.batch_size])
+
+    def _write(self, batch: List[AnalyticsEvent]) -> None:
+        """
+        Commit one batch. Its events were already acknowledged with 202, so
+        nothing is dropped lightly: a locked/busy database (OperationalError)
+        is retried with backoff, and a batch rejected for its data is retried
+        in halves, so only events that fail on their own are dropped (and
+        counted in `failed`).
+        """
+        delay = RETRY_BACKOFF
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            repo = open_repository()
+            t0 = time.perf_counter()
+            try:
+                repo.record(batch)
+                break
+            except OperationalError:
+                if attempt == RETRY_ATTEMPTS:
+                    with self._counts:
+                        self.failed += len(batch)
+                    log.exception("ingest writer: dropped batch of %d events after %d attempts", len(batch), attempt)
+                    return
+                log.warning("ingest writer: database busy, retrying batch of %d in %.2fs", len(batch), delay)
+            except Exception:
+                if len(batch) == 1:
+                    with self._counts:
+                        self.failed += 1
+                    log.exception("ingest writer: dropped event for entity %s", batch[0].entity_id)
+                    return
+                log.warning("ingest writer: batch of %d events rejected, retrying in halves", len(batch), exc_info=True)
+                mid = len(batch) // 2
+                self._write(batch[:mid])
+                self._write(batch[mid:])
+                return
+            finally:
+                repo.close()
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_BACKOFF_MAX)
+
+        dt = time.perf_counter() - t0
+        with self._counts:
+            self.batches += 1
+            self.committed += len(batch)
+            self.commit_seconds_total += dt
+            self.commit_seconds_max = max(self.commit_seconds_max, dt)
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,155 @@
+"""
+Write path shared by the ingest routes.
+
+Inserts raw events, plus the quality events app.quality_rules derives from
+uploads, and keeps the derived tables in step, all inside the caller's
+transaction; the caller commits. Code that needs to react to new data
+(caches, live views) registers with on_commit() and is called with the
+events once their transaction has committed.
+"""
+from __future__ import annotations
+import logging
+import os
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Tuple
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Event
+from app.schemas import AnalyticsEvent
+from app import perf, quality_rules, rollups, progress, segments
+
+NDJSON_CHUNK_LINES = 5000
+# cap on an NDJSON body after gzip inflation; a small bomb can't fill memory
+NDJSON_MAX_BYTES = int(os.getenv("NDJSON_MAX_BYTES", str(256 * 1024 * 1024)))
+# most bytes inflated per decompress() call
+_INFLATE_STEP = 1 << 20
+
+_EVENT = TypeAdapter(AnalyticsEvent)
+_EVENTS = TypeAdapter(List[AnalyticsEvent])
+
+log = logging.getLogger(__name__)
+
+_PENDING = "ingested_events"
+_COMMIT_HOOKS: List[Callable[[List[AnalyticsEvent]], None]] = []
+
+
+def on_commit(fn: Callable[[List[AnalyticsEvent]], None]) -> Callable[[List[AnalyticsEvent]], None]:
+    _COMMIT_HOOKS.append(fn)
+    return fn
+
+
+def notify_committed(events: List[AnalyticsEvent]) -> None:
+    """Run the on_commit hooks; backends without a Session call this themselves."""
+    perf.observe_batch(len(events))
+    for fn in _COMMIT_HOOKS:
+        try:
+            fn(events)
+        except Exception:
+            log.exception("ingest commit hook %r failed", fn)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    events = session.info.pop(_PENDING, None)
+    if events:
+        notify_committed(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+def with_quality_events(events: List[AnalyticsEvent]) -> List[AnalyticsEvent]:
+    """`events` plus the quality events the rules derive from their uploads."""
+    if not quality_rules.QUALITY_EVENTS_AT_INGEST:
+        return events
+    derived = quality_rules.derive_events(events)
+    return list(events) + derived if derived else events
+
+
+def record_events(db: Session, events: List[AnalyticsEvent]) -> int:
+    if not events:
+        return 0
+    events = with_quality_events(events)
+    # one executemany INSERT instead of an ORM object per event
+    db.execute(Event.__table__.insert(), [
+        {
+            "event_type": e.event_type,
+            "entity_id": e.entity_id,
+            "timestamp": e.timestamp,
+            "actor_role": e.actor_role,
+            "metadata": e.metadata,
+        }
+        for e in events
+    ])
+    rollups.apply_events(db, events)
+    progress.apply_events(db, events)
+    segments.apply_events(db, events)
+    db.info.setdefault(_PENDING, []).extend(events)
+    return len(events)
+
+
+# --- NDJSON streaming ---
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+def _inflate(inflate, chunk: bytes) -> Iterator[bytes]:
+    """Decompress one chunk in pieces of at most _INFLATE_STEP bytes."""
+    data = inflate.decompress(chunk, _INFLATE_STEP)
+    while data:
+        yield data
+        if not inflate.unconsumed_tail and len(data) < _INFLATE_STEP:
+            return
+        data = inflate.decompress(inflate.unconsumed_tail, _INFLATE_STEP)
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], gzipped: bool = False) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Yield (line_number, line) from a streamed body, decompressing gzip on the
+    fly. Raises BodyTooLarge once the (inflated) body passes NDJSON_MAX_BYTES.
+    """
+    inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    buf = b""
+    n = size = 0
+    async for chunk in chunks:
+        for data in _inflate(inflate, chunk) if inflate is not None else (chunk,):
+            size += len(data)
+            if size > NDJSON_MAX_BYTES:
+                raise BodyTooLarge(f"NDJSON body larger than {NDJSON_MAX_BYTES} bytes")
+            buf += data
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                n += 1
+                if line.strip():
+                    yield n, line
+    if inflate is not None:
+        buf += inflate.flush()
+    if buf.strip():
+        yield n + 1, buf
+
+
+def validate_lines(lines: List[Tuple[int, bytes]]) -> Tuple[List[AnalyticsEvent], List[Dict[str, Any]]]:
+    """Validate a chunk of NDJSON lines; bad lines are reported, not fatal."""
+    # fast path: let pydantic-core parse the whole chunk as one JSON array
+    try:
+        events = _EVENTS.validate_json(b"[" + b",".join(line for _, line in lines) + b"]")
+        if len(events) == len(lines):
+            return events, []
+    except ValidationError:
+        pass
+
+    events, errors = [], []
+    for n, line in lines:
+        try:
+            events.append(_EVENT.validate_json(line))
+        except ValidationError as e:
+            errors.append({
+                "line": n,
+                "errors": [{"loc": list(x["loc"]), "msg": x["msg"]} for x in e.errors(include_url=False)],
+            })
+    return events, errors
@@ -0,0 +1,151 @@
+"""
+Sliding-window metrics over the last few minutes of ingest, kept in memory.
+
+Every committed ingest batch is counted into a ring of SLOT_SECONDS slots
+(event_type -> count) covering the longest window; each window keeps running
+totals that are updated as batches arrive and as slots fall out of it, so a
+read never touches the database or walks the ring. Windows are measured in
+ingest time (when the batch committed, not the events' own timestamps) with
+slot granularity, and are per process.
+
+stream() turns the totals into a server-sent-events feed: a full snapshot
+on connect, then only the values that changed. Snapshots are shared between
+connections, so open dashboards cost a dictionary diff each per tick.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional, Sequence
+
+from app.analytics import QUALITY_EVENTS, funnel_from_counts, success_rate_from_counts
+from app.ingestion import on_commit
+from app.schemas import AnalyticsEvent
+
+LIVE_WINDOWS = (5, 15, 60)
+SLOT_SECONDS = 10
+LIVE_TICK_SECONDS = float(os.getenv("LIVE_TICK_SECONDS", "1"))
+KEEPALIVE_SECONDS = 15
+
+
+class SlidingWindows:
+    def __init__(self, windows: Sequence[int] = LIVE_WINDOWS, slot_seconds: int = SLOT_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.windows = tuple(windows)
+        self.slot_seconds = slot_seconds
+        self.clock = clock
+        self._width = {w: w * 60 // slot_seconds for w in self.windows}
+        self._n = max(self._width.values())
+        self._slots = [Counter() for _ in range(self._n)]
+        self._totals = {w: Counter() for w in self.windows}
+        self._head: Optional[int] = None
+        self._lock = threading.Lock()
+        # bumped on every add; with the head slot it keys the shared snapshot
+        self.version = 0
+        self._memo: Optional[tuple] = None
+
+    def add(self, events: Iterable[AnalyticsEvent]) -> None:
+        counts = Counter(e.event_type for e in events)
+        if not counts:
+            return
+        with self._lock:
+            self._advance(self._slot())
+            self._slots[self._head % self._n].update(counts)
+            for w in self.windows:
+                self._totals[w].update(counts)
+            self.version += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._advance(self._slot())
+            key = (self.version, self._head)
+            if self._memo is None or self._memo[0] != key:
+                self._memo = (key, {f"{w}m": window_metrics(self._totals[w], w) for w in self.windows})
+            return self._memo[1]
+
+    def _slot(self) -> int:
+        return int(self.clock() // self.slot_seconds)
+
+    def _advance(self, slot: int) -> None:
+        if self._head is None or slot - self._head >= self._n:
+            for c in self._slots:
+                c.clear()
+            for c in self._totals.values():
+                c.clear()
+            self._head = slot
+            return
+        for s in range(self._head + 1, slot + 1):
+            # slot s - width just left window w; for the longest window that is
+            # the ring position s is about to reuse
+            for w in self.windows:
+                leaving = self._slots[(s - self._width[w]) % self._n]
+                totals = self._totals[w]
+                for t, n in leaving.items():
+                    totals[t] -= n
+                    if totals[t] <= 0:
+                        del totals[t]
+            self._slots[s % self._n].clear()
+        self._head = max(self._head, slot)
+
+
+def window_metrics(counts: Dict[str, int], minutes: int) -> Dict[str, Any]:
+    total = sum(counts.values())
+    return {
+        "events": total,
+        "events_per_minute": round(total / minutes, 2),
+        "funnel": funnel_from_counts(counts),
+        "success_rate": success_rate_from_counts(counts),
+        "quality_issues": {t: counts.get(t, 0) for t in sorted(QUALITY_EVENTS)},
+    }
+
+
+live_windows = SlidingWindows()
+
+
+@on_commit
+def _count_ingest(events) -> None:
+    live_windows.add(events)
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of `new` that differ from `old`, nested the same way."""
+    out = {}
+    for k, v in new.items():
+        if isinstance(v, dict) and isinstance(old.get(k), dict):
+            d = diff(old[k], v)
+            if d:
+                out[k] = d
+        elif k not in old or old[k] != v:
+            out[k] = v
+    return out
+
+
+def _sse(event: str, seq: int, data: Dict[str, Any]) -> str:
+    return f"event: {event}\nid: {seq}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def stream(windows: SlidingWindows = live_windows, tick: Optional[float] = None) -> AsyncIterator[str]:
+    """SSE feed: `snapshot` once, then a `delta` whenever a value changes."""
+    tick = LIVE_TICK_SECONDS if tick is None else tick
+    last = windows.snapshot()
+    seq = 1
+    yield f"retry: {int(tick * 3000)}\n" + _sse("snapshot", seq, last)
+    quiet = 0.0
+    while True:
+        await asyncio.sleep(tick)
+        snap = windows.snapshot()
+        if snap is last:
+            quiet += tick
+            if quiet >= KEEPALIVE_SECONDS:
+                quiet = 0.0
+                yield ": keep-alive\n\n"
+            continue
+        delta = diff(last, snap)
+        last = snap
+        if delta:
+            seq += 1
+            quiet = 0.0
+            yield _sse("delta", seq, delta)
@@ -1,10 +1,28 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routers import ingest, metrics, dashboard, public_metrics
+from app.routers import ingest, metrics, dashboard, public_metrics, internal
+from app.ingest_queue import ingest_queue, INGEST_MODE
+from app import partitioned, perf, snapshots
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if INGEST_MODE == "queued":
+        ingest_queue.start()
+    if snapshots.SNAPSHOTS:
+        snapshots.scheduler.start()
+    yield
+    snapshots.scheduler.stop()
+    # flush write-behind events before the process exits
+    ingest_queue.stop()
+    partitioned.shutdown()
+
 
 app = FastAPI(
     title="Medical Web Analytics & Data Quality Monitor",
     version="0.2.0",
     description="Analytics-focused prototype for medical platform flows, data quality and explainable insights.",
+    lifespan=lifespan,
 )
 
 @app.get("/ping")
@@ -16,3 +34,9 @@ app.include_router(ingest.router)
 app.include_router(metrics.router)
 app.include_router(dashboard.router)
 app.include_router(public_metrics.router)
+app.include_router(internal.router)
+
+if perf.PERF_METRICS:
+    perf.install_sql_listeners()
+if perf.PERF_METRICS or perf.PERF_PROFILER:
+    app.add_middleware(perf.PerfMiddleware)
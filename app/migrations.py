@@ -0,0 +1,65 @@
+"""
+In-place schema upgrades for existing SQLite files.
+
+create_all() only creates missing tables, so indexes added to existing
+tables (and ones that became redundant) are handled here, and a derived
+table created next to existing events is backfilled from them. Safe to run
+repeatedly; create_tables.py calls it.
+"""
+from __future__ import annotations
+from typing import List
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app import progress, rollups, segments
+from app.database import Base
+import app.models  # noqa: F401  (registers the tables on Base)
+
+# superseded by the composite (event_type, timestamp) / (entity_id, timestamp)
+# indexes, or redundant with the INTEGER PRIMARY KEY (rowid)
+OBSOLETE_INDEXES = ["ix_events_event_type", "ix_events_entity_id", "ix_events_id"]
+
+# tables maintained at ingest, with the rebuild that fills them from the raw events
+DERIVED_TABLES = {
+    "event_rollups": rollups.rebuild,
+    "entity_progress": progress.rebuild,
+    "entity_dimensions": segments.rebuild,
+}
+
+
+def migrate(engine: Engine) -> List[str]:
+    """Create missing tables and indexes, drop obsolete ones; returns what changed."""
+    changes = []
+    before = set(inspect(engine).get_table_names())
+    Base.metadata.create_all(bind=engine)
+
+    insp = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                changes.append(f"created {index.name}")
+        for name in OBSOLETE_INDEXES:
+            if name in existing:
+                with engine.begin() as conn:
+                    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+                changes.append(f"dropped {name}")
+
+    created = [t for t in DERIVED_TABLES if t not in before]
+    if created and _has_events(engine, before):
+        with Session(engine) as db:
+            for name in created:
+                n = DERIVED_TABLES[name](db)
+                changes.append(f"backfilled {name} ({n} rows)")
+    return changes
+
+
+def _has_events(engine: Engine, tables) -> bool:
+    """Whether the database held raw events (hot or archived) before this run."""
+    with engine.connect() as conn:
+        return any(
+            conn.execute(text(f"SELECT 1 FROM {t} LIMIT 1")).first() is not None
+            for t in ("events", "archive_segments") if t in tables
+        )
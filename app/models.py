@@ -1,16 +1,88 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index, text
 from app.database import Base
 
 
 class Event(Base):
     __tablename__ = "events"
 
-    id = Column(Integer, primary_key=True, index=True)
-    event_type = Column(String(64), index=True, nullable=False)
-    entity_id = Column(String(128), index=True, nullable=False)
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String(64), nullable=False)
+    entity_id = Column(String(128), nullable=False)
     timestamp = Column(DateTime(timezone=True), index=True, nullable=False)
     actor_role = Column(String(32), nullable=True)
 
     # IMPORTANT: 'metadata' is reserved in SQLAlchemy
     event_data = Column("metadata", JSON, nullable=False)
 
+    # Queries filter on a time window plus type, or on an entity plus time.
+    # These also cover the old single-column event_type / entity_id lookups;
+    # app/migrations.py brings existing databases in line.
+    __table_args__ = (
+        Index("ix_events_type_ts", "event_type", "timestamp"),
+        Index("ix_events_entity_ts", "entity_id", "timestamp"),
+    )
+
+
+class EventRollup(Base):
+    """Per-hour event counters, maintained at ingest time (see app/rollups.py)."""
+    __tablename__ = "event_rollups"
+
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # start of the hour
+    event_type = Column(String(64), primary_key=True)
+    # "" when the event had no role: NULLs never conflict in a primary key upsert
+    actor_role = Column(String(32), primary_key=True, default="")
+    count = Column(Integer, nullable=False, default=0)
+
+
+# entities whose stored timestamps can't stand in for an event replay
+# (repeated uploads/analyses, or a same-instant tie); see app/progress.py
+PROGRESS_NEEDS_REPLAY = (
+    "upload_completed_n > 1 OR analysis_completed_n > 1"
+    " OR upload_completed_at = analysis_completed_at"
+)
+
+
+class EntityProgress(Base):
+    """Per-submission funnel state, maintained at ingest time (see app/progress.py)."""
+    __tablename__ = "entity_progress"
+
+    entity_id = Column(String(128), primary_key=True)
+    # index into FUNNEL_STEPS of the furthest step reached, -1 if none yet
+    stage = Column(Integer, nullable=False, default=-1)
+    first_seen_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    upload_completed_at = Column(DateTime(timezone=True), nullable=True)
+    analysis_completed_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    review_completed_at = Column(DateTime(timezone=True), nullable=True)
+    upload_completed_n = Column(Integer, nullable=False, default=0)
+    analysis_completed_n = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_entity_progress_replay", "entity_id", sqlite_where=text(PROGRESS_NEEDS_REPLAY)),
+    )
+
+
+class EntityDimension(Base):
+    """An entity's value for one segment key (SEGMENT_KEYS), maintained at ingest (see app/segments.py)."""
+    __tablename__ = "entity_dimensions"
+
+    entity_id = Column(String(128), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    value = Column(String(256), nullable=False)
+    # timestamp of the event the value came from; the earliest one wins
+    first_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ArchiveSegment(Base):
+    """Manifest entry for one archived segment of events (see app/archive.py)."""
+    __tablename__ = "archive_segments"
+
+    id = Column(Integer, primary_key=True)
+    path = Column(String(256), nullable=False, unique=True)  # relative to the archive directory
+    # the day it was cut from, [start_at, end_at), and the rows' actual range
+    start_at = Column(DateTime(timezone=True), nullable=False)
+    end_at = Column(DateTime(timezone=True), nullable=False)
+    min_ts = Column(DateTime(timezone=True), nullable=False, index=True)
+    max_ts = Column(DateTime(timezone=True), nullable=False)
+    rows = Column(Integer, nullable=False)
+    bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,119 @@
+"""
+Partitioned, multi-process evaluation of the summary metrics.
+
+The window is cut into time slices. Each worker process reads its slice over
+its own read-only connection, in (timestamp, id) order, as a columnar
+batches.EventBatch into an analytics.PartialSummary; the partials are merged back in time order, so the
+result is exactly analytics.summarize() over the whole window read the same
+way. Archived events (app/archive.py) of a slice are merged into the same
+order. Opt in with METRICS_WORKERS > 1 (SQLite file databases only): the
+rollup path in app.aggregations never scans the events table, this one does,
+but spreads the scan over all cores.
+"""
+from __future__ import annotations
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from app import archive, batches
+from app.analytics import PartialSummary, Summary
+from app.database import DATABASE_URL, _is_sqlite_file, make_engine
+from app.models import Event
+
+METRICS_WORKERS = int(os.getenv("METRICS_WORKERS", "0"))
+# more slices than workers, so one dense hour doesn't leave the others idle
+PARTITIONS_PER_WORKER = 4
+
+# (lo, hi, last): lo <= timestamp < hi, or <= hi for the last slice
+Partition = Tuple[datetime, datetime, bool]
+
+_engines: Dict[str, object] = {}
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def enabled(url: str = DATABASE_URL) -> bool:
+    return METRICS_WORKERS > 1 and _is_sqlite_file(url)
+
+
+def _engine(url: str):
+    # one per process: connections are never shared across a fork/spawn
+    eng = _engines.get(url)
+    if eng is None:
+        eng = _engines[url] = make_engine(url, read_only=True)
+    return eng
+
+
+def _window(stmt, since: Optional[datetime], until: Optional[datetime]):
+    if since:
+        stmt = stmt.where(Event.timestamp >= since)
+    if until:
+        stmt = stmt.where(Event.timestamp <= until)
+    return stmt
+
+
+def time_partitions(lo: datetime, hi: datetime, n: int) -> List[Partition]:
+    """`n` equal slices covering [lo, hi]."""
+    if n <= 1 or hi <= lo:
+        return [(lo, hi, True)]
+    step = (hi - lo) / n
+    cuts = [lo + step * i for i in range(n)] + [hi]
+    return [(a, b, i == n - 1) for i, (a, b) in enumerate(zip(cuts, cuts[1:])) if a < b or i == n - 1]
+
+
+def partial_summary(url: str, part: Partition, distinct: bool = False) -> PartialSummary:
+    """Worker entry point: one slice, read in (timestamp, id) order."""
+    lo, hi, last = part
+    with _engine(url).connect() as conn:
+        batch = batches.fetch(conn, lo, hi, upper_inclusive=last)
+    return PartialSummary(distinct).add_batch(batch)
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    with _lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # spawn: forking a threaded server process is not safe
+            pool = _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        return pool
+
+
+def shutdown() -> None:
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown(cancel_futures=True)
+        _pools.clear()
+
+
+def summary(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    workers: Optional[int] = None,
+    distinct: bool = False,
+    url: str = DATABASE_URL,
+) -> Summary:
+    """analytics.summarize() over the window, evaluated on `workers` processes (1 = in-process)."""
+    workers = workers or METRICS_WORKERS or 1
+    with _engine(url).connect() as conn:
+        lo, hi = conn.execute(_window(select(func.min(Event.timestamp), func.max(Event.timestamp)), since, until)).one()
+        for seg, a, b in archive.windows(conn, since, until):
+            first, last = archive.from_us(seg.timestamp[a]), archive.from_us(seg.timestamp[b - 1])
+            lo, hi = (first, last) if lo is None else (min(lo, first), max(hi, last))
+    if lo is None:
+        return PartialSummary(distinct).summary()
+
+    parts = time_partitions(lo, hi, workers * PARTITIONS_PER_WORKER if workers > 1 else 1)
+    if workers == 1:
+        partials = [partial_summary(url, p, distinct) for p in parts]
+    else:
+        partials = list(_pool(workers).map(partial_summary, [url] * len(parts), parts, [distinct] * len(parts)))
+
+    merged = partials[0]
+    for p in partials[1:]:
+        merged.merge(p)
+    return merged.summary()
@@ -0,0 +1,307 @@
+"""
+Built-in performance instrumentation, exported in Prometheus text format at
+/internal/perf (API key protected).
+
+- per-route latency, SQL statements and rows fetched per request (PerfMiddleware)
+- SQL statement counts and durations (SQLAlchemy engine events)
+- time spent in the app.analytics entry points (@timed)
+- ingest batch sizes (observed once per committed batch)
+
+PERF_METRICS=0 installs none of it: no middleware, no engine listeners, and
+@timed returns the function unchanged.
+
+With PERF_PROFILER=1, a request sent with `X-Profile: 1` (and the API key) is
+sampled every PERF_PROFILE_INTERVAL_MS by a background thread; the collapsed
+stacks (flamegraph.pl / speedscope input) are kept for the last few profiled
+requests and served at /internal/perf/profiles/<id>.
+"""
+from __future__ import annotations
+import contextvars
+import functools
+import itertools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Counts, OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+PERF_METRICS = os.getenv("PERF_METRICS", "1") == "1"
+PERF_PROFILER = os.getenv("PERF_PROFILER", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.getenv("PERF_PROFILE_INTERVAL_MS", "2"))
+PROFILES_KEPT = 20
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+BATCH_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10_000, 50_000)
+
+_lock = threading.Lock()
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, by: float = 1) -> None:
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + by
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self._values.items())
+        out += [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in items]
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with _lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def count(self, *labels: str) -> int:
+        s = self._series.get(labels)
+        return s[2] if s else 0
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((k, ([*s[0]], s[1], s[2])) for k, s in self._series.items())
+        for key, (counts, total, n) in items:
+            cumulative = list(itertools.accumulate(counts))
+            for bound, c in zip([*map(_num, self.buckets), "+Inf"], cumulative):
+                le = 'le="' + bound + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {c}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {n}")
+        return out
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request latency by route template.",
+                            LATENCY_BUCKETS, ("method", "route", "status"))
+REQUEST_SQL = Histogram("http_request_sql_statements", "SQL statements executed per request.",
+                        COUNT_BUCKETS, ("route",))
+REQUEST_ROWS = Histogram("http_request_rows_fetched", "Rows fetched from SQLite per request.",
+                         ROW_BUCKETS, ("route",))
+SQL_STATEMENTS = Counter("sql_statements_total", "SQL statements executed, by leading keyword.", ("kind",))
+SQL_SECONDS = Histogram("sql_statement_duration_seconds", "SQL statement execution time.", SQL_BUCKETS, ("kind",))
+ANALYTICS_SECONDS = Histogram("analytics_function_duration_seconds", "Time spent in app.analytics functions.",
+                              LATENCY_BUCKETS, ("function",))
+INGEST_BATCH = Histogram("ingest_batch_events", "Events per committed ingest batch.", BATCH_BUCKETS)
+
+METRICS = [REQUEST_SECONDS, REQUEST_SQL, REQUEST_ROWS, SQL_STATEMENTS, SQL_SECONDS, ANALYTICS_SECONDS, INGEST_BATCH]
+
+
+def render() -> str:
+    return "\n".join(line for m in METRICS for line in m.render()) + "\n"
+
+
+# --- per-request accounting ---
+
+class RequestStats:
+    __slots__ = ("sql", "rows")
+
+    def __init__(self):
+        self.sql = 0
+        self.rows = 0
+
+    def count_row(self, cursor, row):
+        # installed as the sqlite3 cursor's row_factory while a request runs
+        self.rows += 1
+        return row
+
+
+_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("perf_request", default=None)
+
+
+def timed(fn: Callable) -> Callable:
+    """Record the function's wall time in analytics_function_duration_seconds."""
+    if not PERF_METRICS:
+        return fn
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            ANALYTICS_SECONDS.observe(time.perf_counter() - start, name)
+    return wrapper
+
+
+def observe_batch(n: int) -> None:
+    if PERF_METRICS:
+        INGEST_BATCH.observe(n)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.perf_started = time.perf_counter()
+    stats = _request.get()
+    if stats is not None and conn.dialect.driver == "pysqlite":
+        cursor.row_factory = stats.count_row
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.perf_started
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    SQL_STATEMENTS.inc(kind)
+    SQL_SECONDS.observe(elapsed, kind)
+    stats = _request.get()
+    if stats is not None:
+        stats.sql += 1
+        if conn.dialect.driver == "aiosqlite":
+            # the async adapter has already fetched the whole result into _rows
+            stats.rows += len(getattr(cursor, "_rows", ()))
+
+
+def install_sql_listeners() -> None:
+    """Time every statement on every engine (idempotent)."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- sampling profiler ---
+
+_profiles: "OrderedDict[str, str]" = OrderedDict()
+_profile_ids = itertools.count(1)
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Sampler(threading.Thread):
+    """Samples every thread's stack; keeps the ones running app code."""
+
+    def __init__(self, interval: float):
+        super().__init__(name="perf-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: _Counts = _Counts()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self.samples += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(_APP_DIR)
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if in_app:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+def profile(pid: str) -> Optional[str]:
+    with _lock:
+        return _profiles.get(pid)
+
+
+def _wants_profile(scope) -> bool:
+    headers = dict(scope.get("headers") or ())
+    if headers.get(b"x-profile") != b"1":
+        return False
+    expected = os.getenv("ANALYTICS_API_KEY")
+    return bool(expected) and headers.get(b"x-api-key") == expected.encode()
+
+
+# --- middleware ---
+
+class PerfMiddleware:
+    """Plain ASGI middleware: no per-request task or body buffering."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sampler = None
+        pid = None
+        if PERF_PROFILER and _wants_profile(scope):
+            sampler = _Sampler(PROFILE_INTERVAL_MS / 1000.0)
+            # id handed out up front so it can go in the response headers
+            pid = str(next(_profile_ids))
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if pid is not None:
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", pid.encode())]}
+            await send(message)
+
+        stats = RequestStats() if PERF_METRICS else None
+        token = _request.set(stats)
+        if sampler is not None:
+            sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            if stats is not None:
+                REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+                REQUEST_SQL.observe(stats.sql, route)
+                REQUEST_ROWS.observe(stats.rows, route)
+            if sampler is not None:
+                sampler.stop()
+                _save_profile(pid, route, sampler, elapsed)
+
+
+def _save_profile(pid: str, route: str, sampler: _Sampler, elapsed: float) -> None:
+    lines = [f"# route: {route}  wall: {elapsed * 1000:.1f}ms  samples: {sampler.samples}  "
+             f"interval: {sampler.interval * 1000:g}ms"]
+    lines += [f"{stack} {n}" for stack, n in sampler.stacks.most_common()]
+    with _lock:
+        _profiles[pid] = "\n".join(lines) + "\n"
+        while len(_profiles) > PROFILES_KEPT:
+            _profiles.popitem(last=False)
@@ -0,0 +1,315 @@
+"""
+Per-submission funnel progress.
+
+Ingest folds every event into one entity_progress row (furthest FUNNEL_STEPS
+stage, key timestamps, upload/analysis counts). Updates are order-independent
+(max/min/sum), so late events land the same as in-order ones.
+
+Time-to-analysis is read from these rows for entities with a single
+upload/analysis pair; the few entities where that is ambiguous are paired
+from their raw events with a window function, giving the same result as the
+full event replay. Both run inside SQLite: only totals and percentile inputs
+come back. When the window reaches into the archive (app/archive.py), the
+replayed entities are paired in Python from their hot and archived events.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import Integer, Select, case, cast, func, select, text, union_all
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app import archive
+from app.events import FUNNEL_STEPS
+from app.models import Event, EntityProgress, PROGRESS_NEEDS_REPLAY
+from app.schemas import AnalyticsEvent
+from app.rollups import bucket_expr, wall_clock
+from app.analytics import (
+    dropoff_from_counts,
+    time_to_analysis_from_stats,
+    time_to_analysis_from_totals,
+)
+from app.sketches import SKETCH_EXACT_MAX, DeltaStats
+
+_STAGE = {step: i for i, step in enumerate(FUNNEL_STEPS)}
+
+
+def apply_events(db: Session, events: Iterable[AnalyticsEvent]) -> None:
+    """Fold a batch of freshly ingested events into entity_progress (no commit)."""
+    rows: Dict[str, Dict[str, Any]] = {}
+    for e in events:
+        # stored without the offset; naive and aware timestamps of one entity must compare
+        ts = wall_clock(e.timestamp)
+        r = rows.get(e.entity_id)
+        if r is None:
+            r = rows[e.entity_id] = {
+                "entity_id": e.entity_id,
+                "stage": -1,
+                "first_seen_at": ts,
+                "upload_completed_at": None,
+                "analysis_completed_at": None,
+                "review_completed_at": None,
+                "upload_completed_n": 0,
+                "analysis_completed_n": 0,
+            }
+        r["stage"] = max(r["stage"], _STAGE.get(e.event_type, -1))
+        r["first_seen_at"] = min(r["first_seen_at"], ts)
+        if e.event_type == "data_upload_completed":
+            r["upload_completed_at"] = _latest(r["upload_completed_at"], ts)
+            r["upload_completed_n"] += 1
+        elif e.event_type == "analysis_completed":
+            r["analysis_completed_at"] = _latest(r["analysis_completed_at"], ts)
+            r["analysis_completed_n"] += 1
+        elif e.event_type == "clinician_review_completed":
+            r["review_completed_at"] = _latest(r["review_completed_at"], ts)
+
+    if not rows:
+        return
+    # single-row upsert run as one executemany: compiled once, cached after that
+    t = EntityProgress.__table__
+    stmt = insert(t)
+    ex = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["entity_id"],
+        set_={
+            "stage": func.max(t.c.stage, ex.stage),
+            "first_seen_at": func.min(t.c.first_seen_at, ex.first_seen_at),
+            # scalar max() is NULL if either side is NULL, hence the coalesce
+            "upload_completed_at": func.coalesce(
+                func.max(t.c.upload_completed_at, ex.upload_completed_at),
+                t.c.upload_completed_at, ex.upload_completed_at),
+            "analysis_completed_at": func.coalesce(
+                func.max(t.c.analysis_completed_at, ex.analysis_completed_at),
+                t.c.analysis_completed_at, ex.analysis_completed_at),
+            "review_completed_at": func.coalesce(
+                func.max(t.c.review_completed_at, ex.review_completed_at),
+                t.c.review_completed_at, ex.review_completed_at),
+            "upload_completed_n": t.c.upload_completed_n + ex.upload_completed_n,
+            "analysis_completed_n": t.c.analysis_completed_n + ex.analysis_completed_n,
+        },
+    )
+    db.execute(stmt, list(rows.values()))
+
+
+def _latest(a: Optional[datetime], b: datetime) -> datetime:
+    return b if a is None or b > a else a
+
+
+def _us(col):
+    # stored as 'YYYY-MM-DD HH:MM:SS.ffffff' -> whole microseconds since epoch
+    return cast(func.strftime("%s", col), Integer) * 1000000 + cast(func.substr(col, 21, 6), Integer)
+
+
+def time_to_analysis(
+    db: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    percentiles: bool = True,
+) -> Dict[str, Any]:
+    cold = _replayed(db, since, until)
+    extra = None if cold is None else {(): [d for _, d in cold]}
+    stats = tta_stats(db, _pairs(since, until, replay=cold is None), percentiles=percentiles, extra=extra)
+    return stats.get((), time_to_analysis_from_totals(0, 0, None, None, {}))
+
+
+def _simple_pairs(since: Optional[datetime], until: Optional[datetime]):
+    """Delta expression and filters for entities with a single upload -> analysis pair."""
+    up = EntityProgress.upload_completed_at
+    an = EntityProgress.analysis_completed_at
+    filters = [up < an, EntityProgress.analysis_completed_n == 1, EntityProgress.upload_completed_n == 1]
+    if since:
+        # an >= since is implied, but lets the analysis_completed_at index bound the range
+        filters += [up >= since, an >= since]
+    if until:
+        filters.append(an <= until)
+    return _us(an) - _us(up), filters
+
+
+def analysis_pairs(since: Optional[datetime] = None, until: Optional[datetime] = None, entities=None) -> Select:
+    """
+    (analysis_at, delta) for every upload -> analysis pair in the window, paired
+    inside SQLite exactly like analytics._tta_pairs(): events in (timestamp, id)
+    order, each analysis_completed against the entity's latest earlier
+    data_upload_completed, negative deltas dropped. The latest earlier upload is
+    a running MAX over the preceding rows of the entity (LAG would stop at the
+    previous row, whatever its type). `entities` optionally restricts the scan.
+    """
+    upload_at = func.max(case((Event.event_type == "data_upload_completed", Event.timestamp))).over(
+        partition_by=Event.entity_id, order_by=(Event.timestamp, Event.id), rows=(None, -1)
+    )
+    q = select(Event.event_type, Event.timestamp, upload_at.label("upload_at"))
+    if entities is None:
+        q = q.where(Event.event_type.in_(("data_upload_completed", "analysis_completed")))
+    else:
+        # no type filter, so the (entity_id, timestamp) index drives the scan
+        # and already yields the window's (entity_id, timestamp, id) order
+        q = q.where(Event.entity_id.in_(entities))
+    if since:
+        q = q.where(Event.timestamp >= since)
+    if until:
+        q = q.where(Event.timestamp <= until)
+    w = q.subquery()
+    delta = _us(w.c.timestamp) - _us(w.c.upload_at)
+    return select(w.c.timestamp.label("analysis_at"), delta.label("delta")).where(
+        w.c.event_type == "analysis_completed", w.c.upload_at.is_not(None), delta >= 0
+    )
+
+
+def _pairs(since: Optional[datetime], until: Optional[datetime], replay: bool = True):
+    """All pairs of the window: single pairs from entity_progress, the rest paired from events (unless replay=False)."""
+    delta, filters = _simple_pairs(since, until)
+    simple = select(EntityProgress.analysis_completed_at.label("analysis_at"), delta.label("delta")).where(*filters)
+    if not replay:
+        return simple.subquery()
+    # found through the partial index, then one (entity_id, timestamp) range each
+    entities = select(EntityProgress.entity_id).where(text(PROGRESS_NEEDS_REPLAY))
+    return union_all(simple, analysis_pairs(since, until, entities)).subquery()
+
+
+def _replayed(db: Session, since: Optional[datetime], until: Optional[datetime]) -> Optional[List[Tuple[int, int]]]:
+    """
+    (analysis_at µs, delta) for the replayed entities when the window has
+    archived events, or None to pair them in SQL. Their hot and archived
+    upload/analysis events are merged in (timestamp, id) order and paired like
+    analysis_pairs().
+    """
+    if not archive.segments(db, since, until):
+        return None
+    types = ("data_upload_completed", "analysis_completed")
+    entities = select(EntityProgress.entity_id).where(text(PROGRESS_NEEDS_REPLAY))
+    q = select(_us(Event.timestamp), Event.id, Event.entity_id, Event.event_type).where(
+        Event.entity_id.in_(entities), Event.event_type.in_(types)
+    )
+    if since:
+        q = q.where(Event.timestamp >= since)
+    if until:
+        q = q.where(Event.timestamp <= until)
+    rows = [tuple(r) for r in db.execute(q)]
+    rows += archive.entity_rows(db, db.execute(entities).scalars().all(), types, since, until)
+
+    upload_at: Dict[str, int] = {}
+    pairs = []
+    for us, _, entity_id, event_type in sorted(rows):
+        if event_type == "data_upload_completed":
+            upload_at[entity_id] = us
+        elif entity_id in upload_at and us >= upload_at[entity_id]:
+            pairs.append((us, us - upload_at[entity_id]))
+    return pairs
+
+
+def tta_stats(
+    db: Session,
+    pairs,
+    group=None,
+    percentiles: bool = True,
+    extra: Optional[Dict[tuple, List[int]]] = None,
+) -> Dict[tuple, Dict[str, Any]]:
+    """
+    time_to_analysis dicts for an (analysis_at, delta) subquery, per value of the
+    optional `group` expression (keyed by 1-tuples, or () without a group).
+    count/avg/min/max are aggregated in SQL. Percentiles are exact while the
+    whole subquery has at most SKETCH_EXACT_MAX pairs (just those deltas are
+    read back), otherwise a DDSketch built from GROUP BY dd_key. `extra`
+    deltas paired outside SQL are folded in under the same keys.
+    """
+    cols = [] if group is None else [group.label("g")]
+    d = pairs.c.delta
+    totals = {
+        tuple(r[:len(cols)]): tuple(r[len(cols):])
+        for r in db.execute(
+            select(*cols, func.count(), func.sum(d), func.min(d), func.max(d)).select_from(pairs).group_by(*cols)
+        )
+        if r[len(cols)]
+    }
+    extra = {k: ds for k, ds in (extra or {}).items() if ds}
+    exact = sum(t[0] for t in totals.values()) + sum(map(len, extra.values())) <= SKETCH_EXACT_MAX
+
+    acc: Dict[tuple, DeltaStats] = {}
+    for k, t in totals.items():
+        acc[k] = DeltaStats(exact)
+        acc[k].add_totals(*t)
+    if not percentiles:
+        for k, ds in extra.items():
+            acc.setdefault(k, DeltaStats(exact)).add_totals(len(ds), sum(ds), min(ds), max(ds))
+        return {k: time_to_analysis_from_totals(st.count, st.total, st.min, st.max, {}, not exact) for k, st in acc.items()}
+
+    if exact:
+        for row in db.execute(select(*cols, d).select_from(pairs)):
+            acc[tuple(row[:-1])].values.append(row[-1])
+    else:
+        key = func.dd_key(d)
+        for row in db.execute(select(*cols, key, func.count()).select_from(pairs).group_by(*cols, key)):
+            acc[tuple(row[:-2])].sketch.add_bin(*row[-2:])
+    for k, ds in extra.items():
+        acc.setdefault(k, DeltaStats(exact)).extend(ds)
+    return {k: time_to_analysis_from_stats(st) for k, st in acc.items()}
+
+
+def time_to_analysis_by_bucket(
+    db: Session,
+    bucket: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Dict[datetime, Dict[str, Any]]:
+    """time_to_analysis() split by the hour/day bucket of each pair's analysis_completed event."""
+    cold = _replayed(db, since, until)
+    extra: Optional[Dict[tuple, List[int]]] = None
+    if cold is not None:
+        width = archive.bucket_us(bucket)
+        extra = {}
+        for us, delta in cold:
+            # same text as bucket_expr() gives for the SQL pairs
+            extra.setdefault((archive.from_us(us - us % width).isoformat(" "),), []).append(delta)
+    pairs = _pairs(since, until, replay=cold is None)
+    stats = tta_stats(db, pairs, bucket_expr(pairs.c.analysis_at, bucket), extra=extra)
+    return {datetime.fromisoformat(k): v for (k,), v in stats.items()}
+
+
+def entity_funnel(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+    """Submissions first seen in the window, by how far down FUNNEL_STEPS they got."""
+    q = db.query(EntityProgress.stage, func.count())
+    if since:
+        q = q.filter(EntityProgress.first_seen_at >= since)
+    if until:
+        q = q.filter(EntityProgress.first_seen_at <= until)
+    at_stage = dict(q.group_by(EntityProgress.stage).all())
+
+    reached = {}
+    running = 0
+    for i in range(len(FUNNEL_STEPS) - 1, -1, -1):
+        running += at_stage.get(i, 0)
+        reached[FUNNEL_STEPS[i]] = running
+    return dropoff_from_counts(reached)
+
+
+def rebuild(db: Session) -> int:
+    """Recompute entity_progress from the raw events table and the archive (backfill / repair)."""
+    db.query(EntityProgress).delete()
+    stage = case(_STAGE, value=Event.event_type, else_=-1)
+
+    def _max_ts(t):
+        return func.max(case((Event.event_type == t, Event.timestamp)))
+
+    def _n(t):
+        return func.sum(case((Event.event_type == t, 1), else_=0))
+
+    select = db.query(
+        Event.entity_id,
+        func.max(stage),
+        func.min(Event.timestamp),
+        _max_ts("data_upload_completed"),
+        _max_ts("analysis_completed"),
+        _max_ts("clinician_review_completed"),
+        _n("data_upload_completed"),
+        _n("analysis_completed"),
+    ).group_by(Event.entity_id)
+
+    db.execute(insert(EntityProgress).from_select([
+        "entity_id", "stage", "first_seen_at",
+        "upload_completed_at", "analysis_completed_at", "review_completed_at",
+        "upload_completed_n", "analysis_completed_n",
+    ], select.statement))
+    for batch in archive.batches(db):
+        apply_events(db, batch)
+    db.commit()
+    return db.query(EntityProgress).count()
@@ -1,4 +1,26 @@
-from typing import Dict, List, Tuple, Any
+"""
+Data quality rules for lab payloads (the metadata of data_upload_completed).
+
+The rule set defaults to REQUIRED_LAB_FIELDS / RANGES; QUALITY_RULES_PATH
+names a JSON file to use instead:
+
+    {"required": ["hb", "wbc"], "ranges": {"hb": [9.0, 18.0], "glucose": [60, 200]}}
+
+evaluate() checks a whole batch at once, one NumPy column per field; the
+per-payload functions are the reference it is tested against. At ingest,
+derive_events() turns the issues into missing_required_field /
+out_of_range_value_detected events when QUALITY_EVENTS_AT_INGEST=1 (off by
+default: stored events are then exactly the ones sent).
+"""
+from __future__ import annotations
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.schemas import AnalyticsEvent
 
 REQUIRED_LAB_FIELDS = ["hb", "wbc", "glucose"]
 
@@ -8,17 +30,132 @@ RANGES = {
     "glucose": (60.0, 200.0),
 }
 
-def missing_required_fields(payload: Dict[str, Any]) -> List[str]:
-    return [f for f in REQUIRED_LAB_FIELDS if f not in payload or payload.get(f) is None]
+QUALITY_RULES_PATH = os.getenv("QUALITY_RULES_PATH")
+QUALITY_EVENTS_AT_INGEST = os.getenv("QUALITY_EVENTS_AT_INGEST", "0") == "1"
+
+# (payload index, event_type, event metadata)
+Issue = Tuple[int, str, Dict[str, Any]]
+
+
+@dataclass
+class QualityRules:
+    required: List[str] = field(default_factory=lambda: list(REQUIRED_LAB_FIELDS))
+    ranges: Dict[str, Tuple[float, float]] = field(default_factory=lambda: dict(RANGES))
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "QualityRules":
+        return cls(
+            required=[str(f) for f in d.get("required", [])],
+            ranges={str(f): (float(lo), float(hi)) for f, (lo, hi) in d.get("ranges", {}).items()},
+        )
+
+
+def load_rules(path: Optional[str] = QUALITY_RULES_PATH) -> QualityRules:
+    if not path:
+        return QualityRules()
+    with open(path) as f:
+        return QualityRules.from_dict(json.load(f))
+
+
+RULES = load_rules()
 
-def out_of_range_fields(payload: Dict[str, Any]) -> List[Tuple[str, float, float, float]]:
+
+def missing_required_fields(payload: Dict[str, Any], rules: Optional[QualityRules] = None) -> List[str]:
+    rules = rules or RULES
+    return [f for f in rules.required if f not in payload or payload.get(f) is None]
+
+def out_of_range_fields(payload: Dict[str, Any], rules: Optional[QualityRules] = None) -> List[Tuple[str, float, float, float]]:
+    rules = rules or RULES
     issues = []
-    for field, (mn, mx) in RANGES.items():
-        if field in payload and payload[field] is not None:
+    for name, (mn, mx) in rules.ranges.items():
+        if name in payload and payload[name] is not None:
             try:
-                v = float(payload[field])
+                v = float(payload[name])
                 if v < mn or v > mx:
-                    issues.append((field, v, mn, mx))
+                    issues.append((name, v, mn, mx))
             except (ValueError, TypeError):
-                issues.append((field, float("nan"), mn, mx))
+                issues.append((name, float("nan"), mn, mx))
     return issues
+
+
+# --- batch evaluation ---
+
+def _column(payloads: Sequence[Dict[str, Any]], name: str):
+    """(present, values, invalid) arrays for one field across the batch."""
+    raw = [p.get(name) for p in payloads]
+    try:
+        # None becomes NaN; numeric strings parse like float() does
+        values = np.array(raw, dtype=np.float64)
+        if values.ndim == 1:
+            invalid = np.zeros(len(raw), dtype=bool)
+            present = ~np.isnan(values)
+            # NaN is usually a missing value, but a payload can hold NaN itself
+            for i in np.flatnonzero(~present).tolist():
+                present[i] = raw[i] is not None
+            return present, values, invalid
+    except (ValueError, TypeError):
+        pass
+    # something in the column is not a number: convert one by one
+    values, invalid = [], []
+    for v in raw:
+        try:
+            values.append(float(v) if v is not None else np.nan)
+            invalid.append(False)
+        except (ValueError, TypeError):
+            values.append(np.nan)
+            invalid.append(True)
+    present = np.fromiter((v is not None for v in raw), dtype=bool, count=len(raw))
+    return present, np.array(values, dtype=np.float64), np.array(invalid, dtype=bool)
+
+
+def evaluate(payloads: Sequence[Dict[str, Any]], rules: Optional[QualityRules] = None) -> List[Issue]:
+    """
+    Every issue in the batch, ordered like the per-payload functions report
+    them: by payload, missing fields first (in rule order), then ranges.
+    """
+    rules = rules or RULES
+    if not payloads:
+        return []
+    columns = {name: _column(payloads, name) for name in dict.fromkeys([*rules.required, *rules.ranges])}
+
+    found = []  # (payload indices, event_type, metadata for index i)
+    for name in rules.required:
+        present = columns[name][0]
+        found.append((np.flatnonzero(~present), "missing_required_field", lambda i, name=name: {"field": name}))
+    for name, (lo, hi) in rules.ranges.items():
+        present, values, invalid = columns[name]
+        bad = present & (invalid | (values < lo) | (values > hi))
+
+        def meta(i, name=name, lo=lo, hi=hi, values=values, invalid=invalid):
+            return {"field": name, "value": None if invalid[i] else float(values[i]), "min": lo, "max": hi}
+        found.append((np.flatnonzero(bad), "out_of_range_value_detected", meta))
+
+    if not any(len(idx) for idx, _, _ in found):
+        return []
+    # rules were checked in reporting order; a stable sort by payload keeps it per payload
+    index = np.concatenate([idx for idx, _, _ in found])
+    rule = np.concatenate([np.full(len(idx), r) for r, (idx, _, _) in enumerate(found)])
+    order = np.argsort(index, kind="stable")
+    out: List[Issue] = []
+    for i, r in zip(index[order].tolist(), rule[order].tolist()):
+        _, event_type, meta = found[r]
+        out.append((i, event_type, meta(i)))
+    return out
+
+
+def derive_events(events: Sequence[AnalyticsEvent], rules: Optional[QualityRules] = None) -> List[AnalyticsEvent]:
+    """Quality events for the data_upload_completed events in a batch, stamped like their upload."""
+    uploads = [e for e in events if e.event_type == "data_upload_completed"]
+    if not uploads:
+        return []
+    return [
+        # built from validated events, so skip validating them again
+        AnalyticsEvent.model_construct(
+            event_type=event_type,
+            entity_id=uploads[i].entity_id,
+            timestamp=uploads[i].timestamp,
+            actor_role="system",
+            metadata=meta,
+        )
+        for i, event_type, meta in evaluate([e.metadata for e in uploads], rules)
+    ]
@@ -0,0 +1,348 @@
+"""
+Storage backends behind the routers.
+
+Routers talk to an EventRepository, never to SQLAlchemy or the store
+directly. STORAGE_BACKEND picks the implementation:
+
+- "sqlite" (default): SqlRepository over app.database; public routes get a
+  session from the read-only pool (get_read_repository).
+- "memory": MemoryRepository over the in-process app.store.STORE, for tests,
+  demos and the edge deployment. Nothing survives a restart.
+
+The read routes are async: everything they compute goes through run_read(),
+on ANALYTICS_THREADS threads of their own, and /events pages can come from an
+async driver instead (ASYNC_DATABASE_URL, see page_async()). The event loop never computes, and
+a burst of slow dashboard renders cannot take the threadpool the sync ingest
+routes run in.
+"""
+from __future__ import annotations
+import asyncio
+import contextvars
+import heapq
+import os
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from fastapi import Depends
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import aggregations, analytics, archive, partitioned, progress, segments
+from app.analytics import Summary
+from app.database import AsyncReadSessionLocal, ReadSessionLocal, SessionLocal, get_async_db
+from app.ingestion import notify_committed, record_events, with_quality_events
+from app.models import Event
+from app.schemas import AnalyticsEvent
+from app.store import STORE, EventStore, _key
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+ANALYTICS_THREADS = int(os.getenv("ANALYTICS_THREADS", "8"))
+
+EXPORT_BATCH = 1000
+
+# position in newest-first order: (timestamp, tie-breaker id)
+PageKey = Tuple[datetime, int]
+
+
+class EventRepository(ABC):
+    @abstractmethod
+    def record(self, events: List[AnalyticsEvent]) -> int:
+        """Store events durably (committed) and return how many were written."""
+
+    @abstractmethod
+    def page(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        entity_id: Optional[str] = None,
+        event_type: Optional[str] = None,
+        limit: int = 200,
+        after: Optional[PageKey] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[PageKey]]:
+        """Newest first, starting after `after`; returns the rows and the key to continue from (or None)."""
+
+    @abstractmethod
+    def export(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        entity_id: Optional[str] = None,
+        event_type: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Every matching event oldest first; must keep working after close()."""
+
+    @abstractmethod
+    def summary(self, since: Optional[datetime] = None, until: Optional[datetime] = None, distinct: bool = False) -> Summary:
+        """analytics.summarize() over the window; distinct adds distinct entities per funnel step."""
+
+    @abstractmethod
+    def entity_funnel(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def timeseries(
+        self,
+        bucket: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """analytics.bucket_metrics() for every hour/day bucket of the window."""
+
+    @abstractmethod
+    def segments(
+        self,
+        by: str,
+        bucket: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """analytics.segment_report() for actor_role or a SEGMENT_KEYS key; ValueError for anything else."""
+
+    def close(self) -> None:
+        pass
+
+
+def _row_dict(r) -> Dict[str, Any]:
+    return {
+        "event_type": r.event_type,
+        "entity_id": r.entity_id,
+        "timestamp": r.timestamp,
+        "actor_role": r.actor_role,
+        "metadata": r.event_data,
+    }
+
+
+def _filter_events(q, since, until, entity_id, event_type):
+    if since:
+        q = q.filter(Event.timestamp >= since)
+    if until:
+        q = q.filter(Event.timestamp <= until)
+    if entity_id:
+        q = q.filter(Event.entity_id == entity_id)
+    if event_type:
+        q = q.filter(Event.event_type == event_type)
+    return q
+
+
+def _page_statement(since, until, entity_id, event_type, limit, after):
+    # plain columns, shared by the sync and the async path
+    q = select(Event.event_type, Event.entity_id, Event.timestamp, Event.actor_role, Event.event_data, Event.id)
+    q = _filter_events(q, since, until, entity_id, event_type)
+    if after:
+        # keyset on (timestamp, id): every page is an index seek, however deep
+        ts, row_id = after
+        q = q.filter(Event.timestamp <= ts, or_(Event.timestamp < ts, Event.id < row_id))
+    return q.order_by(Event.timestamp.desc(), Event.id.desc()).limit(limit + 1)
+
+
+def _order(r) -> PageKey:
+    return r.timestamp, r.id
+
+
+def _with_archived(db, rows, since, until, entity_id, event_type, after, limit: int):
+    """Hot page rows merged with the archived ones that belong on the same page."""
+    bound = until
+    if after and (until is None or archive.to_us(after[0]) < archive.to_us(until)):
+        bound = after[0]
+    if not archive.segments(db, since, bound):
+        return rows
+    cold = archive.rows(db, since, bound, entity_id, event_type, descending=True)
+    if after:
+        cold = (r for r in cold if _order(r) < after)
+    merged = heapq.merge(rows, cold, key=_order, reverse=True)
+    return [r for _, r in zip(range(limit + 1), merged)]
+
+
+def _page_result(rows, limit: int) -> Tuple[List[Dict[str, Any]], Optional[PageKey]]:
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return [_row_dict(r) for r in rows], ((rows[-1].timestamp, rows[-1].id) if more else None)
+
+
+class SqlRepository(EventRepository):
+    def __init__(self, sessions: sessionmaker = SessionLocal):
+        self._sessions = sessions
+        self._db: Optional[Session] = None
+
+    @property
+    def db(self) -> Session:
+        if self._db is None:
+            self._db = self._sessions()
+        return self._db
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def record(self, events: List[AnalyticsEvent]) -> int:
+        try:
+            n = record_events(self.db, events)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return n
+
+    def page(self, since=None, until=None, entity_id=None, event_type=None, limit=200, after=None):
+        rows = self.db.execute(_page_statement(since, until, entity_id, event_type, limit, after)).all()
+        rows = _with_archived(self.db, rows, since, until, entity_id, event_type, after, limit)
+        return _page_result(rows, limit)
+
+    def export(self, since=None, until=None, entity_id=None, event_type=None):
+        # own session: request-scoped repositories are closed before streaming starts
+        db = self._sessions()
+        try:
+            # plain column rows: nothing accumulates in the identity map
+            q = db.query(Event.event_type, Event.entity_id, Event.timestamp, Event.actor_role, Event.event_data, Event.id)
+            q = _filter_events(q, since, until, entity_id, event_type)
+            q = q.order_by(Event.timestamp.asc(), Event.id.asc()).execution_options(yield_per=EXPORT_BATCH)
+            if archive.segments(db, since, until):
+                q = heapq.merge(archive.rows(db, since, until, entity_id, event_type), q, key=_order)
+            for r in q:
+                yield _row_dict(r)
+        finally:
+            db.close()
+
+    def summary(self, since=None, until=None, distinct=False) -> Summary:
+        url = self.db.get_bind().url.render_as_string(hide_password=False)
+        if partitioned.enabled(url):
+            return partitioned.summary(since, until, distinct=distinct, url=url)
+        return aggregations.summary(self.db, since=since, until=until, distinct=distinct)
+
+    def entity_funnel(self, since=None, until=None) -> Dict[str, Any]:
+        return progress.entity_funnel(self.db, since=since, until=until)
+
+    def timeseries(self, bucket, since=None, until=None) -> List[Dict[str, Any]]:
+        return aggregations.timeseries(self.db, bucket, since=since, until=until)
+
+    def segments(self, by, bucket=None, since=None, until=None) -> Dict[str, Any]:
+        counts = segments.segment_counts(self.db, by, bucket, since, until)
+        return analytics.segment_report(counts, bucket, since, until)
+
+
+def _stored_dict(e) -> Dict[str, Any]:
+    return {
+        "event_type": e.event_type,
+        "entity_id": e.entity_id,
+        "timestamp": e.timestamp,
+        "actor_role": e.actor_role,
+        "metadata": e.metadata,
+    }
+
+
+def _position(e) -> Tuple[int, int]:
+    return e.key, e.seq
+
+
+class MemoryRepository(EventRepository):
+    """Backed by an EventStore; the tie-breaker id in page keys is the insertion sequence."""
+
+    def __init__(self, store: EventStore = STORE):
+        self.store = store
+
+    def record(self, events: List[AnalyticsEvent]) -> int:
+        events = with_quality_events(events)
+        n = self.store.extend(events)
+        notify_committed(events)
+        return n
+
+    def page(self, since=None, until=None, entity_id=None, event_type=None, limit=200, after=None):
+        bound = until
+        if after and (until is None or _key(after[0]) < _key(until)):
+            bound = after[0]
+        rows = self.store.list_events(since, bound, entity_id, event_type)
+        if after:
+            rows = rows[:bisect_left(rows, (_key(after[0]), after[1]), key=_position)]
+        newest = rows[:-limit - 2:-1]
+        more = len(newest) > limit
+        newest = newest[:limit]
+        return [_stored_dict(e) for e in newest], ((newest[-1].timestamp, newest[-1].seq) if more else None)
+
+    def export(self, since=None, until=None, entity_id=None, event_type=None):
+        for e in self.store.list_events(since, until, entity_id, event_type):
+            yield _stored_dict(e)
+
+    def summary(self, since=None, until=None, distinct=False) -> Summary:
+        return self.store.summary(since, until, distinct)
+
+    def entity_funnel(self, since=None, until=None) -> Dict[str, Any]:
+        return self.store.entity_funnel(since, until)
+
+    def timeseries(self, bucket, since=None, until=None) -> List[Dict[str, Any]]:
+        counts, tta = analytics.timeseries(self.store.list_events(since, until), bucket, ordered=True)
+        return analytics.bucket_series(counts, tta, bucket, since, until)
+
+    def segments(self, by, bucket=None, since=None, until=None) -> Dict[str, Any]:
+        segments.check_dimension(by)
+        # a metadata segment comes from the entity's whole history, not just the window
+        entity = analytics.entity_segments(self.store.list_events(), by) if by != "actor_role" else None
+        counts = analytics.segment_counts(self.store.list_events(since, until), by, bucket, entity)
+        return analytics.segment_report(counts, bucket, since, until)
+
+
+def open_repository(read_only: bool = False) -> EventRepository:
+    if STORAGE_BACKEND == "memory":
+        return MemoryRepository()
+    return SqlRepository(ReadSessionLocal if read_only else SessionLocal)
+
+
+def get_repository():
+    repo = open_repository()
+    try:
+        yield repo
+    finally:
+        repo.close()
+
+
+def get_read_repository():
+    repo = open_repository(read_only=True)
+    try:
+        yield repo
+    finally:
+        repo.close()
+
+
+# --- async read path ---
+
+T = TypeVar("T")
+
+_analytics_pool = ThreadPoolExecutor(max_workers=ANALYTICS_THREADS, thread_name_prefix="analytics")
+
+
+async def run_read(fn: Callable[..., T], *args) -> T:
+    """fn(*args) on an analytics thread, off the event loop."""
+    # copied context: per-request instrumentation keeps counting in the worker
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_analytics_pool, ctx.run, fn, *args)
+
+
+async def get_async_read_db(repo: EventRepository = Depends(get_read_repository)):
+    """AsyncSession on the ASYNC_DATABASE_URL pool; None where page_async() falls back to repo.page()."""
+    if not isinstance(repo, SqlRepository) or AsyncReadSessionLocal is None:
+        yield None
+        return
+    async for db in get_async_db():
+        yield db
+
+
+async def page_async(
+    repo: EventRepository,
+    db: Optional[AsyncSession],
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    entity_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = 200,
+    after: Optional[PageKey] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[PageKey]]:
+    """EventRepository.page() for async routes."""
+    # archived windows are merged on an analytics thread, like everything computed
+    if db is None or await archive.covers_async(db, since, after[0] if after else until):
+        return await run_read(lambda: repo.page(since, until, entity_id, event_type, limit=limit, after=after))
+    rows = (await db.execute(_page_statement(since, until, entity_id, event_type, limit, after))).all()
+    return _page_result(rows, limit)
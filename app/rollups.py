@@ -0,0 +1,159 @@
+"""
+Hourly rollups of the events table.
+
+Ingest upserts (hour, event_type, actor_role) counters in the same
+transaction as the raw insert; summary queries read these rows for every
+whole hour of their window instead of scanning events.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, Optional
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app import archive
+from app.models import Event, EventRollup
+from app.schemas import AnalyticsEvent
+
+
+def wall_clock(ts: Optional[datetime]) -> Optional[datetime]:
+    """`ts` as stored: the offset dropped, not converted, so aware and naive bounds compare."""
+    return ts.replace(tzinfo=None) if ts else ts
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def is_hour_aligned(ts: Optional[datetime]) -> bool:
+    return ts is None or ts == hour_bucket(ts)
+
+
+def apply_events(db: Session, events: Iterable[AnalyticsEvent]) -> None:
+    """Add a batch of freshly ingested events to the counters (no commit)."""
+    # wall-clock hours: aware datetimes hash by instant, so 12:00+02:00 would land on 10:00
+    c = Counter((hour_bucket(wall_clock(e.timestamp)), e.event_type, e.actor_role or "") for e in events)
+    if not c:
+        return
+
+    # single-row upsert run as one executemany: compiled once, cached after that
+    t = EventRollup.__table__
+    stmt = insert(t)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["bucket", "event_type", "actor_role"],
+        set_={"count": t.c.count + stmt.excluded.count},
+    )
+    db.execute(stmt, [
+        {"bucket": b, "event_type": et, "actor_role": r, "count": n}
+        for (b, et, r), n in c.items()
+    ])
+
+
+def event_type_counts(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Counts per event_type for any [since, until] window: whole hours come
+    from the rollups, the partial hours at either edge (and events stamped
+    exactly at `until`) from the raw table, so raw reads stay under two hours.
+    """
+    since, until = wall_clock(since), wall_clock(until)
+    lo = since if is_hour_aligned(since) else hour_bucket(since) + timedelta(hours=1)
+    hi = until if is_hour_aligned(until) else hour_bucket(until)
+
+    if since and until and lo >= hi:
+        # window inside a single hour
+        return _raw_counts(db, since, until, upper_inclusive=True)
+
+    q = db.query(EventRollup.event_type, func.sum(EventRollup.count))
+    if lo:
+        q = q.filter(EventRollup.bucket >= lo)
+    if hi:
+        q = q.filter(EventRollup.bucket < hi)
+    counts = {t: int(n) for t, n in q.group_by(EventRollup.event_type).all()}
+
+    edges = []
+    if since and since < lo:
+        edges.append(_raw_counts(db, since, lo))
+    if until:
+        edges.append(_raw_counts(db, hi, until, upper_inclusive=True))
+    for edge in edges:
+        for t, n in edge.items():
+            counts[t] = counts.get(t, 0) + n
+    return counts
+
+
+def bucket_expr(col, bucket: str):
+    """SQL for the hour/day bucket of a stored timestamp ('YYYY-MM-DD HH:MM:SS.ffffff')."""
+    if bucket == "day":
+        return func.substr(col, 1, 10).op("||")(" 00:00:00")
+    return func.substr(col, 1, 13).op("||")(":00:00")
+
+
+def bucketed_counts(
+    db: Session,
+    bucket: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Dict[datetime, Dict[str, int]]:
+    """event_type counts per hour/day bucket; same rollup/raw-edge split as event_type_counts()."""
+    since, until = wall_clock(since), wall_clock(until)
+    lo = since if is_hour_aligned(since) else hour_bucket(since) + timedelta(hours=1)
+    hi = until if is_hour_aligned(until) else hour_bucket(until)
+    out: Dict[datetime, Dict[str, int]] = {}
+
+    if since and until and lo >= hi:
+        _add_bucketed(out, _raw_bucketed(db, bucket, since, until, upper_inclusive=True))
+        return out
+
+    b = bucket_expr(EventRollup.bucket, bucket)
+    q = db.query(b, EventRollup.event_type, func.sum(EventRollup.count))
+    if lo:
+        q = q.filter(EventRollup.bucket >= lo)
+    if hi:
+        q = q.filter(EventRollup.bucket < hi)
+    _add_bucketed(out, q.group_by(b, EventRollup.event_type).all())
+
+    if since and since < lo:
+        _add_bucketed(out, _raw_bucketed(db, bucket, since, lo))
+    if until:
+        _add_bucketed(out, _raw_bucketed(db, bucket, hi, until, upper_inclusive=True))
+    return out
+
+
+def _raw_bucketed(db: Session, bucket: str, start: datetime, end: datetime, upper_inclusive: bool = False):
+    b = bucket_expr(Event.timestamp, bucket)
+    q = db.query(b, Event.event_type, func.count(Event.id)).filter(Event.timestamp >= start)
+    q = q.filter(Event.timestamp <= end if upper_inclusive else Event.timestamp < end)
+    return q.group_by(b, Event.event_type).all() + archive.bucketed_counts(db, bucket, start, end, upper_inclusive)
+
+
+def _add_bucketed(out: Dict[datetime, Dict[str, int]], rows) -> None:
+    for b, t, n in rows:
+        c = out.setdefault(datetime.fromisoformat(b), {})
+        c[t] = c.get(t, 0) + int(n)
+
+
+def _raw_counts(db: Session, start: datetime, end: datetime, upper_inclusive: bool = False) -> Dict[str, int]:
+    q = db.query(Event.event_type, func.count(Event.id)).filter(Event.timestamp >= start)
+    q = q.filter(Event.timestamp <= end if upper_inclusive else Event.timestamp < end)
+    counts = dict(q.group_by(Event.event_type).all())
+    for t, n in archive.type_counts(db, start, end, upper_inclusive).items():
+        counts[t] = counts.get(t, 0) + n
+    return counts
+
+
+def rebuild(db: Session) -> int:
+    """Recompute every rollup row from the raw events table and the archive (backfill / repair)."""
+    db.query(EventRollup).delete()
+    # timestamps are stored as 'YYYY-MM-DD HH:MM:SS.ffffff'; keep the hour part
+    db.execute(text("""
+        INSERT INTO event_rollups (bucket, event_type, actor_role, count)
+        SELECT substr(timestamp, 1, 13) || ':00:00.000000', event_type, coalesce(actor_role, ''), count(*)
+        FROM events
+        GROUP BY 1, 2, 3
+    """))
+    for batch in archive.batches(db):
+        apply_events(db, batch)
+    db.commit()
+    return db.query(EventRollup).count()
@@ -1,41 +1,80 @@
-﻿from fastapi import APIRouter, Depends
+﻿from fastapi import APIRouter, Depends, Request
 from fastapi.responses import HTMLResponse
 from datetime import datetime
-from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.models import Event
-from app.analytics import (
-    success_rate,
-    funnel_counts,
-    top_quality_issues,
-    explainable_insights,
-)
+from app.analytics import Summary
+from app.repository import EventRepository, get_read_repository, run_read
+from app.cache import public_cache
+from app import snapshots
 
 router = APIRouter(tags=["dashboard"])
 
 
-def _fetch_events_for_dashboard(db: Session):
-    rows = db.query(Event).order_by(Event.timestamp.asc()).all()
-
-    # minimal event-like objects expected by analytics funcs
-    class E:
-        def __init__(self, event_type, entity_id, timestamp):
-            self.event_type = event_type
-            self.entity_id = entity_id
-            self.timestamp = timestamp
-
-    return [E(r.event_type, r.entity_id, r.timestamp) for r in rows]
-
-
 @router.get("/dashboard", response_class=HTMLResponse)
-def dashboard(db: Session = Depends(get_db)):
-    events = _fetch_events_for_dashboard(db)
-
-    sr = success_rate(events)
-    funnel = funnel_counts(events)
-    quality = top_quality_issues(events)
-    insights = explainable_insights(events)
+async def dashboard(request: Request, repo: EventRepository = Depends(get_read_repository)):
+    hit = snapshots.current("all")
+    if hit is not None:
+        snap, w = hit
+        as_of = f"Snapshot {snap.version}, computed {snap.computed_at:%Y-%m-%d %H:%M:%S} UTC."
+        return snapshots.respond(request, snap, "dashboard", lambda: _render(w.summary, as_of).encode("utf-8"),
+                                 "text/html; charset=utf-8")
+    return await run_read(public_cache.respond, request, "dashboard",
+                          lambda: (_render(repo.summary()).encode("utf-8"), "text/html; charset=utf-8"))
+
+
+# Plain string (not part of the f-string below) so the JS braces stay as they are.
+# The card fills itself from the SSE feed; reloading the page is never needed for it.
+LIVE_CARD = """
+        <div class="card">
+          <h2>Live</h2>
+          <p class="muted">Ingested in the last 5 / 15 / 60 minutes, pushed as it happens.</p>
+          <table id="live-table" cellpadding="4">
+            <thead><tr><th></th><th>5 min</th><th>15 min</th><th>60 min</th></tr></thead>
+            <tbody></tbody>
+          </table>
+          <p class="muted" id="live-status">connecting…</p>
+        </div>
+        <script>
+          (function () {
+            const windows = ["5m", "15m", "60m"];
+            const rows = [
+              ["Events", w => w.events],
+              ["Events / min", w => w.events_per_minute],
+              ["Uploads started", w => w.funnel.data_upload_started],
+              ["Uploads completed", w => w.funnel.data_upload_completed],
+              ["Success rate", w => w.funnel.data_upload_started ? Math.round(w.success_rate * 100) + "%" : "–"],
+              ["Analyses completed", w => w.funnel.analysis_completed],
+              ["Quality issues", w => Object.values(w.quality_issues).reduce((a, b) => a + b, 0)],
+            ];
+            let state = {};
+            function merge(into, delta) {
+              for (const k in delta) {
+                const v = delta[k];
+                if (v && typeof v === "object" && into[k] && typeof into[k] === "object") merge(into[k], v);
+                else into[k] = v;
+              }
+            }
+            function render() {
+              document.querySelector("#live-table tbody").innerHTML = rows.map(([label, f]) =>
+                "<tr><td>" + label + "</td>" + windows.map(w => "<td><b>" + f(state[w]) + "</b></td>").join("") + "</tr>"
+              ).join("");
+              document.getElementById("live-status").textContent = "updated " + new Date().toLocaleTimeString();
+            }
+            const es = new EventSource("/public/metrics/live/stream");
+            es.addEventListener("snapshot", e => { state = JSON.parse(e.data); render(); });
+            es.addEventListener("delta", e => { merge(state, JSON.parse(e.data)); render(); });
+            es.onerror = () => { document.getElementById("live-status").textContent = "reconnecting…"; };
+          })();
+        </script>
+"""
+
+
+def _render(s: Summary, as_of: str = "Computed on request.") -> str:
+
+    sr = s.success_rate
+    funnel = s.funnel
+    quality = s.quality_issues
+    insights = s.insights
 
     def li(items):
         return "".join(f"<li>{x}</li>" for x in items)
@@ -60,8 +99,9 @@ def dashboard(db: Session = Depends(get_db)):
         <h1>Medical Web Analytics & Data Quality Monitor</h1>
         <p class="muted">
           Public, read-only dashboard. Metrics are computed from the database.
+          {as_of}
         </p>
-        <p>Total events in DB: <b>{len(events)}</b></p>
+        <p>Total events in DB: <b>{s.total_events}</b></p>
 
         <div class="grid">
           <div class="card">
@@ -78,6 +118,8 @@ def dashboard(db: Session = Depends(get_db)):
           </div>
         </div>
 
+        {LIVE_CARD}
+
         <div class="card">
           <h2>Funnel</h2>
           <ul>{li([f"{k}: {v}" for k, v in funnel.items()])}</ul>
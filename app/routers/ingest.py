@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends
-from typing import List, Optional
+import base64
+import csv
+import io
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional
 from datetime import datetime
-from sqlalchemy.orm import Session
 
 from app.schemas import AnalyticsEvent
-from app.database import get_db
-from app.models import Event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repository import EXPORT_BATCH, EventRepository, get_async_read_db, get_read_repository, get_repository, page_async
 from app.security import require_api_key
+from app.ingestion import BodyTooLarge, ndjson_lines, validate_lines, NDJSON_CHUNK_LINES
+from app.ingest_queue import ingest_queue, INGEST_MODE
 
 router = APIRouter(tags=["ingest"])
 
@@ -14,73 +22,162 @@ router = APIRouter(tags=["ingest"])
 @router.post("/events", status_code=201)
 def ingest_event(
     event: AnalyticsEvent,
-    db: Session = Depends(get_db),
+    response: Response,
+    repo: EventRepository = Depends(get_repository),
     _: bool = Depends(require_api_key),
 ):
-    db_event = Event(
-        event_type=event.event_type,
-        entity_id=event.entity_id,
-        timestamp=event.timestamp,
-        actor_role=event.actor_role,
-        event_data=event.metadata,
-    )
-    db.add(db_event)
-    db.commit()
+    if INGEST_MODE == "queued":
+        if not ingest_queue.put(event):
+            raise HTTPException(status_code=503, detail="Ingest queue full, retry later", headers={"Retry-After": "1"})
+        response.status_code = 202
+        return {"status": "queued"}
+
+    repo.record([event])
     return {"status": "recorded"}
 
 
 @router.post("/events/bulk", status_code=201)
 def ingest_bulk(
     events: List[AnalyticsEvent],
-    db: Session = Depends(get_db),
+    repo: EventRepository = Depends(get_repository),
     _: bool = Depends(require_api_key),
 ):
-    for event in events:
-        db_event = Event(
-            event_type=event.event_type,
-            entity_id=event.entity_id,
-            timestamp=event.timestamp,
-            actor_role=event.actor_role,
-            event_data=event.metadata,
-        )
-        db.add(db_event)
-
-    db.commit()
+    repo.record(events)
     return {"status": "recorded", "count": len(events)}
 
 
+@router.get("/events/queue")
+async def ingest_queue_stats(_: bool = Depends(require_api_key)):
+    return ingest_queue.stats()
+
+
+MAX_REPORTED_ERRORS = 100
+
+
+@router.post("/events/ndjson", status_code=201)
+async def ingest_ndjson(
+    request: Request,
+    repo: EventRepository = Depends(get_repository),
+    _: bool = Depends(require_api_key),
+):
+    """
+    Stream newline-delimited events (optionally `Content-Encoding: gzip`).
+    Lines are validated and committed in chunks; invalid lines are reported
+    per line number and skipped instead of failing the whole batch. A body
+    that inflates past NDJSON_MAX_BYTES is cut off with 413; chunks committed
+    before that point stay recorded.
+    """
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+
+    def write_chunk(lines):
+        # validation and the insert run off the event loop
+        events, errs = validate_lines(lines)
+        repo.record(events)
+        return len(events), errs
+
+    recorded = 0
+    rejected = 0
+    errors = []
+    chunk = []
+    try:
+        async for item in ndjson_lines(request.stream(), gzipped=gzipped):
+            chunk.append(item)
+            if len(chunk) < NDJSON_CHUNK_LINES:
+                continue
+            n, errs = await run_in_threadpool(write_chunk, chunk)
+            recorded, rejected = recorded + n, rejected + len(errs)
+            errors.extend(errs[:MAX_REPORTED_ERRORS - len(errors)])
+            chunk = []
+    except BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"{e}; {recorded} events recorded before the cut-off")
+    if chunk:
+        n, errs = await run_in_threadpool(write_chunk, chunk)
+        recorded, rejected = recorded + n, rejected + len(errs)
+        errors.extend(errs[:MAX_REPORTED_ERRORS - len(errors)])
+
+    return {"status": "recorded", "count": recorded, "rejected": rejected, "errors": errors}
+
+
+def _encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = json.dumps([ts.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/events")
-def get_events(
+async def get_events(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    entity_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    repo: EventRepository = Depends(get_read_repository),
+    db: Optional[AsyncSession] = Depends(get_async_read_db),
+    _: bool = Depends(require_api_key),
+):
+    """Newest first. Pass `next_cursor` back as `cursor` for the next page."""
+    after = _decode_cursor(cursor) if cursor else None
+    events, last = await page_async(repo, db, since, until, entity_id, event_type, limit=limit, after=after)
+    next_cursor = _encode_cursor(*last) if last else None
+
+    return {"count": len(events), "events": events, "next_cursor": next_cursor}
+
+
+_EXPORT_FIELDS = ["event_type", "entity_id", "timestamp", "actor_role", "metadata"]
+
+
+@router.get("/events/export")
+def export_events(
     since: Optional[datetime] = None,
     until: Optional[datetime] = None,
     entity_id: Optional[str] = None,
     event_type: Optional[str] = None,
-    limit: int = 200,
-    db: Session = Depends(get_db),
+    format: Literal["ndjson", "csv"] = "ndjson",
+    repo: EventRepository = Depends(get_repository),
     _: bool = Depends(require_api_key),
 ):
-    q = db.query(Event)
-
-    if since:
-        q = q.filter(Event.timestamp >= since)
-    if until:
-        q = q.filter(Event.timestamp <= until)
-    if entity_id:
-        q = q.filter(Event.entity_id == entity_id)
-    if event_type:
-        q = q.filter(Event.event_type == event_type)
-
-    rows = q.order_by(Event.timestamp.desc()).limit(limit).all()
-
-    # Convert DB rows -> schema-like JSON (same shape as before)
-    events = []
-    for r in rows:
-        events.append({
-            "event_type": r.event_type,
-            "entity_id": r.entity_id,
-            "timestamp": r.timestamp,
-            "actor_role": r.actor_role,
-            "metadata": r.event_data,
-        })
-
-    return {"count": len(events), "events": events}
+    """Stream matching events oldest first, row by row, as NDJSON or CSV."""
+
+    def rows():
+        return repo.export(since, until, entity_id, event_type)
+
+    def ndjson():
+        buf = []
+        for d in rows():
+            d["timestamp"] = d["timestamp"].isoformat()
+            buf.append(json.dumps(d))
+            if len(buf) >= EXPORT_BATCH:
+                yield "\n".join(buf) + "\n"
+                buf = []
+        if buf:
+            yield "\n".join(buf) + "\n"
+
+    def csv_rows():
+        out = io.StringIO()
+        w = csv.writer(out)
+        w.writerow(_EXPORT_FIELDS)
+        n = 0
+        for d in rows():
+            d["timestamp"] = d["timestamp"].isoformat()
+            d["metadata"] = json.dumps(d["metadata"])
+            w.writerow([d[f] for f in _EXPORT_FIELDS])
+            n += 1
+            if n % EXPORT_BATCH == 0:
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+        yield out.getvalue()
+
+    if format == "csv":
+        return StreamingResponse(csv_rows(), media_type="text/csv",
+                                 headers={"Content-Disposition": "attachment; filename=events.csv"})
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
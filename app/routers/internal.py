@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app import perf
+from app.security import require_api_key
+
+router = APIRouter(tags=["internal"])
+
+PROMETHEUS_TEXT = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/internal/perf")
+def internal_perf(_: bool = Depends(require_api_key)):
+    """Request, SQL, analytics and ingest metrics in Prometheus text format."""
+    return PlainTextResponse(perf.render(), media_type=PROMETHEUS_TEXT)
+
+
+@router.get("/internal/perf/profiles/{profile_id}")
+def internal_perf_profile(profile_id: str, _: bool = Depends(require_api_key)):
+    """Collapsed stacks of a request sent with `X-Profile: 1` (PERF_PROFILER=1)."""
+    body = perf.profile(profile_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired profile")
+    return PlainTextResponse(body)
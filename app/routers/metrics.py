@@ -1,57 +1,103 @@
-from fastapi import APIRouter, Depends
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import Literal, Optional
 from datetime import datetime
-from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.models import Event
+from app.repository import EventRepository, get_repository, run_read
 from app.security import require_api_key
-from app.analytics import (
-    success_rate,
-    funnel_counts,
-    dropoff,
-    top_quality_issues,
-    time_to_analysis_minutes,
-    explainable_insights,
-)
+from app.cache import public_cache
+from app import snapshots
 
 router = APIRouter(tags=["metrics"])
 
 
-def _fetch_events(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None):
-    q = db.query(Event)
-    if since:
-        q = q.filter(Event.timestamp >= since)
-    if until:
-        q = q.filter(Event.timestamp <= until)
-    rows = q.order_by(Event.timestamp.asc()).all()
-
-    # Convert DB rows to objects that look like AnalyticsEvent (minimal)
-    class E:
-        def __init__(self, event_type, entity_id, timestamp):
-            self.event_type = event_type
-            self.entity_id = entity_id
-            self.timestamp = timestamp
-
-    return [E(r.event_type, r.entity_id, r.timestamp) for r in rows]
+def _json(payload) -> JSONResponse:
+    # encoded on the analytics thread too, not on the event loop
+    return JSONResponse(jsonable_encoder(payload))
 
 
 @router.get("/metrics/summary")
-def metrics_summary(
+async def metrics_summary(
+    request: Request,
     since: Optional[datetime] = None,
     until: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    window: Optional[str] = None,
+    distinct: bool = False,
+    repo: EventRepository = Depends(get_repository),
     _: bool = Depends(require_api_key),
 ):
-    events = _fetch_events(db, since=since, until=until)
+    """`window` (all, 24h, 7d, 30d) and no window at all are served from the latest snapshot."""
+    if window is not None and (since or until):
+        raise HTTPException(status_code=400, detail="window cannot be combined with since/until")
+    if since is None and until is None and not distinct:
+        hit = snapshots.current(window or "all")
+        if hit is not None:
+            snap, w = hit
+            return snapshots.respond(request, snap, f"metrics_summary:{w.name}", lambda: _json({
+                "window": {"name": w.name, "since": w.since, "until": None},
+                **w.summary.as_dict(),
+                "entity_funnel": w.entity_funnel,
+                "snapshot": snap.meta(),
+            }).body, "application/json")
+    if window is not None:
+        try:
+            since = snapshots.window_since(window)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    return {
+    return await run_read(lambda: _json({
         "window": {"since": since, "until": until},
-        "counts": {"total_events": len(events)},
-        "success_rate": success_rate(events),
-        "funnel": funnel_counts(events),
-        "dropoff": dropoff(events),
-        "quality_issues": top_quality_issues(events),
-        "time_to_analysis_minutes": time_to_analysis_minutes(events),
-        "insights": explainable_insights(events),
-    }
+        **repo.summary(since, until, distinct=distinct).as_dict(),
+        "entity_funnel": repo.entity_funnel(since, until),
+    }))
+
+
+@router.get("/metrics/timeseries")
+async def metrics_timeseries(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    bucket: Literal["hour", "day"] = "hour",
+    repo: EventRepository = Depends(get_repository),
+    _: bool = Depends(require_api_key),
+):
+    """Funnel, success rate, quality issues and time-to-analysis per hour or day of stored (wall-clock) time."""
+    try:
+        return await run_read(lambda: _json({
+            "window": {"since": since, "until": until},
+            "bucket": bucket,
+            "buckets": repo.timeseries(bucket, since, until),
+        }))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/metrics/segments")
+async def metrics_segments(
+    by: str = "source",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    bucket: Optional[Literal["hour", "day"]] = None,
+    repo: EventRepository = Depends(get_repository),
+    _: bool = Depends(require_api_key),
+):
+    """Funnel and success rate per actor_role or metadata segment (SEGMENT_KEYS), optionally per hour/day."""
+    try:
+        return await run_read(lambda: _json({
+            "window": {"since": since, "until": until},
+            "by": by,
+            "bucket": bucket,
+            **repo.segments(by, bucket, since, until),
+        }))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/metrics/cache")
+async def metrics_cache(_: bool = Depends(require_api_key)):
+    return public_cache.stats()
+
+
+@router.get("/metrics/snapshots")
+async def metrics_snapshots(_: bool = Depends(require_api_key)):
+    return snapshots.scheduler.stats()
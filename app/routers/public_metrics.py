@@ -1,40 +1,51 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-
-from app.database import get_db
-from app.models import Event
-from app.analytics import (
-    success_rate,
-    funnel_counts,
-    dropoff,
-    top_quality_issues,
-    time_to_analysis_minutes,
-    explainable_insights,
-)
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 
-router = APIRouter(tags=["public"])
+from app.repository import EventRepository, get_read_repository, run_read
+from app.cache import public_cache
+from app import live, snapshots
 
-def _fetch_events(db: Session):
-    rows = db.query(Event).order_by(Event.timestamp.asc()).all()
+router = APIRouter(tags=["public"])
 
-    class E:
-        def __init__(self, event_type, entity_id, timestamp):
-            self.event_type = event_type
-            self.entity_id = entity_id
-            self.timestamp = timestamp
+NOTE = "Public read-only summary (no raw events)."
 
-    return [E(r.event_type, r.entity_id, r.timestamp) for r in rows]
 
 @router.get("/public/metrics/summary")
-def public_metrics_summary(db: Session = Depends(get_db)):
-    events = _fetch_events(db)
-    return {
-        "counts": {"total_events": len(events)},
-        "success_rate": success_rate(events),
-        "funnel": funnel_counts(events),
-        "dropoff": dropoff(events),
-        "quality_issues": top_quality_issues(events),
-        "time_to_analysis_minutes": time_to_analysis_minutes(events),
-        "insights": explainable_insights(events),
-        "note": "Public read-only summary (no raw events)."
-    }
+async def public_metrics_summary(request: Request, window: str = "all", repo: EventRepository = Depends(get_read_repository)):
+    hit = snapshots.current(window)
+    if hit is not None:
+        snap, w = hit
+        return snapshots.respond(request, snap, f"public_metrics_summary:{window}", lambda: JSONResponse({
+            **w.summary.as_dict(), "window": window, "note": NOTE, "snapshot": snap.meta(),
+        }).body, "application/json")
+
+    try:
+        since = snapshots.window_since(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def render():
+        payload = {
+            **repo.summary(since).as_dict(),
+            "window": window,
+            "note": NOTE,
+        }
+        return JSONResponse(payload).body, "application/json"
+
+    return await run_read(public_cache.respond, request, f"public_metrics_summary:{window}", render)
+
+
+@router.get("/public/metrics/live")
+async def public_metrics_live():
+    """Funnel counts over the last 5/15/60 minutes of ingest, from memory."""
+    return {"slot_seconds": live.live_windows.slot_seconds, "windows": live.live_windows.snapshot()}
+
+
+@router.get("/public/metrics/live/stream")
+def public_metrics_live_stream():
+    """Server-sent events: a `snapshot`, then `delta`s with the values that changed."""
+    return StreamingResponse(
+        live.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
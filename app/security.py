@@ -1,7 +1,8 @@
 import os
 from fastapi import Header, HTTPException
 
-def require_api_key(x_api_key: str | None = Header(default=None)):
+# async so FastAPI calls it on the event loop instead of a threadpool hop per request
+async def require_api_key(x_api_key: str | None = Header(default=None)):
     expected = os.getenv("ANALYTICS_API_KEY")
     if not expected:
         raise HTTPException(status_code=500, detail="Server misconfigured: ANALYTICS_API_KEY not set")
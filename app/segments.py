@@ -0,0 +1,163 @@
+"""
+Segmented funnel metrics, computed in SQL.
+
+Segments are "actor_role" (each event's own role) or one of SEGMENT_KEYS,
+metadata keys such as source/engine/decision. A metadata segment belongs to
+the entity: its value is the string on the entity's earliest event carrying
+the key, kept in entity_dimensions (one row per entity and key, upserted at
+ingest, order-independent). Every event of the entity, including the ones
+without that metadata, then counts towards the same segment, which is what
+"mobile vs web completion rate" needs: only uploads say where they came from.
+
+Counts are one GROUP BY over the funnel events of the window joined to that
+table on its primary key; nothing is parsed in Python. Archived events
+(app/archive.py) are counted from their columns, with the dimension values
+looked up for the entities they contain. Changing SEGMENT_KEYS
+needs `python rebuild_rollups.py` to backfill the new keys.
+"""
+from __future__ import annotations
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app import archive
+from app.analytics import FUNNEL, SEGMENT_UNKNOWN, SegmentCounts, earliest_values
+from app.models import EntityDimension, Event
+from app.rollups import bucket_expr
+from app.schemas import AnalyticsEvent
+
+SEGMENT_KEYS = [k.strip() for k in os.getenv("SEGMENT_KEYS", "source,engine,decision").split(",") if k.strip()]
+
+
+def dimensions() -> List[str]:
+    return ["actor_role", *SEGMENT_KEYS]
+
+
+def check_dimension(by: str) -> None:
+    if by not in dimensions():
+        raise ValueError(f"unknown segment {by!r}; one of: {', '.join(dimensions())}")
+
+
+def apply_events(db: Session, events: Iterable[AnalyticsEvent]) -> None:
+    """Fold a batch of freshly ingested events into entity_dimensions (no commit)."""
+    events = [e for e in events if e.metadata]
+    rows = [
+        {"entity_id": entity_id, "key": key, "value": v, "first_at": ts}
+        for key in SEGMENT_KEYS
+        for entity_id, (ts, v) in earliest_values(events, key).items()
+    ]
+    if not rows:
+        return
+
+    t = EntityDimension.__table__
+    stmt = insert(t)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["entity_id", "key"],
+        set_={"value": stmt.excluded.value, "first_at": stmt.excluded.first_at},
+        where=or_(
+            stmt.excluded.first_at < t.c.first_at,
+            and_(stmt.excluded.first_at == t.c.first_at, stmt.excluded.value < t.c.value),
+        ),
+    )
+    db.execute(stmt, rows)
+
+
+def rebuild(db: Session) -> int:
+    """Recompute entity_dimensions for SEGMENT_KEYS from the raw events table and the archive."""
+    db.query(EntityDimension).delete()
+    for key in SEGMENT_KEYS:
+        db.execute(text("""
+            INSERT INTO entity_dimensions (entity_id, key, value, first_at)
+            SELECT entity_id, :key, value, timestamp FROM (
+                SELECT entity_id, timestamp, json_extract(metadata, :path) AS value,
+                       row_number() OVER (
+                           PARTITION BY entity_id ORDER BY timestamp, json_extract(metadata, :path)
+                       ) AS n
+                FROM events
+                WHERE json_type(metadata, :path) = 'text'
+            ) WHERE n = 1
+        """), {"key": key, "path": f'$."{key}"'})
+    for batch in archive.batches(db):
+        apply_events(db, batch)
+    db.commit()
+    return db.query(EntityDimension).count()
+
+
+def segment_counts(
+    db: Session,
+    by: str,
+    bucket: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> SegmentCounts:
+    """analytics.segment_counts() for the window, as one grouped query."""
+    check_dimension(by)
+    if by == "actor_role":
+        seg = func.coalesce(Event.actor_role, SEGMENT_UNKNOWN)
+        q = db.query(seg, Event.event_type, func.count())
+    else:
+        seg = func.coalesce(EntityDimension.value, SEGMENT_UNKNOWN)
+        q = db.query(seg, Event.event_type, func.count()).outerjoin(
+            EntityDimension, and_(EntityDimension.entity_id == Event.entity_id, EntityDimension.key == by)
+        )
+    q = q.filter(Event.event_type.in_(FUNNEL))
+    if since:
+        q = q.filter(Event.timestamp >= since)
+    if until:
+        q = q.filter(Event.timestamp <= until)
+
+    out: SegmentCounts = {}
+    if bucket:
+        b = bucket_expr(Event.timestamp, bucket)
+        rows = q.add_columns(b).group_by(seg, Event.event_type, b)
+        for s, t, n, start in rows:
+            out.setdefault((datetime.fromisoformat(start), s), {})[t] = n
+    else:
+        for s, t, n in q.group_by(seg, Event.event_type):
+            out.setdefault((None, s), {})[t] = n
+    _add_archived(db, out, by, bucket, since, until)
+    return out
+
+
+def _dimension_values(db: Session, by: str, entity_ids: List[str]) -> Dict[str, str]:
+    values: Dict[str, str] = {}
+    for i in range(0, len(entity_ids), archive.DELETE_CHUNK):
+        chunk = entity_ids[i:i + archive.DELETE_CHUNK]
+        values.update(db.execute(
+            select(EntityDimension.entity_id, EntityDimension.value)
+            .where(EntityDimension.key == by, EntityDimension.entity_id.in_(chunk))
+        ).all())
+    return values
+
+
+def _add_archived(db: Session, out: SegmentCounts, by: str, bucket: Optional[str], since, until) -> None:
+    """Fold the window's archived funnel events into segment_counts() output."""
+    width = archive.bucket_us(bucket) if bucket else None
+    for part, lo, hi in archive.windows(db, since, until):
+        idx = np.flatnonzero(np.isin(part.event_type[lo:hi], part.type_codes(FUNNEL))) + lo
+        if not len(idx):
+            continue
+        if by == "actor_role":
+            names = [r if r is not None else SEGMENT_UNKNOWN for r in part.roles]
+            label = part.actor_role[idx].astype(np.int64)
+        else:
+            entities, label = np.unique(part.entity[idx], return_inverse=True)
+            ids = [part.entities[e] for e in entities.tolist()]
+            values = _dimension_values(db, by, ids)
+            names = [values.get(e, SEGMENT_UNKNOWN) for e in ids]
+        keys = label * len(part.types) + part.event_type[idx]
+        if width:
+            start = part.timestamp[idx] // width
+            keys = keys + (start - start.min()) * (len(names) * len(part.types))
+        for key, n in zip(*(a.tolist() for a in np.unique(keys, return_counts=True))):
+            b, rest = divmod(key, len(names) * len(part.types))
+            name, code = divmod(rest, len(part.types))
+            ts = archive.from_us((b + int(start.min())) * width) if width else None
+            c = out.setdefault((ts, names[name]), {})
+            t = part.types[code]
+            c[t] = c.get(t, 0) + n
@@ -0,0 +1,263 @@
+"""
+Mergeable streaming sketches for the summary metrics.
+
+- DDSketch: quantiles with a guaranteed relative error (ALPHA), used for the
+  time-to-analysis percentiles.
+- HyperLogLog: distinct counts in fixed memory (2**HLL_P registers), used for
+  distinct entities per funnel step.
+
+Below SKETCH_EXACT_MAX values a window is answered exactly instead. The hash
+and bucket functions are also registered on every SQLite connection
+(register_sqlite_functions), so SQL can build the very same sketches with a
+GROUP BY and both paths agree bit for bit.
+"""
+from __future__ import annotations
+import hashlib
+import math
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+SKETCH_EXACT_MAX = int(os.getenv("SKETCH_EXACT_MAX", "10000"))
+
+QUANTILES = {"p50": 0.50, "p90": 0.90, "p99": 0.99}
+
+ALPHA = 0.01
+_GAMMA = (1 + ALPHA) / (1 - ALPHA)
+_LOG_GAMMA = math.log(_GAMMA)
+
+HLL_P = 14
+_HLL_M = 1 << HLL_P
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / _HLL_M)
+
+
+# --- quantiles ---
+
+def dd_key(value: float) -> Optional[int]:
+    """DDSketch bucket of a positive value; None for zero (kept in its own bucket)."""
+    if value <= 0:
+        return None
+    return math.ceil(math.log(value) / _LOG_GAMMA)
+
+
+def exact_quantile(ordered: List[float], q: float) -> float:
+    """Value at 0-based rank floor(q * (n - 1)) of a sorted list."""
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+class DDSketch:
+    """Relative-error quantile sketch (Masson et al., 2019); non-negative values only."""
+
+    def __init__(self):
+        self.bins: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float, n: int = 1) -> None:
+        self.add_bin(dd_key(value), n)
+
+    def add_bin(self, key: Optional[int], n: int) -> None:
+        if key is None:
+            self.zeros += n
+        else:
+            self.bins[key] = self.bins.get(key, 0) + n
+        self.count += n
+
+    def merge(self, other: "DDSketch") -> None:
+        for k, n in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Within ALPHA (relative) of exact_quantile() over the same values."""
+        if not self.count:
+            return None
+        rank = int(q * (self.count - 1))
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if rank < seen:
+                return 2 * _GAMMA ** k / (_GAMMA + 1)
+        return 2 * _GAMMA ** max(self.bins) / (_GAMMA + 1)
+
+
+class DeltaStats:
+    """
+    count/avg/min/max plus percentiles for time-to-analysis deltas
+    (integer microseconds). Exact keeps the values; otherwise a DDSketch.
+    """
+
+    def __init__(self, exact: bool = True):
+        self.exact = exact
+        self.values: List[int] = []
+        self.sketch = DDSketch()
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def add(self, d: int) -> None:
+        self.add_totals(1, d, d, d)
+        if self.exact:
+            self.values.append(d)
+        else:
+            self.sketch.add(d)
+
+    def extend(self, ds: Iterable[int]) -> "DeltaStats":
+        for d in ds:
+            self.add(d)
+        return self
+
+    def add_totals(self, count: int, total: int, mn: Optional[int], mx: Optional[int]) -> None:
+        """Fold in count/sum/min/max computed elsewhere (the distribution goes in separately)."""
+        if not count:
+            return
+        self.count += count
+        self.total += total
+        self.min = mn if self.min is None else min(self.min, mn)
+        self.max = mx if self.max is None else max(self.max, mx)
+
+    def spill(self) -> None:
+        """Switch to the sketch; same bins as if every value had gone there directly."""
+        if self.exact:
+            for d in self.values:
+                self.sketch.add(d)
+            self.values = []
+            self.exact = False
+
+    def merge(self, other: "DeltaStats", exact_max: Optional[int] = None) -> "DeltaStats":
+        """Fold in another window's stats; exact while the total stays within exact_max."""
+        self.add_totals(other.count, other.total, other.min, other.max)
+        if self.exact and other.exact and self.count <= (SKETCH_EXACT_MAX if exact_max is None else exact_max):
+            self.values += other.values
+            return self
+        self.spill()
+        self.sketch.merge(other.sketch)
+        for d in other.values:
+            self.sketch.add(d)
+        return self
+
+    def quantiles(self) -> Dict[str, Optional[int | float]]:
+        if not self.count:
+            return {name: None for name in QUANTILES}
+        if self.exact:
+            ordered = sorted(self.values)
+            return {name: exact_quantile(ordered, q) for name, q in QUANTILES.items()}
+        return {name: self.sketch.quantile(q) for name, q in QUANTILES.items()}
+
+
+# --- distinct counts ---
+
+def hll_hash(item: str) -> int:
+    # stable across processes (unlike hash()), so sketches from anywhere merge
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def hll_slot(item: str) -> int:
+    """(register index << 6) | rank, the whole per-item update of a HyperLogLog."""
+    h = hll_hash(item)
+    w = h >> HLL_P
+    return ((h & (_HLL_M - 1)) << 6) | ((64 - HLL_P) - w.bit_length() + 1)
+
+
+class HyperLogLog:
+    def __init__(self):
+        self.registers = bytearray(_HLL_M)
+
+    def add(self, item: str) -> None:
+        self.add_slot(hll_slot(item))
+
+    def add_slot(self, slot: int) -> None:
+        j, rank = slot >> 6, slot & 63
+        if rank > self.registers[j]:
+            self.registers[j] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        zeros = self.registers.count(0)
+        estimate = _HLL_ALPHA * _HLL_M * _HLL_M / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * _HLL_M and zeros:
+            # small range: linear counting is far more accurate
+            estimate = _HLL_M * math.log(_HLL_M / zeros)
+        return int(round(estimate))
+
+
+class DistinctCounter:
+    """
+    Distinct items per key: exact sets while at most `exact_max` items have
+    been added in total, a HyperLogLog per key after that.
+    """
+
+    def __init__(self, keys: Iterable[str], exact_max: Optional[int] = None):
+        self.exact_max = SKETCH_EXACT_MAX if exact_max is None else exact_max
+        self.added = 0
+        self.sets: Optional[Dict[str, set]] = {k: set() for k in keys}
+        self.hlls: Dict[str, HyperLogLog] = {}
+
+    @property
+    def approximate(self) -> bool:
+        return self.sets is None
+
+    def add(self, key: str, item: str) -> None:
+        self.added += 1
+        if self.sets is not None:
+            self.sets.setdefault(key, set()).add(item)
+            if self.added > self.exact_max:
+                self._to_hll()
+        else:
+            self.hlls.setdefault(key, HyperLogLog()).add(item)
+
+    def add_many(self, key: str, items: Iterable[str], count: int) -> None:
+        """`count` add() calls for `key` whose distinct items are `items`; same end state."""
+        self.added += count
+        if self.sets is not None:
+            self.sets.setdefault(key, set()).update(items)
+            if self.added > self.exact_max:
+                self._to_hll()
+        else:
+            hll = self.hlls.setdefault(key, HyperLogLog())
+            for item in items:
+                hll.add(item)
+
+    def _to_hll(self) -> None:
+        for key, items in self.sets.items():
+            hll = self.hlls.setdefault(key, HyperLogLog())
+            for item in items:
+                hll.add(item)
+        self.sets = None
+
+    def merge(self, other: "DistinctCounter") -> "DistinctCounter":
+        """Union with another counter, switching to HyperLogLogs by the same rule as add()."""
+        self.added += other.added
+        if self.sets is not None and other.sets is not None and self.added <= self.exact_max:
+            for key, items in other.sets.items():
+                self.sets.setdefault(key, set()).update(items)
+            return self
+        if self.sets is not None:
+            self._to_hll()
+        for key, items in (other.sets or {}).items():
+            hll = self.hlls.setdefault(key, HyperLogLog())
+            for item in items:
+                hll.add(item)
+        for key, h in other.hlls.items():
+            self.hlls.setdefault(key, HyperLogLog()).merge(h)
+        return self
+
+    def counts(self) -> Dict[str, int]:
+        if self.sets is not None:
+            return {k: len(v) for k, v in self.sets.items()}
+        return {k: h.count() for k, h in self.hlls.items()}
+
+
+def distinct_result(counts: Dict[str, int], approximate: bool, keys: Iterable[str]) -> Dict[str, Any]:
+    return {"approximate": approximate, "counts": {k: counts.get(k, 0) for k in keys}}
+
+
+def register_sqlite_functions(dbapi_conn) -> None:
+    """Make dd_key()/hll_slot() callable from SQL on a sqlite3 connection."""
+    dbapi_conn.create_function("dd_key", 1, dd_key, deterministic=True)
+    dbapi_conn.create_function("hll_slot", 1, hll_slot, deterministic=True)
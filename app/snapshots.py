@@ -0,0 +1,228 @@
+"""
+Precomputed summaries for the standard windows, refreshed in the background.
+
+A scheduler thread recomputes summary() and entity_funnel() for every window
+in SNAPSHOT_WINDOWS ("all" or a trailing span such as "24h"/"7d") every
+SNAPSHOT_INTERVAL_SECONDS, or sooner once SNAPSHOT_EVERY_EVENTS events have
+been ingested since the last run. Each run publishes a new, numbered
+Snapshot by swapping one reference, so readers never see a half-built one.
+
+/metrics/summary (without since/until), /public/metrics/summary and
+/dashboard answer from the latest snapshot: the response bodies are
+rendered once per snapshot and carry its version and computed_at, with the
+data's age in the Age header. Until the first snapshot exists (or with
+SNAPSHOTS=0) those routes compute live as before.
+"""
+from __future__ import annotations
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.analytics import Summary
+from app.cache import not_modified
+from app.ingestion import on_commit
+from app.repository import open_repository
+
+log = logging.getLogger(__name__)
+
+SNAPSHOTS = os.getenv("SNAPSHOTS", "1") == "1"
+SNAPSHOT_WINDOWS = os.getenv("SNAPSHOT_WINDOWS", "all,24h,7d,30d")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "60"))
+SNAPSHOT_EVERY_EVENTS = int(os.getenv("SNAPSHOT_EVERY_EVENTS", "1000"))
+# back-to-back refreshes under heavy ingest are spaced at least this far apart
+MIN_GAP_SECONDS = 1.0
+# versions restart at 1 in every process: ETags carry this process's token too
+_PROCESS_TOKEN = uuid.uuid4().hex[:12]
+
+_SPAN = re.compile(r"^(\d+)([hd])$")
+
+
+def parse_windows(spec: str) -> Dict[str, Optional[timedelta]]:
+    """'all,24h,7d' -> {"all": None, "24h": timedelta(hours=24), "7d": timedelta(days=7)}"""
+    out: Dict[str, Optional[timedelta]] = {}
+    for name in (w.strip() for w in spec.split(",")):
+        if not name:
+            continue
+        if name == "all":
+            out[name] = None
+            continue
+        m = _SPAN.match(name)
+        if not m:
+            raise ValueError(f"bad snapshot window {name!r}; use 'all' or e.g. 24h, 7d")
+        n, unit = int(m.group(1)), m.group(2)
+        out[name] = timedelta(hours=n) if unit == "h" else timedelta(days=n)
+    return out
+
+
+@dataclass
+class WindowSnapshot:
+    name: str
+    since: Optional[datetime]
+    summary: Summary
+    entity_funnel: Dict[str, Any]
+
+
+@dataclass
+class Snapshot:
+    version: int
+    computed_at: datetime
+    seconds: float
+    windows: Dict[str, WindowSnapshot]
+    _rendered: Dict[str, bytes] = field(default_factory=dict, repr=False)
+
+    def age_seconds(self) -> float:
+        return (datetime.now(timezone.utc) - self.computed_at).total_seconds()
+
+    def meta(self) -> Dict[str, Any]:
+        return {"version": self.version, "computed_at": self.computed_at.isoformat()}
+
+    def rendered(self, key: str, render: Callable[[], bytes]) -> bytes:
+        # rendered once per snapshot; two racing renders produce the same bytes
+        body = self._rendered.get(key)
+        if body is None:
+            body = self._rendered[key] = render()
+        return body
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Age": str(int(self.age_seconds())),
+            "ETag": f'"snapshot-{_PROCESS_TOKEN}-{self.version}"',
+            "Last-Modified": format_datetime(self.computed_at.replace(microsecond=0), usegmt=True),
+            "X-Snapshot-Version": str(self.version),
+        }
+
+
+class SnapshotScheduler:
+    def __init__(
+        self,
+        windows: str = SNAPSHOT_WINDOWS,
+        interval: float = SNAPSHOT_INTERVAL,
+        every_events: int = SNAPSHOT_EVERY_EVENTS,
+    ):
+        self.windows = parse_windows(windows)
+        self.interval = interval
+        self.every_events = every_events
+        self.latest: Optional[Snapshot] = None
+        self.pending_events = 0
+        self.failures = 0
+        self._version = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="snapshot-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join(timeout)
+
+    def notify(self, n: int) -> None:
+        """Count ingested events; wakes the scheduler every SNAPSHOT_EVERY_EVENTS."""
+        with self._lock:
+            self.pending_events += n
+            due = self.every_events > 0 and self.pending_events >= self.every_events
+        if due:
+            self._wake.set()
+
+    def refresh(self) -> Snapshot:
+        """Recompute every window now and publish the result."""
+        with self._lock:
+            self.pending_events = 0
+        started = time.perf_counter()
+        computed_at = datetime.now(timezone.utc)
+        now = computed_at.replace(tzinfo=None)  # stored timestamps are wall-clock, offset dropped
+        repo = open_repository(read_only=True)
+        try:
+            windows = {}
+            for name, span in self.windows.items():
+                since = now - span if span is not None else None
+                windows[name] = WindowSnapshot(name, since, repo.summary(since), repo.entity_funnel(since))
+        finally:
+            repo.close()
+        with self._lock:
+            self._version += 1
+            snap = Snapshot(self._version, computed_at, time.perf_counter() - started, windows)
+            self.latest = snap
+        return snap
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self.latest
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "windows": list(self.windows),
+            "interval_seconds": self.interval,
+            "every_events": self.every_events,
+            "version": snap.version if snap else None,
+            "computed_at": snap.computed_at.isoformat() if snap else None,
+            "age_seconds": round(snap.age_seconds(), 3) if snap else None,
+            "refresh_seconds": round(snap.seconds, 4) if snap else None,
+            "pending_events": self.pending_events,
+            "failures": self.failures,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # cleared first: events arriving during the refresh trigger the next one
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception:
+                self.failures += 1
+                log.exception("snapshot refresh failed")
+            if self._stop.wait(MIN_GAP_SECONDS):
+                break
+            self._wake.wait(max(self.interval - MIN_GAP_SECONDS, 0))
+
+
+scheduler = SnapshotScheduler()
+
+
+@on_commit
+def _count_ingest(events) -> None:
+    scheduler.notify(len(events))
+
+
+def current(window: str = "all") -> Optional[Tuple[Snapshot, WindowSnapshot]]:
+    """(snapshot, window snapshot) to answer from, or None to compute live."""
+    if not SNAPSHOTS:
+        return None
+    snap = scheduler.latest
+    if snap is None or window not in snap.windows:
+        return None
+    return snap, snap.windows[window]
+
+
+def window_since(window: str) -> Optional[datetime]:
+    """Start of a configured window as of now, for answering it live."""
+    if window not in scheduler.windows:
+        raise ValueError(f"unknown window {window!r}; one of: {', '.join(scheduler.windows)}")
+    span = scheduler.windows[window]
+    return datetime.now(timezone.utc).replace(tzinfo=None) - span if span is not None else None
+
+
+def respond(request: Request, snap: Snapshot, key: str, render: Callable[[], bytes], media_type: str) -> Response:
+    """Serve a body rendered once per snapshot, or 304 if the client has this version."""
+    headers = snap.headers()
+    if not_modified(request, headers["ETag"], snap.computed_at.replace(microsecond=0)):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.rendered(key, render), media_type=media_type, headers=headers)
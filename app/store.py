@@ -1,37 +1,269 @@
+"""
+In-memory event store (hot cache / test and edge backend).
+
+Events are kept in timestamp order with secondary timelines per event_type
+and per entity_id, so time windows are binary searches and pruning old
+events costs O(log n) plus the number evicted. summary() computes the same
+Summary as analytics.summarize() without scanning the window.
+"""
 from __future__ import annotations
-from typing import List, Optional
-from datetime import datetime, timedelta
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from operator import attrgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.analytics import FUNNEL, Summary, _tta_deltas, _tta_stats, dropoff_from_counts, epoch_us
+from app.events import FUNNEL_STEPS, QUALITY_EVENTS
 from app.schemas import AnalyticsEvent
+from app.sketches import DistinctCounter, distinct_result
+
+_by_key = attrgetter("key")
+_STAGE = {step: i for i, step in enumerate(FUNNEL_STEPS)}
+
+
+# sort key: microseconds since the epoch of the wall-clock time, like the SQL backend
+_key = epoch_us
+
+
+class StoredEvent:
+    """Compact event record; same attributes as AnalyticsEvent."""
+    __slots__ = ("event_type", "entity_id", "timestamp", "actor_role", "metadata", "key", "seq")
+
+    def __init__(self, e: AnalyticsEvent, seq: int):
+        self.event_type = e.event_type
+        self.entity_id = e.entity_id
+        # offset dropped as SQLite stores it, so pairing and buckets agree with the key
+        self.timestamp = e.timestamp.replace(tzinfo=None)
+        self.actor_role = e.actor_role
+        self.metadata = e.metadata
+        self.key = _key(e.timestamp)
+        self.seq = seq
+
+    def __repr__(self) -> str:
+        return f"StoredEvent({self.event_type!r}, {self.entity_id!r}, {self.timestamp.isoformat()})"
+
+
+class _Timeline:
+    """
+    Events sorted by key, equal keys in insertion order. Evicted items are
+    skipped with a head offset and only compacted once they make up half the
+    list, so eviction is amortized O(log n + k).
+    """
+    __slots__ = ("keys", "items", "head")
+
+    def __init__(self):
+        self.keys: List[int] = []
+        self.items: List[StoredEvent] = []
+        self.head = 0
+
+    def __len__(self) -> int:
+        return len(self.items) - self.head
+
+    def add(self, e: StoredEvent) -> None:
+        if not self.keys or e.key >= self.keys[-1]:
+            self.keys.append(e.key)
+            self.items.append(e)
+        else:
+            i = max(bisect_right(self.keys, e.key), self.head)
+            self.keys.insert(i, e.key)
+            self.items.insert(i, e)
+
+    def bounds(self, lo: Optional[int], hi: Optional[int]):
+        start = self.head if lo is None else bisect_left(self.keys, lo, self.head)
+        stop = len(self.keys) if hi is None else bisect_right(self.keys, hi, self.head)
+        return start, stop
+
+    def range(self, lo: Optional[int] = None, hi: Optional[int] = None) -> List[StoredEvent]:
+        start, stop = self.bounds(lo, hi)
+        return self.items[start:stop]
+
+    def count(self, lo: Optional[int] = None, hi: Optional[int] = None) -> int:
+        start, stop = self.bounds(lo, hi)
+        return max(0, stop - start)
+
+    def first(self, lo: Optional[int] = None, hi: Optional[int] = None) -> Optional[StoredEvent]:
+        start, stop = self.bounds(lo, hi)
+        return self.items[start] if start < stop else None
+
+    def evict_before(self, cutoff: int) -> List[StoredEvent]:
+        stop = bisect_left(self.keys, cutoff, self.head)
+        evicted = self.items[self.head:stop]
+        self.head = stop
+        if self.head and self.head * 2 >= len(self.items):
+            del self.keys[:self.head]
+            del self.items[:self.head]
+            self.head = 0
+        return evicted
+
+
+class EventStore:
+    def __init__(self, events: Iterable[AnalyticsEvent] = ()):
+        self._lock = threading.RLock()
+        self.clear()
+        self.extend(events)
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def __iter__(self) -> Iterator[StoredEvent]:
+        return iter(self.list_events())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._all = _Timeline()
+            # per entity a plain sorted list: most entities only have a handful of events
+            self._by_entity: Dict[str, List[StoredEvent]] = {}
+            self._by_type: Dict[str, _Timeline] = {}
+            self._seq = 0
+
+    def add(self, e: AnalyticsEvent) -> StoredEvent:
+        with self._lock:
+            rec = StoredEvent(e, self._seq)
+            self._seq += 1
+            self._all.add(rec)
+            tl = self._by_type.get(rec.event_type)
+            if tl is None:
+                tl = self._by_type[rec.event_type] = _Timeline()
+            tl.add(rec)
+            mine = self._by_entity.get(rec.entity_id)
+            if mine is None:
+                self._by_entity[rec.entity_id] = [rec]
+            elif rec.key >= mine[-1].key:
+                mine.append(rec)
+            else:
+                insort(mine, rec, key=_by_key)
+            return rec
+
+    def extend(self, events: Iterable[AnalyticsEvent]) -> int:
+        n = 0
+        with self._lock:
+            for e in events:
+                self.add(e)
+                n += 1
+        return n
+
+    def list_events(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        entity_id: Optional[str] = None,
+        event_type: Optional[str] = None,
+    ) -> List[StoredEvent]:
+        """Matching events in timestamp order, read off the narrowest index."""
+        lo = _key(since) if since else None
+        hi = _key(until) if until else None
+        with self._lock:
+            if entity_id:
+                mine = self._by_entity.get(entity_id, [])
+                start = 0 if lo is None else bisect_left(mine, lo, key=_by_key)
+                stop = len(mine) if hi is None else bisect_right(mine, hi, key=_by_key)
+                out = mine[start:stop]
+                if event_type:
+                    out = [e for e in out if e.event_type == event_type]
+                return out
+            if event_type:
+                tl = self._by_type.get(event_type)
+                return tl.range(lo, hi) if tl else []
+            return self._all.range(lo, hi)
+
+    def counts(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, int]:
+        """Events per type in the window, in order of first occurrence (like a scan would see them)."""
+        lo = _key(since) if since else None
+        hi = _key(until) if until else None
+        with self._lock:
+            firsts = []
+            for t, tl in self._by_type.items():
+                first = tl.first(lo, hi)
+                if first is not None:
+                    firsts.append((first.key, first.seq, t, tl.count(lo, hi)))
+        return {t: n for _, _, t, n in sorted(firsts)}
+
+    def summary(self, since: Optional[datetime] = None, until: Optional[datetime] = None, distinct: bool = False) -> Summary:
+        """analytics.summarize() over the window, from per-type counts and the paired subset only."""
+        counts = self.counts(since, until)
+        entities = None
+        if distinct:
+            entities = DistinctCounter(FUNNEL)
+            for t in FUNNEL:
+                for e in self.list_events(since, until, event_type=t):
+                    entities.add(t, e.entity_id)
+            entities = distinct_result(entities.counts(), entities.approximate, FUNNEL)
+        quality = sorted(((t, n) for t, n in counts.items() if t in QUALITY_EVENTS), key=lambda x: x[1], reverse=True)
+        pairing = heapq.merge(
+            self.list_events(since, until, event_type="data_upload_completed"),
+            self.list_events(since, until, event_type="analysis_completed"),
+            key=lambda e: (e.key, e.seq),
+        )
+        return Summary.from_counts(counts, dict(quality), _tta_stats(_tta_deltas(pairing)), entities)
+
+    def entity_funnel(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Entities first seen in the window, by furthest FUNNEL_STEPS stage (as progress.entity_funnel)."""
+        lo = _key(since) if since else None
+        hi = _key(until) if until else None
+        at_stage = [0] * len(FUNNEL_STEPS)
+        with self._lock:
+            for mine in self._by_entity.values():
+                first = mine[0].key
+                if (lo is not None and first < lo) or (hi is not None and first > hi):
+                    continue
+                stage = max((_STAGE.get(e.event_type, -1) for e in mine), default=-1)
+                if stage >= 0:
+                    at_stage[stage] += 1
+        reached = {}
+        running = 0
+        for i in range(len(FUNNEL_STEPS) - 1, -1, -1):
+            running += at_stage[i]
+            reached[FUNNEL_STEPS[i]] = running
+        return dropoff_from_counts(reached)
+
+    def prune_before(self, cutoff: datetime) -> int:
+        """Drop events older than `cutoff`; O(log n) plus the number evicted."""
+        key = _key(cutoff)
+        with self._lock:
+            evicted = self._all.evict_before(key)
+            if not evicted:
+                return 0
+            for t in {e.event_type for e in evicted}:
+                tl = self._by_type[t]
+                tl.evict_before(key)
+                if not len(tl):
+                    del self._by_type[t]
+            for entity_id in {e.entity_id for e in evicted}:
+                mine = self._by_entity[entity_id]
+                del mine[:bisect_left(mine, key, key=_by_key)]
+                if not mine:
+                    del self._by_entity[entity_id]
+            return len(evicted)
+
+    def prune_older_than(self, days: int, now: Optional[datetime] = None) -> int:
+        return self.prune_before((now or datetime.now(timezone.utc)) - timedelta(days=days))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"events": len(self._all), "entities": len(self._by_entity), "event_types": len(self._by_type)}
+
+
+STORE = EventStore()
 
-EVENTS: List[AnalyticsEvent] = []
 
 def add_event(e: AnalyticsEvent) -> None:
-    EVENTS.append(e)
+    STORE.add(e)
+
 
 def list_events(
     since: Optional[datetime] = None,
     until: Optional[datetime] = None,
     entity_id: Optional[str] = None,
     event_type: Optional[str] = None,
-) -> List[AnalyticsEvent]:
-    out = EVENTS
-    if since:
-        out = [e for e in out if e.timestamp >= since]
-    if until:
-        out = [e for e in out if e.timestamp <= until]
-    if entity_id:
-        out = [e for e in out if e.entity_id == entity_id]
-    if event_type:
-        out = [e for e in out if e.event_type == event_type]
-    return out
+) -> List[StoredEvent]:
+    return STORE.list_events(since, until, entity_id, event_type)
+
 
 def clear_events() -> None:
-    EVENTS.clear()
+    STORE.clear()
+
 
 def prune_older_than(days: int) -> int:
-    cutoff = datetime.utcnow() - timedelta(days=days)
-    before = len(EVENTS)
-    keep = [e for e in EVENTS if e.timestamp.replace(tzinfo=None) >= cutoff]
-    EVENTS.clear()
-    EVENTS.extend(keep)
-    return before - len(EVENTS)
+    return STORE.prune_older_than(days)
@@ -0,0 +1,31 @@
+import argparse
+
+from sqlalchemy import text
+
+from app.archive import RETENTION_DAYS, archive_older_than, stats
+from app.database import SessionLocal
+
+
+def main():
+    p = argparse.ArgumentParser(description="Move events older than N days into archived columnar segments")
+    p.add_argument("--days", type=int, default=RETENTION_DAYS, help=f"keep this many days hot (default {RETENTION_DAYS})")
+    p.add_argument("--vacuum", action="store_true", help="then VACUUM, returning the freed pages to the filesystem")
+    args = p.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(f"Archiving events older than {args.days} days...")
+        for seg in archive_older_than(db, args.days):
+            print(f" - {seg['day']}: {seg['rows']} events, {seg['bytes']} bytes -> {seg['segment']}")
+        s = stats(db)
+        print(f"Done. {s['segments']} segments, {s['events']} archived events, {s['bytes']} bytes.")
+        if args.vacuum:
+            # otherwise SQLite reuses the freed pages for new events, but keeps the file size
+            print("Vacuuming...")
+            db.execute(text("VACUUM"))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
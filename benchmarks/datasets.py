@@ -0,0 +1,56 @@
+"""
+Benchmark databases in the seed funnel shape, built with generate_events.py.
+
+Run as a module so DATABASE_URL is set before the app is imported:
+
+    python -m benchmarks.datasets --events 1000000 --out benchmarks/data/events-1m.db
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+# fixed, so the same seed always gives the same database
+END = datetime(2026, 1, 1, tzinfo=timezone.utc)
+DAYS = 30
+OUT_OF_ORDER = 0.02
+
+
+def build(path: str, n_events: int, seed: int = 42) -> int:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(path)}"
+    # imported late: the engine binds to DATABASE_URL at import time
+    from app.database import SessionLocal, engine
+    from app.migrations import migrate
+    from app import rollups, progress, segments
+    from generate_events import events_per_submission, funnel_events, write_events
+
+    migrate(engine)
+    entities = int(n_events / events_per_submission()) + 1
+    rows = funnel_events(entities, seed=seed, days=DAYS, end=END, out_of_order=OUT_OF_ORDER, max_events=n_events)
+    n = write_events(engine, rows)
+    db = SessionLocal()
+    try:
+        rollups.rebuild(db)
+        progress.rebuild(db)
+        segments.rebuild(db)
+    finally:
+        db.close()
+    return n
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--events", type=int, required=True)
+    p.add_argument("--out", required=True)
+    p.add_argument("--seed", type=int, default=42)
+    args = p.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    t = time.perf_counter()
+    n = build(args.out, args.events, seed=args.seed)
+    print(f"Wrote {n} events to {args.out} in {time.perf_counter() - t:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
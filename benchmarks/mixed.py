@@ -0,0 +1,166 @@
+"""
+Mixed read/write load against a real uvicorn server.
+
+Writer threads POST /events while reader threads loop over the dashboard,
+/metrics/summary?since=..., /events pages and /public/metrics/live (answered
+from memory, so its latency shows how long requests wait for the event loop
+or a thread). Snapshots and the public cache are off, so every analytical
+read computes. Reports p50/p95/p99 per request type.
+
+    python -m benchmarks.mixed --size 100k --seconds 20 --writers 4 --readers 8
+    python -m benchmarks.mixed --app-dir /tmp/older-checkout   # same load, other code
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from benchmarks.run import API_KEY, HEADERS, ROOT, SIZES, _event, _free_port, ensure_dataset, percentile
+
+
+def _start(app_dir: str, db: str, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db}",
+        "ANALYTICS_API_KEY": API_KEY,
+        "SNAPSHOTS": "0",
+        "PUBLIC_CACHE_TTL": "0",
+    }
+    # datasets built before newer tables existed: bring the copy up to that checkout's schema
+    subprocess.run([sys.executable, "create_tables.py"], cwd=app_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=app_dir, env=env,
+    )
+
+
+def run(base_url: str, seconds: float, writers: int, readers: int) -> Dict[str, Any]:
+    import httpx
+
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    ts = datetime(2026, 1, 2, tzinfo=timezone.utc)
+    since = (ts - timedelta(hours=24, minutes=17)).isoformat()
+
+    def record(name: str, started: float, ok: bool) -> None:
+        with lock:
+            samples.setdefault(name, []).append(time.perf_counter() - started)
+            if not ok:
+                errors[name] = errors.get(name, 0) + 1
+
+    def writer(w: int) -> None:
+        with httpx.Client(base_url=base_url, timeout=120) as c:
+            i = 0
+            while not stop.is_set():
+                t = time.perf_counter()
+                r = c.post("/events", json=_event(20_000_000 + w * 1_000_000 + i, ts), headers=HEADERS)
+                record("post_event", t, r.status_code in (201, 202))
+                i += 1
+
+    def reader(n: int) -> None:
+        cursor = None
+        with httpx.Client(base_url=base_url, timeout=120) as c:
+            i = n
+            while not stop.is_set():
+                kind = ("dashboard", "metrics_summary_since", "get_events_page", "live")[i % 4]
+                t = time.perf_counter()
+                if kind == "dashboard":
+                    r = c.get("/dashboard")
+                elif kind == "metrics_summary_since":
+                    r = c.get("/metrics/summary", params={"since": since}, headers=HEADERS)
+                elif kind == "get_events_page":
+                    params = {"limit": 200, **({"cursor": cursor} if cursor else {})}
+                    r = c.get("/events", params=params, headers=HEADERS)
+                    if r.status_code == 200:
+                        cursor = r.json()["next_cursor"]
+                else:
+                    r = c.get("/public/metrics/live")
+                record(kind, t, r.status_code == 200)
+                i += 1
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    return {
+        name: {
+            "requests": len(s),
+            "errors": errors.get(name, 0),
+            "throughput_rps": round(len(s) / wall, 1),
+            "p50_ms": round(percentile(s, 50) * 1000.0, 2),
+            "p95_ms": round(percentile(s, 95) * 1000.0, 2),
+            "p99_ms": round(percentile(s, 99) * 1000.0, 2),
+        }
+        for name, s in sorted(samples.items())
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import httpx
+
+    p = argparse.ArgumentParser(description="Mixed read/write load benchmark")
+    p.add_argument("--size", default="100k", choices=list(SIZES))
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--seconds", type=float, default=20)
+    p.add_argument("--writers", type=int, default=4)
+    p.add_argument("--readers", type=int, default=8)
+    p.add_argument("--app-dir", default=ROOT, help="checkout whose app/ is served (default: this one)")
+    p.add_argument("--out", help="also write the report as JSON")
+    args = p.parse_args(argv)
+
+    dataset = ensure_dataset(args.size, args.seed)
+    scratch = tempfile.mkdtemp(prefix="bench-mixed-")
+    db = os.path.join(scratch, "events.db")
+    shutil.copyfile(dataset, db)
+    if os.path.exists(dataset + "-wal"):
+        shutil.copyfile(dataset + "-wal", db + "-wal")
+    port = _free_port()
+    server = _start(os.path.abspath(args.app_dir), db, port)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for _ in range(400):
+            try:
+                httpx.get(base_url + "/ping")
+                break
+            except httpx.TransportError:
+                time.sleep(0.05)
+        print(f"[{args.size}] {args.writers} writers, {args.readers} readers, {args.seconds:g}s "
+              f"({args.app_dir})", flush=True)
+        results = run(base_url, args.seconds, args.writers, args.readers)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    for name, r in results.items():
+        print(f"  {name:<22} n {r['requests']:>6}  p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+              f"p99 {r['p99_ms']:9.2f} ms  err {r['errors']}", flush=True)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({"size": args.size, "seconds": args.seconds, "writers": args.writers,
+                       "readers": args.readers, "results": results}, f, indent=2)
+        print(f"report: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Throughput of the batch data-quality rules (app.quality_rules).
+
+Builds a batch of data_upload_completed payloads (about 10% with a missing
+or out-of-range value) and reports payloads per second for the per-payload
+functions, evaluate() and derive_events() (issues turned into events).
+
+    python -m benchmarks.quality --batch 100000
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from app.quality_rules import derive_events, evaluate, missing_required_fields, out_of_range_fields
+from app.schemas import AnalyticsEvent
+
+
+def payloads(n: int, seed: int = 42) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        p = {"hb": round(rnd.uniform(11.5, 16.5), 1), "wbc": round(rnd.uniform(4.0, 10.0), 1),
+             "glucose": rnd.randint(75, 160)}
+        r = rnd.random()
+        if r < 0.05:
+            del p[rnd.choice(list(p))]
+        elif r < 0.10:
+            p["hb"] = round(rnd.uniform(5.0, 8.9), 1)
+        out.append(p)
+    return out
+
+
+def _per_payload(batch: List[Dict[str, Any]]) -> int:
+    return sum(len(missing_required_fields(p)) + len(out_of_range_fields(p)) for p in batch)
+
+
+def _rate(fn: Callable[[], Any], n: int, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return n / statistics.median(times)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Batch data-quality rule throughput")
+    p.add_argument("--batch", type=int, default=100_000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--out", help="also write the report as JSON")
+    args = p.parse_args(argv)
+
+    batch = payloads(args.batch, args.seed)
+    ts = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    events = [AnalyticsEvent(event_type="data_upload_completed", entity_id=f"SUB-{i}", timestamp=ts, metadata=m)
+              for i, m in enumerate(batch)]
+    issues = len(evaluate(batch))
+    assert issues == _per_payload(batch)
+
+    report = {
+        "batch": args.batch,
+        "issues": issues,
+        "payloads_per_s": {
+            "per_payload": round(_rate(lambda: _per_payload(batch), args.batch, args.repeat)),
+            "evaluate": round(_rate(lambda: evaluate(batch), args.batch, args.repeat)),
+            "derive_events": round(_rate(lambda: derive_events(events), args.batch, args.repeat)),
+        },
+    }
+    for name, rate in report["payloads_per_s"].items():
+        print(f"  {name:<14} {rate:>12,} payloads/s")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
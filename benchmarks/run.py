@@ -0,0 +1,346 @@
+"""
+Reproducible end-to-end benchmark.
+
+For each dataset size a database is built once (benchmarks/data/, reused on
+later runs), copied to a scratch file, and exercised through the real app:
+POST /events, POST /events/bulk, GET /events (cursor paging),
+GET /metrics/summary and GET /dashboard (cache disabled, so every request
+renders). Each size runs in its own process so peak memory is per size.
+
+    python -m benchmarks.run --sizes 10k,1m --out benchmarks/results/latest.json
+    python -m benchmarks.run --sizes 10k --baseline benchmarks/baseline.json
+    python -m benchmarks.run --sizes 10k --server uvicorn
+
+Reports are JSON; with --baseline, p95 latency and throughput are compared
+per scenario and the exit code is 1 if anything regressed beyond --tolerance.
+"""
+from __future__ import annotations
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS for in-process runs
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "benchmarks", "data")
+API_KEY = "bench-key"
+HEADERS = {"X-API-Key": API_KEY}
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# requests per scenario (after WARMUP); kept small for the read-heavy ones on big sets
+ITERATIONS = {
+    "post_event": 300,
+    "post_bulk_1000": 20,
+    "get_events_page": 200,
+    "metrics_summary": 20,
+    "metrics_summary_24h": 20,
+    "dashboard": 20,
+}
+WARMUP = 3
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest-rank percentile of an unsorted sample list."""
+    s = sorted(samples)
+    # rank ceil(p/100 * n), 1-based; p * n first so exact products stay exact
+    k = max(0, min(len(s) - 1, math.ceil(p * len(s) / 100.0) - 1))
+    return s[k]
+
+
+def _stats(samples: List[float], wall: float, items: int) -> Dict[str, Any]:
+    return {
+        "requests": len(samples),
+        "throughput_rps": len(samples) / wall if wall else None,
+        "items_per_sec": items / wall if wall else None,
+        "p50_ms": percentile(samples, 50) * 1000.0,
+        "p95_ms": percentile(samples, 95) * 1000.0,
+        "p99_ms": percentile(samples, 99) * 1000.0,
+        "max_ms": max(samples) * 1000.0,
+    }
+
+
+# --- worker: runs inside the process that talks to the app ---
+
+def _event(i: int, ts: datetime) -> Dict[str, Any]:
+    return {
+        "event_type": "data_upload_started",
+        "entity_id": f"BENCH-{i:08d}",
+        "timestamp": ts.isoformat(),
+        "actor_role": "patient",
+        "metadata": {"source": "web"},
+    }
+
+
+def _scenarios(client) -> Dict[str, Callable[[int], int]]:
+    """name -> fn(iteration) doing one request and returning the items it handled."""
+    ts = datetime(2026, 1, 2, tzinfo=timezone.utc)
+    # unaligned, so the rollup edge-hour path is measured too
+    since_24h = (ts - timedelta(hours=24, minutes=17)).isoformat()
+    cursor = {"next": None}
+
+    def ok(r, *codes):
+        if r.status_code not in (codes or (200,)):
+            raise RuntimeError(f"{r.request.method} {r.request.url} -> {r.status_code}: {r.text[:200]}")
+        return r
+
+    def post_event(i):
+        ok(client.post("/events", json=_event(i, ts), headers=HEADERS), 201, 202)
+        return 1
+
+    def post_bulk(i):
+        base = 10_000_000 + i * 1000
+        ok(client.post("/events/bulk", json=[_event(base + j, ts) for j in range(1000)], headers=HEADERS), 201)
+        return 1000
+
+    def get_events(i):
+        params = {"limit": 200}
+        if cursor["next"]:
+            params["cursor"] = cursor["next"]
+        body = ok(client.get("/events", params=params, headers=HEADERS)).json()
+        cursor["next"] = body["next_cursor"]
+        return body["count"]
+
+    def summary(i):
+        ok(client.get("/metrics/summary", headers=HEADERS))
+        return 1
+
+    def summary_24h(i):
+        ok(client.get("/metrics/summary", params={"since": since_24h}, headers=HEADERS))
+        return 1
+
+    def dashboard(i):
+        ok(client.get("/dashboard"))
+        return 1
+
+    # reads first, on the pristine dataset; writes last
+    return {
+        "get_events_page": get_events,
+        "metrics_summary": summary,
+        "metrics_summary_24h": summary_24h,
+        "dashboard": dashboard,
+        "post_event": post_event,
+        "post_bulk_1000": post_bulk,
+    }
+
+
+def _measure(fn: Callable[[int], int], n: int, trace_memory: bool) -> Dict[str, Any]:
+    for i in range(WARMUP):
+        fn(-1 - i)
+    samples = []
+    items = 0
+    start = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        items += fn(i)
+        samples.append(time.perf_counter() - t)
+    out = _stats(samples, time.perf_counter() - start, items)
+
+    if trace_memory:
+        # separate request: tracemalloc slows Python down too much to time under it
+        tracemalloc.start()
+        fn(n)
+        out["peak_alloc_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return out
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _vm_hwm_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def worker(args) -> Dict[str, Any]:
+    only = set(args.scenarios.split(",")) if args.scenarios else None
+    results: Dict[str, Any] = {}
+    server = None
+
+    if args.server == "uvicorn":
+        import httpx
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=os.environ.copy(),
+        )
+        client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600)
+        for _ in range(200):
+            try:
+                client.get("/ping")
+                break
+            except httpx.TransportError:
+                time.sleep(0.05)
+    else:
+        from fastapi.testclient import TestClient
+        from app.main import app
+        client = TestClient(app)
+
+    try:
+        for name, fn in _scenarios(client).items():
+            if only and name not in only:
+                continue
+            n = max(1, int(ITERATIONS[name] * args.scale))
+            results[name] = _measure(fn, n, trace_memory=server is None)
+            print(f"  {name:<22} p50 {results[name]['p50_ms']:9.2f} ms  "
+                  f"p95 {results[name]['p95_ms']:9.2f} ms  {results[name]['throughput_rps']:8.1f} req/s",
+                  flush=True)
+    finally:
+        client.close()
+        if server is not None:
+            peak = _vm_hwm_mb(server.pid)
+            server.terminate()
+            server.wait()
+    if server is None:
+        # Linux reports ru_maxrss in KiB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 if resource else None
+    return {"scenarios": results, "peak_rss_mb": peak}
+
+
+# --- driver ---
+
+def ensure_dataset(label: str, seed: int) -> str:
+    path = os.path.join(DATA_DIR, f"events-{label}-seed{seed}.db")
+    if not os.path.exists(path):
+        print(f"building {label} dataset -> {path}", flush=True)
+        tmp = path + ".partial"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        subprocess.run([sys.executable, "-m", "benchmarks.datasets", "--events", str(SIZES[label]),
+                        "--seed", str(seed), "--out", tmp], cwd=ROOT, check=True)
+        os.replace(tmp, path)
+    return path
+
+
+def run_size(label: str, args) -> Dict[str, Any]:
+    dataset = ensure_dataset(label, args.seed)
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        # the write scenarios change the data; keep the built dataset pristine
+        work = os.path.join(tmp, "work.db")
+        shutil.copyfile(dataset, work)
+        out = os.path.join(tmp, "result.json")
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{work}",
+                   ANALYTICS_API_KEY=API_KEY,
+                   PUBLIC_CACHE_TTL="0")
+        cmd = [sys.executable, "-m", "benchmarks.run", "--worker", "--json-out", out,
+               "--server", args.server, "--scale", str(args.scale)]
+        if args.scenarios:
+            cmd += ["--scenarios", args.scenarios]
+        subprocess.run(cmd, cwd=ROOT, env=env, check=True)
+        with open(out) as f:
+            result = json.load(f)
+    result["events"] = SIZES[label]
+    return result
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of p95 latency / throughput beyond `tolerance` (0.2 = 20%)."""
+    problems = []
+    for size, res in report["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for name, cur in res["scenarios"].items():
+            old = base["scenarios"].get(name)
+            if not old:
+                continue
+            if cur["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                problems.append(f"{size}/{name}: p95 {old['p95_ms']:.2f} -> {cur['p95_ms']:.2f} ms")
+            if cur["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+                problems.append(f"{size}/{name}: throughput {old['throughput_rps']:.1f} -> {cur['throughput_rps']:.1f} req/s")
+    return problems
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="End-to-end API benchmark")
+    p.add_argument("--sizes", default="10k", help=f"comma separated, of {', '.join(SIZES)}")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--server", choices=["testclient", "uvicorn"], default="testclient")
+    p.add_argument("--scenarios", help="comma separated subset of scenario names")
+    p.add_argument("--scale", type=float, default=1.0, help="multiply iteration counts")
+    p.add_argument("--out", default=os.path.join(ROOT, "benchmarks", "results", "latest.json"))
+    p.add_argument("--baseline", help="report to compare against")
+    p.add_argument("--tolerance", type=float, default=0.2)
+    p.add_argument("--save-baseline", action="store_true", help="also write the report to --baseline")
+    p.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    p.add_argument("--json-out", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.worker:
+        with open(args.json_out, "w") as f:
+            json.dump(worker(args), f)
+        return 0
+
+    labels = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in labels if s not in SIZES]
+    if unknown:
+        p.error(f"unknown size(s): {', '.join(unknown)}")
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": args.server,
+        "seed": args.seed,
+        "scale": args.scale,
+        "results": {},
+    }
+    for label in labels:
+        print(f"[{label}]", flush=True)
+        report["results"][label] = run_size(label, args)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report: {args.out}")
+
+    if args.baseline and args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print(f"baseline saved: {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for line in problems:
+            print("REGRESSION", line)
+        if problems:
+            return 1
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Scaling of the partitioned summary (app.partitioned) across worker processes.
+
+Computes the full-window summary of a benchmark dataset on 1..N workers,
+checks every result is identical to the 1-worker (serial) one, and reports
+the median wall time and speedup per worker count.
+
+    python -m benchmarks.scaling --size 1m --workers 1,2,4,8
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.run import SIZES, ensure_dataset
+
+
+def measure(url: str, workers: List[int], repeat: int, distinct: bool) -> Dict[str, Any]:
+    from app import partitioned
+
+    results: Dict[str, Any] = {}
+    serial = None
+    for n in workers:
+        # first call starts the pool and warms the page cache; not timed
+        first = partitioned.summary(workers=n, distinct=distinct, url=url)
+        if serial is None:
+            serial = first
+        if first != serial:
+            raise SystemExit(f"{n} workers: result differs from the serial path")
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            partitioned.summary(workers=n, distinct=distinct, url=url)
+            times.append(time.perf_counter() - t)
+        med = statistics.median(times)
+        results[str(n)] = {"median_s": round(med, 4), "min_s": round(min(times), 4)}
+        base = results[str(workers[0])]["median_s"]
+        results[str(n)]["speedup"] = round(base / med, 2)
+        print(f"  {n:>3} workers  {med:8.3f}s  x{results[str(n)]['speedup']:.2f}", flush=True)
+    partitioned.shutdown()
+    return {"events": serial.total_events, "workers": results}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Partitioned summary scaling benchmark")
+    p.add_argument("--size", default="1m", choices=list(SIZES))
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--workers", help="comma separated worker counts (default 1,2,4,... up to the CPU count)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--distinct", action="store_true", help="include distinct entities per funnel step")
+    p.add_argument("--out", help="also write the report as JSON")
+    args = p.parse_args(argv)
+
+    if args.workers:
+        workers = [int(w) for w in args.workers.split(",")]
+    else:
+        cpus = os.cpu_count() or 1
+        workers = [1 << i for i in range(cpus.bit_length()) if 1 << i <= cpus]
+
+    dataset = ensure_dataset(args.size, args.seed)
+    url = f"sqlite:///{dataset}"
+    # the app binds its default engine at import time; point it at the dataset too
+    os.environ["DATABASE_URL"] = url
+    print(f"[{args.size}] {dataset}", flush=True)
+    report = {"size": args.size, "cpus": os.cpu_count(), **measure(url, workers, args.repeat, args.distinct)}
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
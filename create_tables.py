@@ -1,8 +1,9 @@
 from app.database import engine
-from app.models import Base
+from app.migrations import migrate
 
 print("Creating database tables...")
 
-Base.metadata.create_all(bind=engine)
+for change in migrate(engine):
+    print(" -", change)
 
 print("Done.")
@@ -0,0 +1,231 @@
+"""
+Synthetic event generator for load and scale testing.
+
+Writes submissions following the seed funnel (upload -> analysis -> clinician
+review, with quality issues and analysis failures) straight into the events
+table with batched Core inserts, then rebuilds the rollup/progress tables.
+Same --seed and --end give the same data.
+
+    python generate_events.py --entities 3000000 --days 90 --out-of-order 0.05
+"""
+from __future__ import annotations
+import argparse
+import heapq
+import itertools
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import column, table
+
+QUALITY_RATE = 0.20        # quality issue before the upload completes
+ANALYSIS_FAIL_RATE = 0.12  # analysis_failed instead of analysis_completed
+REVIEW_RATE = 0.70         # clinician review after a completed analysis
+
+QUALITY_SEED = [
+    ("missing_required_field", "system", {"field": "wbc"}),
+    ("out_of_range_value_detected", "system", {"field": "hb", "value": 8.4, "min": 9.0, "max": 18.0}),
+]
+
+LATE_MAX = 1000  # an out-of-order event arrives up to this many events late
+BATCH_SIZE = 20000
+
+
+def _row(event_type: str, entity_id: str, ts: datetime, role: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    # keys match the events table columns ("metadata" is Event.event_data)
+    return {"event_type": event_type, "entity_id": entity_id, "timestamp": ts, "actor_role": role, "metadata": meta}
+
+
+def submission(rnd: random.Random, entity_id: str, t0: datetime, quality_rate: float = QUALITY_RATE) -> List[Dict[str, Any]]:
+    """One submission's events, in time order."""
+    out = [_row("data_upload_started", entity_id, t0, "patient", {"source": rnd.choice(["web", "mobile"])})]
+
+    if rnd.random() < quality_rate:
+        et, role, meta = rnd.choice(QUALITY_SEED)
+        out.append(_row(et, entity_id, t0 + timedelta(seconds=10), role, meta))
+        return out
+
+    t1 = t0 + timedelta(minutes=rnd.randint(1, 6))
+    out.append(_row("data_upload_completed", entity_id, t1, "patient", {
+        "hb": round(rnd.uniform(11.5, 16.5), 1),
+        "wbc": round(rnd.uniform(4.0, 10.0), 1),
+        "glucose": rnd.randint(75, 160),
+    }))
+
+    if rnd.random() < ANALYSIS_FAIL_RATE:
+        t2 = t1 + timedelta(minutes=rnd.randint(1, 4))
+        out.append(_row("analysis_failed", entity_id, t2, "system", {"reason": "quality_gate_failed"}))
+        return out
+
+    t2 = t1 + timedelta(minutes=rnd.randint(1, 10))
+    out.append(_row("analysis_completed", entity_id, t2, "system", {"engine": "rules-v1"}))
+
+    if rnd.random() < REVIEW_RATE:
+        t3 = t2 + timedelta(minutes=rnd.randint(2, 30))
+        out.append(_row("clinician_review_completed", entity_id, t3, "clinician",
+                        {"decision": rnd.choice(["ok", "followup", "retest"])}))
+    return out
+
+
+def events_per_submission(quality_rate: float = QUALITY_RATE) -> float:
+    """Expected events per submission, to size a run by event count."""
+    analysed = (1 - ANALYSIS_FAIL_RATE) * (1 + REVIEW_RATE)
+    return 2 * quality_rate + (1 - quality_rate) * (2 + ANALYSIS_FAIL_RATE + analysed)
+
+
+def funnel_events(
+    entities: int,
+    seed: int = 42,
+    days: float = 14,
+    end: Optional[datetime] = None,
+    quality_rate: float = QUALITY_RATE,
+    out_of_order: float = 0.0,
+    max_events: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Events for `entities` submissions starting evenly over `days` before `end`,
+    yielded in arrival order: timestamp order, except that an `out_of_order`
+    fraction of events arrives up to LATE_MAX events late.
+    """
+    rnd = random.Random(seed)
+    # own stream, so the out-of-order ratio changes arrival order but not the data
+    late_rnd = random.Random(f"{seed}-late")
+    end = end or datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    step = days * 86400.0 / max(entities, 1)
+    width = max(3, len(str(entities)))
+    seq = itertools.count()
+
+    pending: list = []  # (timestamp, seq, row) not yet due
+    late: list = []     # (release_at, seq, row) held back
+    emitted = 0
+
+    def arrivals(until: Optional[datetime]):
+        nonlocal emitted
+        while pending and (until is None or pending[0][0] <= until):
+            row = heapq.heappop(pending)[2]
+            if out_of_order and late_rnd.random() < out_of_order:
+                heapq.heappush(late, (emitted + late_rnd.randint(1, LATE_MAX), next(seq), row))
+                continue
+            yield row
+            emitted += 1
+            while late and late[0][0] <= emitted:
+                yield heapq.heappop(late)[2]
+                emitted += 1
+
+    count = 0
+    for i in range(entities):
+        t0 = start + timedelta(seconds=i * step + rnd.uniform(0, step))
+        for row in arrivals(t0):
+            yield row
+            count += 1
+            if max_events is not None and count >= max_events:
+                return
+        for row in submission(rnd, f"SUB-{i + 1:0{width}d}", t0, quality_rate):
+            heapq.heappush(pending, (row["timestamp"], next(seq), row))
+
+    def stragglers():
+        while late:
+            yield heapq.heappop(late)[2]
+
+    for row in itertools.chain(arrivals(None), stragglers()):
+        yield row
+        count += 1
+        if max_events is not None and count >= max_events:
+            return
+
+
+# untyped columns: values are bound as-is, skipping the DateTime/JSON processors
+_EVENTS = table("events", *(column(c) for c in ("event_type", "entity_id", "timestamp", "actor_role", "metadata")))
+
+
+def _encode(row: Dict[str, Any]) -> Dict[str, Any]:
+    # the same text the ORM column types write: wall-clock time with any offset
+    # dropped, not converted (generated timestamps are UTC), always with microseconds
+    ts = row["timestamp"].replace(tzinfo=None)
+    return {
+        "event_type": row["event_type"],
+        "entity_id": row["entity_id"],
+        "timestamp": ts.isoformat(" ", "microseconds"),
+        "actor_role": row["actor_role"],
+        "metadata": json.dumps(row["metadata"]),
+    }
+
+
+def write_events(engine, rows: Iterator[Dict[str, Any]], batch_size: int = BATCH_SIZE, progress: bool = False) -> int:
+    """Insert rows with one executemany per batch, committing each batch."""
+    insert = _EVENTS.insert()
+    n = 0
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        # bulk load: skip the per-commit fsync, restored afterwards
+        sync = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        try:
+            while True:
+                batch = [_encode(r) for r in itertools.islice(rows, batch_size)]
+                if not batch:
+                    break
+                conn.execute(insert, batch)
+                conn.commit()
+                n += len(batch)
+                if progress:
+                    rate = n / (time.perf_counter() - started)
+                    print(f"\r  {n:,} events ({rate:,.0f}/s)", end="", flush=True)
+        finally:
+            conn.exec_driver_sql(f"PRAGMA synchronous={int(sync)}")
+    if progress:
+        print()
+    return n
+
+
+def _parse_end(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    return dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    p = argparse.ArgumentParser(description="Generate synthetic funnel events into the events table.")
+    p.add_argument("--entities", type=int, default=10000, help="submissions to generate (default 10000)")
+    p.add_argument("--max-events", type=int, help="stop after this many events")
+    p.add_argument("--days", type=float, default=14, help="time span the submissions start in (default 14)")
+    p.add_argument("--end", type=_parse_end, help="end of the span, ISO 8601 (default now)")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--quality-rate", type=float, default=QUALITY_RATE,
+                   help=f"share of submissions stopped by a quality issue (default {QUALITY_RATE})")
+    p.add_argument("--out-of-order", type=float, default=0.0,
+                   help="share of events arriving late, out of timestamp order (default 0)")
+    p.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    p.add_argument("--skip-rebuild", action="store_true",
+                   help="leave rollups/progress stale (run rebuild_rollups.py later)")
+    args = p.parse_args(argv)
+
+    from app.database import SessionLocal, engine
+    from app.migrations import migrate
+    from app import rollups, progress, segments
+
+    migrate(engine)
+    print(f"Generating {args.entities:,} submissions over {args.days:g} days (seed {args.seed})...")
+    t = time.perf_counter()
+    rows = funnel_events(args.entities, seed=args.seed, days=args.days, end=args.end,
+                         quality_rate=args.quality_rate, out_of_order=args.out_of_order,
+                         max_events=args.max_events)
+    n = write_events(engine, rows, batch_size=args.batch_size, progress=True)
+    print(f"Inserted {n:,} events in {time.perf_counter() - t:.1f}s.")
+
+    if not args.skip_rebuild:
+        t = time.perf_counter()
+        db = SessionLocal()
+        try:
+            rollups.rebuild(db)
+            progress.rebuild(db)
+            segments.rebuild(db)
+        finally:
+            db.close()
+        print(f"Rebuilt rollups and progress in {time.perf_counter() - t:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
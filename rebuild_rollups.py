@@ -0,0 +1,22 @@
+from app.database import SessionLocal
+from app import rollups, progress, segments
+
+
+def main():
+    db = SessionLocal()
+    try:
+        print("Rebuilding hourly rollups from raw events...")
+        n = rollups.rebuild(db)
+        print(f"Done. {n} rollup rows.")
+        print("Rebuilding per-entity progress from raw events...")
+        n = progress.rebuild(db)
+        print(f"Done. {n} entities.")
+        print("Rebuilding segment dimensions from raw events...")
+        n = segments.rebuild(db)
+        print(f"Done. {n} entity dimensions.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
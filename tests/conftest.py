@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before anything imports app.database.
+_tmpdir = tempfile.mkdtemp(prefix="medical-analytics-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'test.db')}")
+os.environ.setdefault("ANALYTICS_API_KEY", "test-key")
+
+from app.database import engine, Base  # noqa: E402
+import app.models  # noqa: E402,F401
+
+Base.metadata.create_all(bind=engine)
+
+import random  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+
+import pytest  # noqa: E402
+
+from app.events import EVENT_TYPES  # noqa: E402
+from app.schemas import AnalyticsEvent  # noqa: E402
+
+
+def _random_events(n, seed):
+    rnd = random.Random(seed)
+    t0 = datetime(2026, 1, 10, 8, 0, 0)
+    types = sorted(EVENT_TYPES)
+    # coarse timestamps so ties happen; deliberately not time-ordered
+    return [
+        AnalyticsEvent(
+            event_type=rnd.choice(types),
+            entity_id=f"SUB-{rnd.randint(1, 30):03d}",
+            timestamp=t0 + timedelta(minutes=5 * rnd.randint(0, 200)),
+        )
+        for _ in range(n)
+    ]
+
+
+@pytest.fixture
+def random_events():
+    """random_events(n, seed): n AnalyticsEvents of every type over ~17 hours, reproducible per seed."""
+    return _random_events
+
+
+@pytest.fixture
+def api_headers():
+    return {"X-API-Key": os.environ["ANALYTICS_API_KEY"]}
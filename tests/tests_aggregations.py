@@ -0,0 +1,275 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.database import SessionLocal
+from app.models import Event
+from app.aggregations import summary
+from app.analytics import (
+    success_rate,
+    funnel_counts,
+    dropoff,
+    top_quality_issues,
+    time_to_analysis_minutes,
+    explainable_insights,
+)
+from app.events import EVENT_TYPES
+from app.schemas import AnalyticsEvent
+
+
+def _random_rows(n=400, seed=7):
+    rnd = random.Random(seed)
+    t0 = datetime(2026, 1, 10, 8, 0, 0)
+    types = sorted(EVENT_TYPES)
+    return [
+        Event(
+            event_type=rnd.choice(types),
+            entity_id=f"SUB-{rnd.randint(1, 40):03d}",
+            timestamp=t0 + timedelta(minutes=rnd.randint(0, 3000)),
+            actor_role="system",
+            event_data={},
+        )
+        for _ in range(n)
+    ]
+
+
+def test_sql_summary_matches_python_functions():
+    from app import rollups, progress
+
+    db = SessionLocal()
+    try:
+        db.query(Event).delete()
+        db.add_all(_random_rows())
+        db.commit()
+        rollups.rebuild(db)
+        progress.rebuild(db)
+
+        # hour-aligned windows read the rollups, the other one the raw table
+        for since in (datetime(2026, 1, 10, 12, 0, 0), datetime(2026, 1, 10, 12, 17, 0)):
+            rows = db.query(Event).filter(Event.timestamp >= since).order_by(Event.timestamp, Event.id).all()
+            got = summary(db, since=since).as_dict()
+
+            assert got["counts"] == {"total_events": len(rows)}
+            assert got["success_rate"] == success_rate(rows)
+            assert got["funnel"] == funnel_counts(rows)
+            assert got["dropoff"] == dropoff(rows)
+            assert got["quality_issues"] == top_quality_issues(rows)
+            assert got["time_to_analysis_minutes"] == time_to_analysis_minutes(rows)
+            assert got["insights"] == explainable_insights(rows)
+    finally:
+        db.close()
+
+
+def test_rollups_match_raw_counts(api_headers):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app import rollups
+    from app.aggregations import _window
+    from app.models import EventRollup
+    from sqlalchemy import func
+
+    db = SessionLocal()
+    try:
+        db.query(Event).delete()
+        db.query(EventRollup).delete()
+        db.commit()
+    finally:
+        db.close()
+
+    events = _random_rows(300, seed=11)
+    payload = [
+        {"event_type": e.event_type, "entity_id": e.entity_id, "timestamp": e.timestamp.isoformat(), "actor_role": None}
+        for e in events
+    ]
+    client = TestClient(app)
+    assert client.post("/events/bulk", json=payload[:-1], headers=api_headers).status_code == 201
+    assert client.post("/events", json=payload[-1], headers=api_headers).status_code == 201
+
+    since = datetime(2026, 1, 10, 12, 0, 0)
+    until = datetime(2026, 1, 11, 9, 0, 0)
+    db = SessionLocal()
+    try:
+        raw = _window(db.query(Event.event_type, func.count(Event.id)), since, until)
+        raw = dict(raw.group_by(Event.event_type).all())
+        assert rollups.event_type_counts(db, since, until) == raw
+
+        # an offset on one bound only: both compare as the stored wall-clock time
+        edge = since.replace(minute=17)
+        raw = dict(_window(db.query(Event.event_type, func.count(Event.id)), edge, until).group_by(Event.event_type).all())
+        assert rollups.event_type_counts(db, edge.replace(tzinfo=timezone.utc), until) == raw
+        r = client.get("/metrics/summary", params={"since": "2026-01-10T12:17:00Z", "until": until.isoformat()}, headers=api_headers)
+        assert r.status_code == 200 and r.json()["counts"]["total_events"] == sum(raw.values())
+
+        # 10:00Z and 12:00+02:00 are one instant but different stored (wall-clock) hours
+        from app.ingestion import record_events
+        plus_2 = timezone(timedelta(hours=2))
+        record_events(db, [
+            AnalyticsEvent(event_type="analysis_failed", entity_id=f"SUB-TZ-{i}", timestamp=ts)
+            for i, ts in enumerate([datetime(2026, 1, 12, 10), datetime(2026, 1, 12, 10, tzinfo=timezone.utc),
+                                    datetime(2026, 1, 12, 12, tzinfo=plus_2)])
+        ])
+        db.commit()
+        assert rollups.event_type_counts(db, datetime(2026, 1, 12, 10), datetime(2026, 1, 12, 11)) == {"analysis_failed": 2}
+        assert rollups.event_type_counts(db, datetime(2026, 1, 12, 12), datetime(2026, 1, 12, 13)) == {"analysis_failed": 1}
+
+        before = sorted((r.bucket, r.event_type, r.actor_role, r.count) for r in db.query(EventRollup))
+        rollups.rebuild(db)
+        after = sorted((r.bucket, r.event_type, r.actor_role, r.count) for r in db.query(EventRollup))
+        assert after == before
+    finally:
+        db.close()
+
+
+def _funnel_events(n_entities=120, seed=3):
+    rnd = random.Random(seed)
+    t0 = datetime(2026, 1, 10, 8, 0, 0)
+    out = []
+    for i in range(n_entities):
+        eid = f"SUB-{i:04d}"
+        t = t0 + timedelta(minutes=rnd.randint(0, 2000))
+        out.append(AnalyticsEvent(event_type="data_upload_started", entity_id=eid, timestamp=t))
+        for _ in range(rnd.choice([0, 1, 1, 1, 2])):  # sometimes missing, sometimes re-uploaded
+            t += timedelta(minutes=rnd.randint(0, 30))
+            out.append(AnalyticsEvent(event_type="data_upload_completed", entity_id=eid, timestamp=t))
+        for _ in range(rnd.choice([0, 1, 1, 2])):
+            t += timedelta(minutes=rnd.choice([0, 3, 12]))  # 0 -> same-instant tie
+            out.append(AnalyticsEvent(event_type="analysis_completed", entity_id=eid, timestamp=t))
+    return out
+
+
+def test_progress_out_of_order_matches_replay():
+    from app import progress
+    from app.ingestion import record_events
+    from app.models import EntityProgress
+
+    events = _funnel_events()
+    shuffled = events[:]
+    random.Random(5).shuffle(shuffled)
+
+    db = SessionLocal()
+    try:
+        db.query(Event).delete()
+        db.query(EntityProgress).delete()
+        for i in range(0, len(shuffled), 37):
+            record_events(db, shuffled[i:i + 37])
+            db.commit()
+
+        # replay reference: raw rows in (timestamp, id) order, like the fetch path
+        windows = [
+            (None, None),
+            (datetime(2026, 1, 10, 20, 0, 0), None),
+            (None, datetime(2026, 1, 11, 3, 30, 0)),
+            (datetime(2026, 1, 10, 14, 5, 0), datetime(2026, 1, 11, 1, 0, 0)),
+        ]
+        for since, until in windows:
+            q = db.query(Event)
+            if since:
+                q = q.filter(Event.timestamp >= since)
+            if until:
+                q = q.filter(Event.timestamp <= until)
+            rows = q.order_by(Event.timestamp, Event.id).all()
+            assert progress.time_to_analysis(db, since, until) == time_to_analysis_minutes(rows)
+
+        ingested = sorted(tuple(r.__dict__[c] for c in ("entity_id", "stage", "first_seen_at", "upload_completed_n"))
+                          for r in db.query(EntityProgress))
+        db.expunge_all()
+        progress.rebuild(db)
+        rebuilt = sorted(tuple(r.__dict__[c] for c in ("entity_id", "stage", "first_seen_at", "upload_completed_n"))
+                         for r in db.query(EntityProgress))
+        assert ingested == rebuilt
+    finally:
+        db.close()
+
+
+def test_sql_timeseries_matches_one_pass():
+    from app import progress
+    from app.aggregations import timeseries
+    from app.analytics import bucket_series, timeseries as py_timeseries
+    from app.ingestion import record_events
+    from app.models import EntityProgress, EventRollup
+
+    events = _funnel_events(seed=9)
+    db = SessionLocal()
+    try:
+        db.query(Event).delete()
+        db.query(EventRollup).delete()
+        db.query(EntityProgress).delete()
+        record_events(db, events)
+        db.commit()
+
+        windows = [
+            (None, None),
+            (datetime(2026, 1, 10, 12, 0, 0), datetime(2026, 1, 11, 6, 0, 0)),
+            (datetime(2026, 1, 10, 12, 17, 0), datetime(2026, 1, 11, 5, 43, 0)),
+            (datetime(2026, 1, 10, 12, 17, 0), datetime(2026, 1, 10, 12, 43, 0)),
+        ]
+        for since, until in windows:
+            q = db.query(Event)
+            if since:
+                q = q.filter(Event.timestamp >= since)
+            if until:
+                q = q.filter(Event.timestamp <= until)
+            rows = q.order_by(Event.timestamp, Event.id).all()
+            for bucket in ("hour", "day"):
+                got = timeseries(db, bucket, since, until)
+                assert got == bucket_series(*py_timeseries(rows, bucket, ordered=True), bucket, since, until)
+                # every pair lands in exactly one bucket
+                assert sum(b["total_events"] for b in got) == len(rows)
+                assert sum(b["time_to_analysis_minutes"]["count"] for b in got) == \
+                    progress.time_to_analysis(db, since, until)["count"]
+                # an offset on one bound only: the offset is dropped, as it is for stored rows
+                if since:
+                    assert timeseries(db, bucket, since.replace(tzinfo=timezone.utc), until) == got
+    finally:
+        db.close()
+
+
+def test_window_function_tta_matches_python(monkeypatch):
+    from app import analytics, progress
+    from app.ingestion import record_events
+    from app.models import EntityProgress
+
+    rnd = random.Random(21)
+    events = _funnel_events(seed=13)
+    t0 = datetime(2026, 1, 10, 8, 0, 0)
+    for i in range(60):
+        # analyses before any upload, uploads after the analysis, sub-second gaps
+        eid = f"ODD-{i:03d}"
+        t = t0 + timedelta(minutes=rnd.randint(0, 2000), microseconds=rnd.randint(0, 999_999))
+        for _ in range(rnd.randint(1, 5)):
+            kind = rnd.choice(["data_upload_completed", "analysis_completed"])
+            events.append(AnalyticsEvent(event_type=kind, entity_id=eid, timestamp=t))
+            t += timedelta(microseconds=rnd.choice([0, 1, 999, 2_500_000]))
+    rnd.shuffle(events)
+
+    db = SessionLocal()
+    try:
+        db.query(Event).delete()
+        db.query(EntityProgress).delete()
+        record_events(db, events)
+        db.commit()
+
+        windows = [
+            (None, None),
+            (datetime(2026, 1, 10, 14, 5, 0, 250_000), datetime(2026, 1, 11, 1, 0, 0)),
+            (datetime(2026, 1, 10, 20, 0, 0), None),
+        ]
+        for exact_max in (10_000, 5):
+            monkeypatch.setattr(analytics, "SKETCH_EXACT_MAX", exact_max)
+            monkeypatch.setattr(progress, "SKETCH_EXACT_MAX", exact_max)
+            for since, until in windows:
+                q = db.query(Event)
+                if since:
+                    q = q.filter(Event.timestamp >= since)
+                if until:
+                    q = q.filter(Event.timestamp <= until)
+                want = time_to_analysis_minutes(q.order_by(Event.timestamp, Event.id).all())
+                assert want["count"] > 5
+
+                assert progress.time_to_analysis(db, since, until) == want
+                # pairing every entity from the events table alone gives the same
+                pairs = progress.analysis_pairs(since, until).subquery()
+                assert progress.tta_stats(db, pairs)[()] == want
+                assert progress.time_to_analysis(db, since, until, percentiles=False) == \
+                    {**want, "p50": None, "p90": None, "p99": None}
+    finally:
+        db.close()
@@ -0,0 +1,41 @@
+from app.analytics import (
+    summarize,
+    success_rate,
+    funnel_counts,
+    dropoff,
+    top_quality_issues,
+    time_to_analysis_minutes,
+    explainable_insights,
+    insights_from_metrics,
+)
+
+
+def _legacy_insights(events):
+    return insights_from_metrics(
+        success_rate(events),
+        top_quality_issues(events),
+        dropoff(events),
+        time_to_analysis_minutes(events),
+    )
+
+
+def test_summarize_matches_individual_functions(random_events):
+    for seed in range(20):
+        events = random_events(300, seed)
+        s = summarize(events)
+
+        assert s.total_events == len(events)
+        assert s.success_rate == success_rate(events)
+        assert s.funnel == funnel_counts(events)
+        assert s.dropoff == dropoff(events)
+        assert list(s.quality_issues.items()) == list(top_quality_issues(events).items())
+        assert s.time_to_analysis_minutes == time_to_analysis_minutes(events)
+        assert s.insights == _legacy_insights(events)
+        assert explainable_insights(events) == s.insights
+
+
+def test_summarize_empty():
+    s = summarize([])
+    assert s.as_dict()["counts"] == {"total_events": 0}
+    assert s.time_to_analysis_minutes == time_to_analysis_minutes([])
+    assert s.insights == _legacy_insights([])
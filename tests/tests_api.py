@@ -1,4 +1,3 @@
-import os
 from datetime import datetime, timezone
 
 from fastapi.testclient import TestClient
@@ -25,3 +24,142 @@ def test_ingest_requires_api_key():
     }
     r = client.post("/events", json=payload)
     assert r.status_code in (401, 500)
+
+def test_ndjson_ingest_reports_bad_lines(api_headers):
+    import gzip
+    import json
+
+    good = {
+        "event_type": "data_upload_started",
+        "entity_id": "SUB-T-NDJSON",
+        "timestamp": "2026-01-10T10:00:00Z",
+        "actor_role": "patient",
+        "metadata": {"source": "web"},
+    }
+    lines = [json.dumps(good), "{not json", json.dumps({**good, "event_type": "nope"}), "", json.dumps(good)]
+    body = gzip.compress("\n".join(lines).encode())
+    r = client.post(
+        "/events/ndjson",
+        content=body,
+        headers={**api_headers, "Content-Encoding": "gzip"},
+    )
+    assert r.status_code == 201
+    data = r.json()
+    assert data["count"] == 2
+    assert data["rejected"] == 2
+    assert [e["line"] for e in data["errors"]] == [2, 3]
+
+def test_ndjson_gzip_bomb_is_cut_off(monkeypatch, api_headers):
+    import gzip
+    from app import ingestion
+
+    monkeypatch.setattr(ingestion, "NDJSON_MAX_BYTES", 1 << 20)
+    # ~4 KB on the wire, 8 MB inflated
+    body = gzip.compress(b" " * (8 << 20))
+    r = client.post("/events/ndjson", content=body, headers={**api_headers, "Content-Encoding": "gzip"})
+    assert r.status_code == 413
+
+def test_public_cache_etag_and_invalidation(api_headers):
+    from app.cache import public_cache
+
+    public_cache.clear()
+    r1 = client.get("/public/metrics/summary")
+    assert r1.headers["x-cache"] == "MISS"
+    etag = r1.headers["etag"]
+
+    r2 = client.get("/public/metrics/summary", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.headers["x-cache"] == "HIT"
+    r3 = client.get("/public/metrics/summary", headers={"If-Modified-Since": r1.headers["last-modified"]})
+    assert r3.status_code == 304
+
+    payload = {
+        "event_type": "data_upload_started",
+        "entity_id": "SUB-T-CACHE",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    assert client.post("/events", json=payload, headers=api_headers).status_code == 201
+
+    r4 = client.get("/public/metrics/summary", headers={"If-None-Match": etag})
+    assert r4.status_code == 200
+    assert r4.headers["x-cache"] == "MISS"
+    assert r4.json()["counts"]["total_events"] == r1.json()["counts"]["total_events"] + 1
+
+def test_events_cursor_pagination_and_export(api_headers):
+    import csv
+    import io
+    import json
+
+    batch = [
+        {
+            "event_type": "data_upload_started",
+            "entity_id": "SUB-T-PAGE",
+            # pairs of identical timestamps so pages split inside ties
+            "timestamp": f"2026-03-01T10:00:{i // 2:02d}Z",
+            "metadata": {"i": i},
+        }
+        for i in range(25)
+    ]
+    assert client.post("/events/bulk", json=batch, headers=api_headers).status_code == 201
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"entity_id": "SUB-T-PAGE", "limit": 4}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/events", params=params, headers=api_headers).json()
+        seen.extend(e["metadata"]["i"] for e in page["events"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == list(range(25))
+    assert len(seen) == 25
+
+    r = client.get("/events/export", params={"entity_id": "SUB-T-PAGE"}, headers=api_headers)
+    lines = [json.loads(x) for x in r.text.splitlines()]
+    assert [x["metadata"]["i"] for x in lines] == list(range(25))
+
+    r = client.get("/events/export", params={"entity_id": "SUB-T-PAGE", "format": "csv"}, headers=api_headers)
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert len(rows) == 25 and json.loads(rows[0]["metadata"]) == {"i": 0}
+
+    assert client.get("/events", params={"cursor": "garbage"}, headers=api_headers).status_code == 400
+
+
+def test_metrics_timeseries_buckets(api_headers):
+    params = {"since": "2026-05-01T00:00:00", "until": "2026-05-01T23:59:59", "bucket": "hour"}
+    r = client.get("/metrics/timeseries", params=params, headers=api_headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert len(body["buckets"]) == 24
+    assert set(body["buckets"][0]) >= {"start", "funnel", "success_rate", "quality_issues", "time_to_analysis_minutes"}
+
+    params = {"since": "2000-01-01T00:00:00", "until": "2026-01-01T00:00:00", "bucket": "hour"}
+    assert client.get("/metrics/timeseries", params=params, headers=api_headers).status_code == 400
+    assert client.get("/metrics/timeseries", params={"bucket": "week"}, headers=api_headers).status_code == 422
+
+
+def test_bulk_mixes_naive_and_offset_timestamps_per_entity(api_headers):
+    from app.database import SessionLocal
+    from app.models import EntityDimension, EntityProgress
+
+    batch = [
+        {"event_type": "data_upload_completed", "entity_id": "SUB-T-MIXED", "timestamp": "2026-06-01T10:00:00"},
+        {"event_type": "analysis_completed", "entity_id": "SUB-T-MIXED", "timestamp": "2026-06-01T10:30:00Z"},
+    ]
+    # with metadata: segment dimensions compare the same timestamps
+    batch += [
+        {**e, "entity_id": "SUB-T-MIXED-META", "metadata": {"source": s}}
+        for e, s in zip(batch, ["web", "mobile"])
+    ]
+    assert client.post("/events/bulk", json=batch, headers=api_headers).status_code == 201
+    db = SessionLocal()
+    try:
+        row = db.get(EntityProgress, "SUB-T-MIXED")
+        # the offset is dropped, as for the events themselves
+        assert (row.first_seen_at, row.analysis_completed_at) == (datetime(2026, 6, 1, 10), datetime(2026, 6, 1, 10, 30))
+        dim = db.get(EntityDimension, ("SUB-T-MIXED-META", "source"))
+        assert (dim.value, dim.first_at) == ("web", datetime(2026, 6, 1, 10))
+    finally:
+        db.close()
@@ -0,0 +1,146 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import sessionmaker
+
+from app import aggregations, archive, partitioned, progress, rollups, segments
+from app.events import EVENT_TYPES
+from app.database import make_engine
+from app.migrations import migrate
+from app.models import ArchiveSegment, Event
+from app.repository import SqlRepository
+from app.schemas import AnalyticsEvent
+
+T0 = datetime(2026, 3, 1)
+WINDOWS = [
+    (None, None),
+    (datetime(2026, 3, 1, 5, 17), datetime(2026, 3, 4, 19, 3)),
+    (datetime(2026, 3, 2), datetime(2026, 3, 5)),
+    (datetime(2026, 3, 3, 12, 30), None),
+]
+
+
+def _events(n=1500, seed=5):
+    rnd = random.Random(seed)
+    types = sorted(EVENT_TYPES)
+    return [
+        AnalyticsEvent(
+            event_type=rnd.choice(types),
+            entity_id=f"ARC-{rnd.randint(1, 60):03d}",
+            # six days, coarse enough for ties and repeated uploads/analyses
+            timestamp=T0 + timedelta(minutes=7 * rnd.randint(0, 6 * 24 * 60 // 7)),
+            actor_role=rnd.choice([None, "patient", "clinician"]),
+            metadata={"source": rnd.choice(["web", "mobile"])} if rnd.random() < 0.5 else {},
+        )
+        for _ in range(n)
+    ]
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'archive.db'}"
+    engine = make_engine(url)
+    migrate(engine)
+    yield url, sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _everything(repo, url):
+    out = []
+    for w in WINDOWS:
+        out += [
+            repo.summary(*w, distinct=True),
+            repo.entity_funnel(*w),
+            repo.timeseries("hour", *w),
+            repo.segments("source", "day", *w),
+            repo.segments("actor_role", None, *w),
+            partitioned.summary(*w, workers=1, url=url),
+        ]
+    pages, after = [], None
+    while True:
+        rows, after = repo.page(limit=37, after=after)
+        pages += rows
+        if after is None:
+            break
+    out += [pages, list(repo.page(since=WINDOWS[1][0], until=WINDOWS[1][1], entity_id="ARC-007", limit=5000)[0])]
+    out += [list(repo.export()), list(repo.export(event_type="analysis_completed", since=WINDOWS[2][0]))]
+    return out
+
+
+@pytest.mark.parametrize("exact_max", [10_000, 10])
+def test_archived_events_read_back_transparently(db_url, monkeypatch, exact_max):
+    # 10: distinct counts and percentiles take the HLL / DDSketch paths
+    monkeypatch.setattr(aggregations, "SKETCH_EXACT_MAX", exact_max)
+    monkeypatch.setattr(progress, "SKETCH_EXACT_MAX", exact_max)
+    url, sessions = db_url
+    repo = SqlRepository(sessions)
+    try:
+        repo.record(_events())
+        before = _everything(repo, url)
+
+        done = archive.archive_before(repo.db, datetime(2026, 3, 4, 13, 0))
+        assert [s["day"] for s in done] == ["2026-03-01", "2026-03-02", "2026-03-03"]
+        assert repo.db.execute(select(func.min(Event.timestamp))).scalar() >= datetime(2026, 3, 4)
+        assert repo.db.execute(select(func.count()).select_from(ArchiveSegment)).scalar() == 3
+        assert _everything(repo, url) == before
+
+        # derived tables rebuilt from hot + archived rows come out the same
+        for module in (rollups, progress, segments):
+            module.rebuild(repo.db)
+        assert _everything(repo, url) == before
+    finally:
+        repo.close()
+
+
+def test_migrate_backfills_derived_tables_it_creates(db_url):
+    url, sessions = db_url
+    engine = sessions.kw["bind"]
+    repo = SqlRepository(sessions)
+    try:
+        repo.record(_events(600))
+        archive.archive_before(repo.db, datetime(2026, 3, 3))
+        before = _everything(repo, url)
+    finally:
+        repo.close()
+
+    # a database from before the derived tables existed
+    with engine.begin() as conn:
+        for table in ("event_rollups", "entity_progress", "entity_dimensions"):
+            conn.execute(text(f"DROP TABLE {table}"))
+    changes = migrate(engine)
+    assert sorted(c.split(" (")[0] for c in changes if c.startswith("backfilled")) == [
+        "backfilled entity_dimensions", "backfilled entity_progress", "backfilled event_rollups"]
+    assert not [c for c in migrate(engine) if c.startswith("backfilled")]
+
+    repo = SqlRepository(sessions)
+    try:
+        assert _everything(repo, url) == before
+    finally:
+        repo.close()
+
+
+def test_segment_layout_and_late_events(db_url):
+    url, sessions = db_url
+    repo = SqlRepository(sessions)
+    try:
+        repo.record(_events(300))
+        archive.archive_before(repo.db, datetime(2026, 3, 3))
+        seg = archive.segments(repo.db)[0]
+        assert seg.event_type.dtype == np.uint8 and seg.timestamp.dtype == np.int64 and seg.entity.dtype == np.uint32
+        assert isinstance(seg.timestamp, np.memmap)
+        assert (np.diff(seg.timestamp) >= 0).all()
+        assert os.path.dirname(seg.path) == archive.archive_dir(repo.db)
+
+        # a late event for an archived day stays hot, then gets a segment of its own
+        total = repo.summary().total_events
+        repo.record([AnalyticsEvent(event_type="analysis_completed", entity_id="ARC-LATE", timestamp=datetime(2026, 3, 1, 9))])
+        assert repo.summary(datetime(2026, 3, 1), datetime(2026, 3, 1, 10)).funnel["analysis_completed"] >= 1
+        assert [s["rows"] for s in archive.archive_before(repo.db, datetime(2026, 3, 3))] == [1]
+        assert repo.summary().total_events == total + 1
+        assert len(archive.segments(repo.db, datetime(2026, 3, 1), datetime(2026, 3, 1, 23))) == 2
+    finally:
+        repo.close()
@@ -0,0 +1,35 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+from generate_events import funnel_events
+
+END = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _key(r):
+    return (r["entity_id"], r["timestamp"], r["event_type"])
+
+
+def test_generator_is_seeded_and_follows_funnel():
+    a = list(funnel_events(500, seed=7, days=3, end=END))
+    assert a == list(funnel_events(500, seed=7, days=3, end=END))
+    assert a != list(funnel_events(500, seed=8, days=3, end=END))
+
+    # in order unless asked otherwise, all within the span
+    assert [r["timestamp"] for r in a] == sorted(r["timestamp"] for r in a)
+    assert min(r["timestamp"] for r in a) >= datetime(2025, 12, 29, tzinfo=timezone.utc)
+
+    types = Counter(r["event_type"] for r in a)
+    assert types["data_upload_started"] == 500
+    assert types["data_upload_completed"] + types["missing_required_field"] + types["out_of_range_value_detected"] == 500
+    assert types["analysis_completed"] + types["analysis_failed"] == types["data_upload_completed"]
+
+
+def test_out_of_order_only_changes_arrival_order():
+    ordered = list(funnel_events(300, seed=1, end=END))
+    shuffled = list(funnel_events(300, seed=1, end=END, out_of_order=0.2))
+    assert any(b["timestamp"] < a["timestamp"] for a, b in zip(shuffled, shuffled[1:]))
+    assert len(shuffled) == len(ordered)
+    assert sorted(shuffled, key=_key) == sorted(ordered, key=_key)
+
+    assert len(list(funnel_events(300, seed=1, end=END, max_events=100))) == 100
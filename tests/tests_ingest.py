@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal
+from app.ingest_queue import IngestQueue
+from app.repository import open_repository
+from app.models import Event
+from app.schemas import AnalyticsEvent
+
+
+def test_queue_group_commits_and_flushes_on_stop():
+    q = IngestQueue(maxsize=1000, batch_size=50, max_wait=0.01)
+    t0 = datetime(2026, 2, 1, 9, 0, 0)
+    for i in range(120):
+        ev = AnalyticsEvent(event_type="data_upload_started", entity_id=f"SUB-Q-{i:03d}", timestamp=t0 + timedelta(seconds=i))
+        assert q.put(ev)
+    q.stop(timeout=10)
+
+    stats = q.stats()
+    assert stats["committed"] == 120
+    assert stats["depth"] == 0
+    assert stats["failed"] == 0
+    assert stats["batches"] < 120
+
+    db = SessionLocal()
+    try:
+        assert db.query(Event).filter(Event.entity_id.like("SUB-Q-%")).count() == 120
+    finally:
+        db.close()
+
+
+def test_queue_backpressure_when_full():
+    q = IngestQueue(maxsize=1, batch_size=10, max_wait=0.01)
+    q.start = lambda: None  # no writer: nothing drains the queue
+    ev = AnalyticsEvent(event_type="data_upload_started", entity_id="SUB-Q-FULL", timestamp=datetime(2026, 2, 1))
+    assert q.put(ev, timeout=0.01)
+    assert not q.put(ev, timeout=0.01)
+    assert q.stats()["rejected"] == 1
+
+
+def test_failed_batch_drops_only_the_bad_event(monkeypatch):
+    from app import ingest_queue
+
+    class FailsOn:
+        # a repository that refuses any batch holding the bad event
+        def __init__(self):
+            self.repo = open_repository()
+
+        def record(self, events):
+            if any(e.entity_id == "SUB-Q-BAD" for e in events):
+                raise ValueError("bad event")
+            return self.repo.record(events)
+
+        def close(self):
+            self.repo.close()
+
+    monkeypatch.setattr(ingest_queue, "open_repository", FailsOn)
+    q = IngestQueue(maxsize=1000, batch_size=40, max_wait=0.05)
+    t0 = datetime(2026, 2, 2, 9, 0, 0)
+    ids = [f"SUB-Q-SPLIT-{i:03d}" for i in range(30)]
+    ids.insert(17, "SUB-Q-BAD")
+    for i, entity_id in enumerate(ids):
+        assert q.put(AnalyticsEvent(event_type="data_upload_started", entity_id=entity_id, timestamp=t0 + timedelta(seconds=i)))
+    q.stop(timeout=10)
+
+    stats = q.stats()
+    assert (stats["committed"], stats["failed"]) == (30, 1)
+    db = SessionLocal()
+    try:
+        assert db.query(Event).filter(Event.entity_id.like("SUB-Q-SPLIT-%")).count() == 30
+    finally:
+        db.close()
+
+
+def test_locked_database_retries_the_whole_batch(monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    from app import ingest_queue
+
+    calls = []
+
+    class LockedTwice:
+        # a repository whose first two commits find the database locked
+        def __init__(self):
+            self.repo = open_repository()
+
+        def record(self, events):
+            calls.append(len(events))
+            if len(calls) <= 2:
+                raise OperationalError("INSERT", {}, Exception("database is locked"))
+            return self.repo.record(events)
+
+        def close(self):
+            self.repo.close()
+
+    monkeypatch.setattr(ingest_queue, "open_repository", LockedTwice)
+    monkeypatch.setattr(ingest_queue, "RETRY_BACKOFF", 0.001)
+    q = IngestQueue(maxsize=1000, batch_size=40, max_wait=0.05)
+    t0 = datetime(2026, 2, 3, 9, 0, 0)
+    for i in range(30):
+        assert q.put(AnalyticsEvent(event_type="data_upload_started", entity_id=f"SUB-Q-BUSY-{i:03d}", timestamp=t0 + timedelta(seconds=i)))
+    q.stop(timeout=10)
+
+    # not split: the same batch went again until it was committed
+    assert calls[0] == calls[1] == calls[2]
+    stats = q.stats()
+    assert (stats["committed"], stats["failed"]) == (30, 0)
+    db = SessionLocal()
+    try:
+        assert db.query(Event).filter(Event.entity_id.like("SUB-Q-BUSY-%")).count() == 30
+    finally:
+        db.close()
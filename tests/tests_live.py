@@ -0,0 +1,91 @@
+import asyncio
+import json
+import random
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import live
+from app.analytics import FUNNEL, QUALITY_EVENTS
+from app.main import app
+from app.schemas import AnalyticsEvent
+
+TYPES = FUNNEL + sorted(QUALITY_EVENTS)
+TS = datetime(2026, 1, 1)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _batch(rnd, n):
+    return [AnalyticsEvent(event_type=rnd.choice(TYPES), entity_id=f"L-{i}", timestamp=TS) for i in range(n)]
+
+
+def test_windows_match_a_rescan_of_the_log():
+    rnd = random.Random(3)
+    clock = Clock()
+    windows = live.SlidingWindows(clock=clock)
+    log = []  # (slot, event_type) for everything added
+    for _ in range(600):
+        # mostly small steps, sometimes a long idle gap
+        clock.now += rnd.choice([0, 1, 3, 7, 30, 95, 400]) if rnd.random() < 0.98 else 5000
+        if rnd.random() < 0.7:
+            batch = _batch(rnd, rnd.randint(1, 5))
+            windows.add(batch)
+            log += [(int(clock.now // live.SLOT_SECONDS), e.event_type) for e in batch]
+        head = int(clock.now // live.SLOT_SECONDS)
+        snap = windows.snapshot()
+        for w in live.LIVE_WINDOWS:
+            width = w * 60 // live.SLOT_SECONDS
+            counts = {}
+            for slot, t in log:
+                if head - width < slot <= head:
+                    counts[t] = counts.get(t, 0) + 1
+            assert snap[f"{w}m"] == live.window_metrics(counts, w)
+
+
+def test_stream_sends_snapshot_then_deltas():
+    clock = Clock()
+    windows = live.SlidingWindows(clock=clock)
+
+    async def run():
+        feed = live.stream(windows, tick=0.001)
+        first = await feed.__anext__()
+        windows.add([AnalyticsEvent(event_type="data_upload_started", entity_id="S-1", timestamp=TS)])
+        second = await feed.__anext__()
+        clock.now += 16 * 60  # everything falls out of the 5 and 15 minute windows
+        third = await feed.__anext__()
+        await feed.aclose()
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first.startswith("retry: ") and "event: snapshot" in first
+    assert json.loads(first.split("data: ", 1)[1])["60m"]["events"] == 0
+
+    def data(msg):
+        assert "event: delta" in msg
+        return json.loads(msg.split("data: ", 1)[1])
+
+    delta = data(second)
+    assert delta["5m"] == {"events": 1, "events_per_minute": 0.2, "funnel": {"data_upload_started": 1}}
+    assert set(delta) == {"5m", "15m", "60m"}
+    assert set(data(third)) == {"5m", "15m"}
+
+
+def test_live_endpoint_counts_ingest(api_headers):
+    client = TestClient(app)
+    before = client.get("/public/metrics/live").json()["windows"]["5m"]["funnel"]["data_upload_started"]
+    r = client.post("/events/bulk", headers=api_headers, json=[
+        {"event_type": "data_upload_started", "entity_id": f"LIVE-{i}", "timestamp": "2036-02-01T10:00:00Z"}
+        for i in range(4)
+    ])
+    assert r.status_code in (200, 201)
+    body = client.get("/public/metrics/live").json()
+    assert body["slot_seconds"] == live.SLOT_SECONDS
+    assert body["windows"]["5m"]["funnel"]["data_upload_started"] == before + 4
+    assert "/public/metrics/live/stream" in client.get("/dashboard").text
@@ -0,0 +1,95 @@
+import random
+from datetime import datetime, timedelta
+
+import sys
+
+from app import analytics, partitioned, sketches
+from app.analytics import PartialSummary, epoch_us, summarize
+from app.batches import BatchBuilder
+from app.database import DATABASE_URL
+from app.repository import SqlRepository
+from app.schemas import AnalyticsEvent
+
+
+def _split(events, parts, rnd):
+    cuts = sorted(rnd.sample(range(1, len(events)), parts - 1))
+    return [events[a:b] for a, b in zip([0] + cuts, cuts + [len(events)])]
+
+
+def test_merged_partials_match_summarize(monkeypatch, random_events):
+    rnd = random.Random(4)
+    events = sorted(random_events(2000, 8), key=lambda e: e.timestamp)
+    for exact_max in [100_000, 40]:
+        for module in (sketches, analytics):
+            monkeypatch.setattr(module, "SKETCH_EXACT_MAX", exact_max)
+        expected = summarize(events, ordered=True, distinct=True)
+        for parts in [1, 2, 7, 50]:
+            # cut anywhere, so uploads and their analyses land in different partials
+            partials = [PartialSummary(distinct=True).extend(chunk) for chunk in _split(events, parts, rnd)]
+            merged = partials[0]
+            for p in partials[1:]:
+                merged.merge(p)
+            assert merged.summary() == expected
+
+
+def _batch(events):
+    cols = ([epoch_us(e.timestamp) for e in events], list(range(len(events))),
+            [e.event_type for e in events], [e.entity_id for e in events])
+    return BatchBuilder().extend([cols]).build()
+
+
+def test_batches_match_event_lists(monkeypatch, random_events):
+    rnd = random.Random(9)
+    events = sorted(random_events(2000, 8), key=lambda e: e.timestamp)
+    for exact_max in [100_000, 40]:
+        for module in (sketches, analytics):
+            monkeypatch.setattr(module, "SKETCH_EXACT_MAX", exact_max)
+        expected = summarize(events, ordered=True, distinct=True)
+        batch = _batch(events)
+        assert summarize(batch, distinct=True) == expected
+        assert analytics.funnel_counts(batch) == analytics.funnel_counts(events)
+        assert analytics.top_quality_issues(batch) == analytics.top_quality_issues(events)
+        assert analytics.time_to_analysis_minutes(batch) == analytics.time_to_analysis_minutes(events)
+        # several batches into one partial, and partials of batches merged
+        chunks = _split(events, 7, rnd)
+        one = PartialSummary(distinct=True)
+        for chunk in chunks:
+            one.add_batch(_batch(chunk))
+        assert one.summary() == expected
+        merged = PartialSummary(distinct=True).add_batch(_batch(chunks[0]))
+        for chunk in chunks[1:]:
+            merged.merge(PartialSummary(distinct=True).add_batch(_batch(chunk)))
+        assert merged.summary() == expected
+
+    # three columns instead of a tuple of four objects per row
+    rows = [(epoch_us(e.timestamp), i, e.event_type, e.entity_id) for i, e in enumerate(events)]
+    per_row = sum(sys.getsizeof(r) + sys.getsizeof(r[0]) + sys.getsizeof(r[1]) for r in rows) / len(rows)
+    assert batch.nbytes / len(batch) == 13 and per_row > 8 * 13
+
+
+def test_process_pool_matches_serial():
+    rnd = random.Random(6)
+    t0 = datetime(2033, 5, 1)
+    events = []
+    for i in range(300):
+        entity = f"PART-{rnd.randint(1, 60):03d}"
+        t = rnd.choice(["data_upload_started", "data_upload_completed", "analysis_completed",
+                        "clinician_review_completed", "missing_required_field"])
+        events.append(AnalyticsEvent(event_type=t, entity_id=entity, timestamp=t0 + timedelta(minutes=rnd.randint(0, 5000))))
+    repo = SqlRepository()
+    try:
+        repo.record(events)
+    finally:
+        repo.close()
+
+    window = (t0, t0 + timedelta(days=5))
+    serial = partitioned.summary(*window, workers=1, distinct=True, url=DATABASE_URL)
+    try:
+        parallel = partitioned.summary(*window, workers=2, distinct=True, url=DATABASE_URL)
+    finally:
+        partitioned.shutdown()
+    assert parallel == serial
+    assert serial.total_events == 300
+    # insertion order breaks timestamp ties, as (timestamp, id) does in SQL
+    ordered = sorted(events, key=lambda e: e.timestamp)
+    assert serial == summarize(ordered, ordered=True, distinct=True)
@@ -0,0 +1,88 @@
+import re
+import time
+
+from fastapi.testclient import TestClient
+
+from app import perf
+from app.main import app
+
+client = TestClient(app)
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? [0-9.e+-]+$')
+
+
+def _metric(text, name, **labels):
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    for line in text.splitlines():
+        if line.startswith(name + "{") and want in line or line.startswith(name + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_perf_endpoint_reports_requests_sql_and_analytics(api_headers):
+    assert client.get("/internal/perf").status_code == 401
+
+    r = client.post("/events/bulk", headers=api_headers, json=[
+        {"event_type": "data_upload_started", "entity_id": f"PERF-{i}", "timestamp": "2036-01-01T10:00:00Z"}
+        for i in range(7)
+    ])
+    assert r.status_code in (200, 201)
+    assert client.get("/metrics/summary", headers=api_headers).status_code == 200
+    assert client.get("/events", headers=api_headers, params={"limit": 5}).status_code == 200
+
+    r = client.get("/internal/perf", headers=api_headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = r.text
+    for line in text.splitlines():
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") or SAMPLE.match(line), line
+
+    # route templates, not raw paths
+    assert _metric(text, "http_request_duration_seconds_count", route="/metrics/summary", status="200") >= 1
+    assert _metric(text, "sql_statements_total", kind="SELECT") >= 1
+    assert _metric(text, "sql_statement_duration_seconds_count", kind="INSERT") >= 1
+    assert _metric(text, "http_request_rows_fetched_sum", route="/events") >= 5
+    assert _metric(text, "http_request_sql_statements_sum", route="/metrics/summary") >= 1
+    assert _metric(text, "analytics_function_duration_seconds_count", function="insights_from_metrics") >= 1
+    assert 'ingest_batch_events_bucket{le="10"}' in text
+    # buckets are cumulative
+    buckets = [float(l.rsplit(" ", 1)[1]) for l in text.splitlines()
+               if l.startswith('http_request_duration_seconds_bucket{method="GET",route="/metrics/summary",status="200"')]
+    assert buckets == sorted(buckets) and buckets[-1] == _metric(
+        text, "http_request_duration_seconds_count", route="/metrics/summary", status="200")
+
+
+def test_profiler_samples_one_request(monkeypatch, api_headers):
+    monkeypatch.setattr(perf, "PERF_PROFILER", True)
+    monkeypatch.setattr(perf, "PROFILE_INTERVAL_MS", 0.5)
+
+    # without the API key the header is ignored
+    assert "x-profile-id" not in client.get("/ping", headers={"X-Profile": "1"}).headers
+
+    r = client.get("/metrics/summary", headers={**api_headers, "X-Profile": "1"})
+    assert r.status_code == 200
+    pid = r.headers["x-profile-id"]
+    profile = client.get(f"/internal/perf/profiles/{pid}", headers=api_headers)
+    assert profile.status_code == 200
+    assert profile.text.startswith("# route: /metrics/summary")
+    for line in profile.text.splitlines()[1:]:
+        stack, n = line.rsplit(" ", 1)
+        assert int(n) > 0 and ";" in stack
+
+    assert client.get("/internal/perf/profiles/nope", headers=api_headers).status_code == 404
+
+
+def test_timed_is_free_when_disabled(monkeypatch):
+    monkeypatch.setattr(perf, "PERF_METRICS", False)
+
+    def f():
+        return 1
+    assert perf.timed(f) is f
+
+    monkeypatch.setattr(perf, "PERF_METRICS", True)
+    wrapped = perf.timed(f)
+    before = perf.ANALYTICS_SECONDS.count("f")
+    start = time.perf_counter()
+    assert wrapped() == 1
+    assert perf.ANALYTICS_SECONDS.count("f") == before + 1
+    assert time.perf_counter() - start < 0.01
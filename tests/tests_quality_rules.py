@@ -0,0 +1,96 @@
+import json
+import random
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import quality_rules
+from app.main import app
+from app.quality_rules import QualityRules, evaluate, load_rules, missing_required_fields, out_of_range_fields
+from app.repository import MemoryRepository, SqlRepository
+from app.schemas import AnalyticsEvent
+from app.store import EventStore
+
+
+
+def _payloads(n, seed):
+    rnd = random.Random(seed)
+    junk = [None, "abc", "12.5", " 7 ", True, {"v": 1}, [1, 2], float("nan"), float("inf"), -3]
+    out = []
+    for _ in range(n):
+        p = {}
+        for f, (lo, hi) in quality_rules.RANGES.items():
+            r = rnd.random()
+            if r < 0.1:
+                continue
+            p[f] = rnd.choice(junk) if r < 0.2 else round(rnd.uniform(lo * 0.8, hi * 1.2), 1)
+        out.append(p)
+    return out
+
+
+def _reference(payloads, rules=None):
+    out = []
+    for i, p in enumerate(payloads):
+        out += [(i, "missing_required_field", {"field": f}) for f in missing_required_fields(p, rules)]
+        out += [(i, "out_of_range_value_detected", {"field": f, "value": None if v != v else v, "min": lo, "max": hi})
+                for f, v, lo, hi in out_of_range_fields(p, rules)]
+    return out
+
+
+def test_batch_matches_per_payload_rules():
+    payloads = _payloads(3000, 1)
+    assert evaluate(payloads) == _reference(payloads)
+    # a clean numeric column takes the fast path, a mixed one the fallback
+    clean = [{"hb": 10.0, "wbc": 5, "glucose": 90}, {"hb": 30.0, "wbc": 1, "glucose": None}]
+    assert evaluate(clean) == _reference(clean)
+    assert evaluate([]) == []
+
+
+def test_rules_are_configurable(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"required": ["hb", "crp"], "ranges": {"crp": [0, 10]}}))
+    rules = load_rules(str(path))
+    assert rules == QualityRules(required=["hb", "crp"], ranges={"crp": (0.0, 10.0)})
+
+    payloads = [{"hb": 50, "crp": 12}, {"crp": "x"}, {"hb": 1, "crp": 3}]
+    assert evaluate(payloads, rules) == _reference(payloads, rules) == [
+        (0, "out_of_range_value_detected", {"field": "crp", "value": 12.0, "min": 0.0, "max": 10.0}),
+        (1, "missing_required_field", {"field": "hb"}),
+        (1, "out_of_range_value_detected", {"field": "crp", "value": None, "min": 0.0, "max": 10.0}),
+    ]
+
+
+def test_uploads_write_quality_events(monkeypatch, api_headers):
+    monkeypatch.setattr(quality_rules, "QUALITY_EVENTS_AT_INGEST", True)
+    ts = datetime(2034, 2, 1, 9, 30)
+    events = [
+        AnalyticsEvent(event_type="data_upload_started", entity_id="QR-1", timestamp=ts),
+        AnalyticsEvent(event_type="data_upload_completed", entity_id="QR-1", timestamp=ts,
+                       metadata={"hb": 25.0, "glucose": 100}),
+        AnalyticsEvent(event_type="data_upload_completed", entity_id="QR-2", timestamp=ts,
+                       metadata={"hb": 12.0, "wbc": 6.1, "glucose": 100}),
+    ]
+    expected = [
+        ("missing_required_field", {"field": "wbc"}),
+        ("out_of_range_value_detected", {"field": "hb", "value": 25.0, "min": 9.0, "max": 18.0}),
+    ]
+
+    sql, mem = SqlRepository(), MemoryRepository(EventStore())
+    try:
+        assert sql.record(events) == mem.record(events) == 5
+        for repo in (sql, mem):
+            rows, _ = repo.page(entity_id="QR-1")
+            quality = [(r["event_type"], r["metadata"]) for r in rows if r["actor_role"] == "system"]
+            assert sorted(quality, key=str) == expected
+            assert repo.page(entity_id="QR-2")[0][0]["event_type"] == "data_upload_completed"
+    finally:
+        sql.close()
+
+    client = TestClient(app)
+    r = client.post("/events", headers=api_headers, json={
+        "event_type": "data_upload_completed", "entity_id": "QR-3",
+        "timestamp": "2034-02-01T10:00:00Z", "metadata": {"hb": 12, "wbc": 2, "glucose": 90},
+    })
+    assert r.status_code == 201
+    rows = client.get("/events", headers=api_headers, params={"entity_id": "QR-3"}).json()["events"]
+    assert {r["event_type"] for r in rows} == {"data_upload_completed", "out_of_range_value_detected"}
@@ -0,0 +1,110 @@
+"""
+Run EXPLAIN QUERY PLAN on every SELECT the routers issue against the events
+table. Every access must be an index SEARCH (a SCAN, even of an index, only
+passes for LIMITed index-ordered pages) and ORDER BY must not need a sort.
+"""
+import re
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.main import app
+from app.cache import public_cache
+from app.database import engine, read_engine, SessionLocal
+from app.ingestion import record_events
+from app.schemas import AnalyticsEvent
+
+client = TestClient(app)
+
+SCAN = re.compile(r"^SCAN events\b")
+SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+REQUESTS = [
+    ("/public/metrics/summary", {}),
+    ("/dashboard", {}),
+    ("/metrics/summary", {}),
+    ("/metrics/summary", {"since": "2026-04-01T00:00:00", "until": "2026-04-02T00:00:00"}),
+    ("/metrics/summary", {"since": "2026-04-01T00:17:00", "until": "2026-04-01T19:03:00"}),
+    ("/metrics/summary", {"since": "2026-04-01T00:17:00"}),
+    ("/metrics/summary", {"until": "2026-04-01T19:03:00"}),
+    ("/metrics/timeseries", {"since": "2026-04-01T00:17:00", "until": "2026-04-01T19:03:00"}),
+    ("/metrics/timeseries", {"bucket": "day"}),
+    ("/metrics/segments", {"by": "source", "bucket": "day"}),
+    ("/metrics/segments", {"by": "actor_role", "since": "2026-04-01T00:17:00", "until": "2026-04-01T19:03:00"}),
+    ("/events", {}),
+    ("/events", {"since": "2026-04-01T00:17:00", "until": "2026-04-01T19:03:00"}),
+    ("/events", {"entity_id": "SUB-PLAN-003"}),
+    ("/events", {"event_type": "analysis_completed", "since": "2026-04-01T05:00:00"}),
+    ("/events", {"limit": 3}),
+    ("/events/export", {"entity_id": "SUB-PLAN-003"}),
+    ("/events/export", {"event_type": "analysis_completed"}),
+    ("/events/export", {"since": "2026-04-01T10:00:00", "until": "2026-04-01T11:00:00"}),
+]
+
+
+def _seed():
+    t0 = datetime(2026, 4, 1, 0, 0, 0)
+    steps = ["data_upload_started", "data_upload_completed", "analysis_completed", "clinician_review_completed"]
+    events = [
+        AnalyticsEvent(event_type=step, entity_id=f"SUB-PLAN-{i:03d}", timestamp=t0 + timedelta(minutes=7 * i + 3 * k))
+        for i in range(200)
+        for k, step in enumerate(steps)
+    ]
+    # re-uploads make a few entities take the time-to-analysis replay path
+    events += [
+        AnalyticsEvent(event_type="data_upload_completed", entity_id=f"SUB-PLAN-{i:03d}", timestamp=t0 + timedelta(minutes=7 * i + 4))
+        for i in range(0, 200, 25)
+    ]
+    db = SessionLocal()
+    try:
+        record_events(db, events)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _capture(headers):
+    seen = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            seen.append((statement, parameters))
+
+    # public routes read through their own pool
+    for eng in (engine, read_engine):
+        event.listen(eng, "before_cursor_execute", before)
+    try:
+        for path, params in REQUESTS:
+            public_cache.clear()
+            r = client.get(path, params=params, headers=headers)
+            assert r.status_code == 200, (path, params, r.text)
+            # the limit=3 page makes a cursor; follow it once
+            if path == "/events" and r.json().get("next_cursor"):
+                client.get(path, params={**params, "cursor": r.json()["next_cursor"]}, headers=headers)
+    finally:
+        for eng in (engine, read_engine):
+            event.remove(eng, "before_cursor_execute", before)
+    return seen
+
+
+def test_router_queries_use_indexes(api_headers):
+    _seed()
+    statements = _capture(api_headers)
+    events_statements = [(s, p) for s, p in statements if re.search(r"\bevents\b", s)]
+    assert events_statements
+
+    problems = []
+    with engine.connect() as conn:
+        raw = conn.connection.driver_connection
+        for statement, params in events_statements:
+            plan = [row[3] for row in raw.execute("EXPLAIN QUERY PLAN " + statement, params).fetchall()]
+            bad = [
+                line for line in plan
+                if (SCAN.search(line) and "LIMIT" not in statement)
+                or (SORT in line and "ORDER BY" in statement)
+            ]
+            if bad:
+                problems.append((statement, plan))
+
+    assert not problems, "\n\n".join(f"{s}\n  -> {p}" for s, p in problems)
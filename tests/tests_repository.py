@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database import DATABASE_URL, ReadSessionLocal, SessionLocal, make_async_engine
+from app.main import app
+from app.repository import MemoryRepository, SqlRepository, get_read_repository, get_repository, page_async
+from app.schemas import AnalyticsEvent
+from app.store import EventStore
+
+SINCE = datetime(2031, 1, 1)
+UNTIL = datetime(2031, 12, 31)
+PLUS_2 = timezone(timedelta(hours=2))
+
+
+@pytest.fixture
+def events(random_events):
+    # far from the other tests' data so the SQLite windows only see these;
+    # naive and offset timestamps mixed, both stored as wall-clock time
+    return [
+        AnalyticsEvent(event_type=e.event_type, entity_id="REPO-" + e.entity_id,
+                       timestamp=e.timestamp.replace(year=2031, tzinfo=(None, timezone.utc, PLUS_2)[i % 3]),
+                       metadata={"i": i})
+        for i, e in enumerate(random_events(300, 11))
+    ] + [
+        AnalyticsEvent(event_type="data_upload_completed", entity_id="REPO-MIXED", timestamp=datetime(2031, 1, 10, 10, tzinfo=PLUS_2)),
+        AnalyticsEvent(event_type="analysis_completed", entity_id="REPO-MIXED", timestamp=datetime(2031, 1, 10, 10, 30, tzinfo=timezone.utc)),
+    ]
+
+
+def _pages(repo, **filters):
+    out, after = [], None
+    while True:
+        rows, after = repo.page(limit=17, after=after, **filters)
+        out += [(r["event_type"], r["entity_id"], r["timestamp"].replace(tzinfo=None), r["metadata"]) for r in rows]
+        if after is None:
+            return out
+
+
+def test_sqlite_and_memory_repositories_agree(events):
+    sql, mem = SqlRepository(), MemoryRepository(EventStore())
+    try:
+        assert sql.record(events) == mem.record(events) == len(events)
+
+        mixed = (datetime(2031, 1, 10, 9), datetime(2031, 1, 10, 12, 17, tzinfo=PLUS_2))
+        for window in [(SINCE, UNTIL), (SINCE + timedelta(hours=3, minutes=5), SINCE + timedelta(hours=11)), mixed]:
+            assert sql.summary(*window) == mem.summary(*window)
+            assert sql.entity_funnel(*window) == mem.entity_funnel(*window)
+            assert sql.timeseries("hour", *window) == mem.timeseries("hour", *window)
+
+        # the offset is dropped, not converted: upload 10:00+02:00 -> analysis 10:30Z is 30 minutes
+        assert mem.summary(*mixed).time_to_analysis_minutes == sql.summary(*mixed).time_to_analysis_minutes
+        assert _pages(sql, entity_id="REPO-MIXED", since=mixed[0]) == _pages(mem, entity_id="REPO-MIXED", since=mixed[0])
+        assert len(_pages(mem, entity_id="REPO-MIXED", since=mixed[0])) == 2
+
+        filters = dict(since=SINCE, until=UNTIL)
+        # same timestamps tie in both, broken by insertion order
+        assert _pages(sql, **filters) == _pages(mem, **filters)
+        assert _pages(sql, entity_id="REPO-SUB-004") == _pages(mem, entity_id="REPO-SUB-004")
+        assert list(sql.export(**filters)) == list(mem.export(**filters))
+    finally:
+        sql.close()
+
+
+def test_async_pages_match_sync_pages(events, api_headers):
+    sessions = async_sessionmaker(make_async_engine("sqlite+aiosqlite:" + DATABASE_URL.split(":", 1)[1], read_only=True))
+    events = [e.model_copy(update={"timestamp": e.timestamp.replace(year=2032)}) for e in events]
+    sql = SqlRepository()
+    try:
+        sql.record(events)
+        filters = dict(since=datetime(2032, 1, 1), until=datetime(2032, 12, 31))
+
+        async def pages():
+            out, after = [], None
+            async with sessions() as db:
+                while True:
+                    rows, after = await page_async(sql, db, limit=17, after=after, **filters)
+                    out += [(r["event_type"], r["entity_id"], r["timestamp"].replace(tzinfo=None), r["metadata"])
+                            for r in rows]
+                    if after is None:
+                        return out
+
+        assert asyncio.run(pages()) == _pages(sql, **filters)
+
+        client = TestClient(app)
+        r = client.get("/events", params={"since": "2032-01-01T00:00:00", "until": "2032-12-31T00:00:00", "limit": 5}, headers=api_headers)
+        assert [e["entity_id"] for e in r.json()["events"]] == [e[1] for e in _pages(sql, **filters)[:5]]
+    finally:
+        sql.close()
+
+
+def test_sqlite_profile_and_read_only_pool():
+    db = SessionLocal()
+    try:
+        assert db.execute(text("PRAGMA journal_mode")).scalar().lower() == "wal"
+        assert db.execute(text("PRAGMA busy_timeout")).scalar() > 0
+    finally:
+        db.close()
+
+    ro = ReadSessionLocal()
+    try:
+        with pytest.raises(OperationalError):
+            ro.execute(text("DELETE FROM events WHERE 0"))
+    finally:
+        ro.close()
+
+
+def test_routes_run_on_memory_backend(api_headers):
+    mem = MemoryRepository(EventStore())
+    app.dependency_overrides[get_repository] = lambda: mem
+    app.dependency_overrides[get_read_repository] = lambda: mem
+    try:
+        client = TestClient(app)
+        r = client.post("/events/bulk", json=[
+            {"event_type": "data_upload_started", "entity_id": "MEM-1", "timestamp": "2026-03-01T10:00:00Z"},
+            {"event_type": "data_upload_completed", "entity_id": "MEM-1", "timestamp": "2026-03-01T10:02:00Z"},
+        ], headers=api_headers)
+        assert r.status_code == 201
+        assert client.get("/metrics/summary", headers=api_headers).json()["counts"]["total_events"] == 2
+        assert client.get("/events", params={"limit": 1}, headers=api_headers).json()["next_cursor"]
+    finally:
+        app.dependency_overrides.clear()
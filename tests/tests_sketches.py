@@ -0,0 +1,96 @@
+import random
+from datetime import datetime, timedelta
+
+from app import aggregations, analytics, progress, sketches
+from app.analytics import summarize
+from app.repository import MemoryRepository, SqlRepository
+from app.schemas import AnalyticsEvent
+from app.sketches import ALPHA, QUANTILES, DDSketch, DeltaStats, DistinctCounter, HyperLogLog, exact_quantile
+from app.store import EventStore
+
+
+def test_ddsketch_quantiles_within_relative_error():
+    rnd = random.Random(3)
+    # minutes to hours, in microseconds, plus a few zeros
+    values = [int(rnd.lognormvariate(19, 1.5)) for _ in range(50_000)] + [0] * 50
+    sketch, halves = DDSketch(), (DDSketch(), DDSketch())
+    for i, v in enumerate(values):
+        sketch.add(v)
+        halves[i % 2].add(v)
+    halves[0].merge(halves[1])
+
+    ordered = sorted(values)
+    for q in [0.0, 0.5, 0.9, 0.99, 1.0]:
+        exact = exact_quantile(ordered, q)
+        assert abs(sketch.quantile(q) - exact) <= ALPHA * exact
+        assert halves[0].quantile(q) == sketch.quantile(q)
+
+
+def test_hyperloglog_error_bound():
+    hll, parts = HyperLogLog(), (HyperLogLog(), HyperLogLog())
+    n = 50_000
+    for i in range(n):
+        hll.add(f"SUB-{i:07d}")
+        parts[i % 2].add(f"SUB-{i:07d}")
+        parts[(i + 1) % 2].add(f"SUB-{i // 2:07d}")  # overlap between the parts
+    parts[0].merge(parts[1])
+    # standard error is 1.04 / sqrt(2**14) ~ 0.8%
+    assert abs(hll.count() - n) / n < 0.03
+    assert parts[0].count() == hll.count()
+
+
+def test_exact_below_threshold(random_events):
+    stats = DeltaStats(exact=True).extend([5, 1, 3, 2, 4])
+    assert stats.quantiles() == {"p50": 3, "p90": 4, "p99": 4}
+
+    counter = DistinctCounter(["a"], exact_max=10)
+    for i in range(10):
+        counter.add("a", str(i % 4))
+    assert not counter.approximate and counter.counts() == {"a": 4}
+    counter.add("a", "x")
+    assert counter.approximate and counter.counts() == {"a": 5}
+
+    s = summarize(random_events(300, 5), distinct=True)
+    assert s.time_to_analysis_minutes["approximate"] is False
+    assert s.as_dict()["distinct_entities"]["approximate"] is False
+    assert set(QUANTILES) <= set(s.time_to_analysis_minutes)
+
+
+def _events():
+    rnd = random.Random(9)
+    t0 = datetime(2032, 3, 1)
+    out = []
+    for i in range(400):
+        start = t0 + timedelta(minutes=7 * i)
+        done = start + timedelta(minutes=rnd.randint(1, 5))
+        out += [
+            AnalyticsEvent(event_type="data_upload_started", entity_id=f"SK-{i:04d}", timestamp=start),
+            AnalyticsEvent(event_type="data_upload_completed", entity_id=f"SK-{i:04d}", timestamp=done),
+            AnalyticsEvent(event_type="analysis_completed", entity_id=f"SK-{i:04d}",
+                           timestamp=done + timedelta(seconds=rnd.randint(30, 3600))),
+        ]
+    return out
+
+
+def test_sql_and_python_sketches_agree(monkeypatch):
+    events = _events()
+    window = (datetime(2032, 3, 1), datetime(2032, 3, 31))
+    sql, mem = SqlRepository(), MemoryRepository(EventStore())
+    try:
+        sql.record(events)
+        mem.record(events)
+        # exact, then forced onto the sketches
+        for exact_max in [100_000, 50]:
+            for module in (sketches, analytics, progress, aggregations):
+                monkeypatch.setattr(module, "SKETCH_EXACT_MAX", exact_max)
+            a, b = sql.summary(*window, distinct=True), mem.summary(*window, distinct=True)
+            assert a == b
+            assert a == summarize(events, distinct=True)
+            assert sql.timeseries("day", *window) == mem.timeseries("day", *window)
+
+            tta, entities = a.time_to_analysis_minutes, a.distinct_entities
+            assert tta["approximate"] is entities["approximate"] is (exact_max == 50)
+            assert tta["count"] == 400
+            assert abs(entities["counts"]["data_upload_started"] - 400) <= 12
+    finally:
+        sql.close()
@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import snapshots
+from app.main import app
+from app.repository import open_repository
+
+client = TestClient(app)
+
+
+def _post(n, tag, headers):
+    now = datetime.now(timezone.utc)
+    r = client.post("/events/bulk", headers=headers, json=[
+        {"event_type": "data_upload_started", "entity_id": f"SNAP-{tag}-{i}", "timestamp": now.isoformat()}
+        for i in range(n)
+    ])
+    assert r.status_code == 201
+
+
+def test_parse_windows():
+    assert snapshots.parse_windows("all, 24h,7d") == {"all": None, "24h": timedelta(hours=24), "7d": timedelta(days=7)}
+    with pytest.raises(ValueError):
+        snapshots.parse_windows("all,week")
+
+
+def test_routes_answer_from_the_latest_snapshot(monkeypatch, api_headers):
+    sched = snapshots.SnapshotScheduler(windows="all,24h", interval=3600, every_events=5)
+    monkeypatch.setattr(snapshots, "scheduler", sched)
+
+    # nothing computed yet: live, as before
+    assert "snapshot" not in client.get("/metrics/summary", headers=api_headers).json()
+
+    _post(2, "a", api_headers)
+    sched.refresh()
+    r = client.get("/metrics/summary", headers=api_headers)
+    body = r.json()
+    assert body["snapshot"]["version"] == 1 and r.headers["x-snapshot-version"] == "1"
+    assert int(r.headers["age"]) >= 0
+    repo = open_repository(read_only=True)
+    try:
+        assert {k: v for k, v in body.items() if k not in ("window", "snapshot", "entity_funnel")} == \
+            repo.summary().as_dict()
+        assert body["entity_funnel"] == repo.entity_funnel()
+    finally:
+        repo.close()
+    assert client.get("/metrics/summary", headers={**api_headers, "If-None-Match": r.headers["etag"]}).status_code == 304
+    # another worker (or a restart) also numbers from 1: its version-1 ETag must not match
+    monkeypatch.setattr(snapshots, "_PROCESS_TOKEN", "other")
+    assert client.get("/metrics/summary", headers={**api_headers, "If-None-Match": r.headers["etag"]}).status_code == 200
+
+    # below SNAPSHOT_EVERY_EVENTS the snapshot is served as is, stale but labelled
+    _post(3, "b", api_headers)
+    assert client.get("/metrics/summary", headers=api_headers).json()["counts"] == body["counts"]
+    assert sched.stats()["pending_events"] == 3
+    # since/until and distinct still compute live
+    live = client.get("/metrics/summary", headers=api_headers, params={"distinct": True}).json()
+    assert live["counts"]["total_events"] == body["counts"]["total_events"] + 3
+
+    sched.start()
+    deadline = time.time() + 10
+    try:
+        while sched.latest.version < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        _post(5, "c", api_headers)
+        while (sched.latest.version < 3 or sched.pending_events) and time.time() < deadline:
+            time.sleep(0.05)
+        # one refresh at start, one for crossing every_events
+        assert sched.latest.version >= 3 and sched.stats()["running"]
+    finally:
+        sched.stop()
+    fresh = client.get("/metrics/summary", headers=api_headers).json()
+    assert fresh["counts"]["total_events"] == body["counts"]["total_events"] + 8
+
+    day = client.get("/public/metrics/summary", params={"window": "24h"}).json()
+    assert day["window"] == "24h" and day["snapshot"]["version"] == sched.latest.version
+    assert day["funnel"]["data_upload_started"] >= 10
+    assert client.get("/public/metrics/summary", params={"window": "90d"}).status_code == 400
+    assert f"Snapshot {sched.latest.version}," in client.get("/dashboard").text
+
+    assert client.get("/metrics/summary", headers=api_headers,
+                      params={"window": "24h", "since": "2026-01-01T00:00:00"}).status_code == 400
+    assert client.get("/metrics/snapshots", headers=api_headers).json()["windows"] == ["all", "24h"]
+
+
+def test_live_fallback_for_windows(monkeypatch, api_headers):
+    monkeypatch.setattr(snapshots, "scheduler", snapshots.SnapshotScheduler(windows="all,7d"))
+    r = client.get("/metrics/summary", headers=api_headers, params={"window": "7d"})
+    assert r.status_code == 200 and "snapshot" not in r.json() and r.json()["window"]["since"]
+    assert client.get("/metrics/summary", headers=api_headers, params={"window": "2h"}).status_code == 400
@@ -0,0 +1,62 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.analytics import summarize
+from app.store import EventStore
+
+
+def _naive_filter(events, since=None, until=None, entity_id=None, event_type=None):
+    # what the old list-scan store returned, put in (stable) time order
+    out = [
+        e for e in events
+        if (since is None or e.timestamp >= since)
+        and (until is None or e.timestamp <= until)
+        and (entity_id is None or e.entity_id == entity_id)
+        and (event_type is None or e.event_type == event_type)
+    ]
+    return sorted(out, key=lambda e: e.timestamp)
+
+
+def _view(events):
+    return [(e.event_type, e.entity_id, e.timestamp) for e in events]
+
+
+def test_store_queries_match_list_scan(random_events):
+    t0 = datetime(2026, 1, 10, 8, 0, 0)
+    for seed in range(10):
+        events = random_events(400, seed)
+        store = EventStore(events)
+        rnd = random.Random(seed)
+        for _ in range(20):
+            since = t0 + timedelta(minutes=5 * rnd.randint(0, 200)) if rnd.random() < 0.7 else None
+            until = t0 + timedelta(minutes=5 * rnd.randint(0, 200)) if rnd.random() < 0.7 else None
+            entity_id = f"SUB-{rnd.randint(1, 30):03d}" if rnd.random() < 0.3 else None
+            event_type = rnd.choice([None, "analysis_completed", "missing_required_field"])
+
+            got = store.list_events(since, until, entity_id, event_type)
+            assert _view(got) == _view(_naive_filter(events, since, until, entity_id, event_type))
+
+            if entity_id is None and event_type is None:
+                expected = summarize(_naive_filter(events, since, until))
+                s = store.summary(since, until)
+                assert s == expected
+                assert list(s.quality_issues) == list(expected.quality_issues)
+
+
+def test_store_prune_evicts_only_old_events(random_events):
+    events = random_events(500, 3)
+    store = EventStore(events)
+    cutoff = datetime(2026, 1, 10, 16, 0, 0)
+    old = sum(1 for e in events if e.timestamp < cutoff)
+
+    assert store.prune_before(cutoff) == old
+    assert store.prune_before(cutoff) == 0
+    remaining = [e for e in events if e.timestamp >= cutoff]
+    assert len(store) == len(remaining)
+    assert _view(store.list_events()) == _view(_naive_filter(remaining))
+    assert _view(store.list_events(entity_id="SUB-007")) == _view(_naive_filter(remaining, entity_id="SUB-007"))
+    assert store.summary() == summarize(_naive_filter(remaining))
+
+    # aware and naive timestamps share one timeline (naive = UTC)
+    store.prune_older_than(1, now=datetime(2026, 1, 11, 18, 0, tzinfo=timezone.utc))
+    assert all(e.timestamp >= datetime(2026, 1, 10, 18, 0) for e in store)